@@ -0,0 +1,303 @@
+#############################################################################
+# Script Name: acq_instrument.py
+
+# Optional instrumentation of the data collection loop.
+
+# Shows where the time of each sample goes: I2C bus transactions, the
+# driver's conversion of the raw bits, formatting the CSV line, and file
+# I/O. install() wraps mpu9250_i2c.mpu6050_conv and read_profile (either
+# starts a sample), read_raw_bits and read_burst, the I2C bus object and the
+# collector's format_sample/write_line functions.
+# Every timing goes into a fixed-size, HDR-style histogram (power of two
+# buckets, each split into 16 linear sub-buckets, so about 6% resolution),
+# which costs the same to update after ten samples or ten million and never
+# grows. The number of I2C transactions of every sample is counted too.
+
+# Usage from a collector:
+#     inst = Instrument()
+#     inst.install(mpu9250_i2c, writer=sys.modules[__name__])
+#     ... collect ...
+#     inst.report('acquisition_profile.json')
+#############################################################################
+
+import json,time,functools
+
+
+class LatencyHistogram:
+
+    # Histogram of non-negative integers (nanoseconds, or counts) with
+    # HDR-style log-linear buckets: values below 2**SUB_BITS are exact, and
+    # every larger power of two range is split into 2**SUB_BITS equal
+    # buckets. Recording a value is a few integer operations.
+
+    SUB_BITS = 4
+    SUB = 1 << SUB_BITS
+
+    def __init__(self):
+
+        self.counts = [0] * (64 << self.SUB_BITS)
+        self.n = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+
+        value = int(value)
+        if value < self.SUB:
+            index = value
+        else:
+            shift = value.bit_length() - self.SUB_BITS - 1
+            index = ((shift + 1) << self.SUB_BITS) + (value >> shift) - self.SUB
+        self.counts[index] += 1
+        self.n += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def bucket_value(self, index):
+
+        # Representative (middle) value of a bucket.
+
+        if index < self.SUB:
+            return index
+        shift = (index >> self.SUB_BITS) - 1
+        low = ((index & (self.SUB - 1)) + self.SUB) << shift
+
+        return low + ((1 << shift) - 1) / 2
+
+    def percentile(self, p):
+
+        # Value below which p percent of the recorded values fall.
+
+        if self.n == 0:
+            return 0
+        target = p / 100 * self.n
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(self.bucket_value(index), self.max)
+
+        return self.max
+
+    def summary(self, scale=1.0):
+
+        # Count, mean, min, percentiles and max, divided by scale
+        # (e.g. scale=1000 to report nanoseconds as microseconds).
+
+        if self.n == 0:
+            return {'count': 0}
+
+        return {'count': self.n,
+                'mean': self.total / self.n / scale,
+                'min': self.min / scale,
+                'p50': self.percentile(50) / scale,
+                'p90': self.percentile(90) / scale,
+                'p99': self.percentile(99) / scale,
+                'p99.9': self.percentile(99.9) / scale,
+                'max': self.max / scale}
+
+
+class CountingBus:
+
+    # Stand-in for the smbus.SMBus object that counts every bus transaction
+    # and adds its duration to the instrument's bus time.
+
+    def __init__(self, bus, instrument):
+
+        self._bus = bus
+        self._instrument = instrument
+
+    def __getattr__(self, name):
+
+        method = getattr(self._bus, name)
+        if not callable(method) or not (name.startswith('read') or name.startswith('write')):
+            return method
+
+        instrument = self._instrument
+
+        @functools.wraps(method)
+        def transaction(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                instrument.bus_ns += time.perf_counter_ns() - start
+                instrument.bus_transactions += 1
+
+        setattr(self, name, transaction)    # later lookups skip __getattr__
+
+        return transaction
+
+
+class Instrument:
+
+    # Per-sample latency breakdown of the collection loop.
+    #     sample     : start of mpu6050_conv (or read_profile) to the end of
+    #                  the sample's last write_line (or of the read, if it is
+    #                  not written)
+    #     period     : start of one sample to the start of the next
+    #     bus        : time spent in I2C transactions
+    #     conversion : rest of the read (bit combining, float conversion)
+    #     register   : one read_raw_bits call (two bus reads and combining)
+    #                  or read_burst call (one bus read and unpacking)
+    #     format     : building the CSV line
+    #     io         : opening, writing and closing the CSV file
+    # and the number of I2C transactions per sample.
+
+    STAGES = ('sample', 'period', 'bus', 'conversion', 'register', 'format', 'io')
+
+    def __init__(self):
+
+        self.hist = {name: LatencyHistogram() for name in self.STAGES}
+        self.transactions = LatencyHistogram()    # small counts are recorded exactly
+        self.bus_ns = 0    # running totals updated by CountingBus
+        self.bus_transactions = 0
+        self.stage_ns = dict.fromkeys(self.STAGES, 0)
+        self._sample_start = None
+        self._sample_end = None    # end of the current sample's last step so far
+        self._patched = []
+        self._started = time.perf_counter_ns()
+
+    def _patch(self, module, name, replacement):
+
+        self._patched.append((module, name, getattr(module, name)))
+        setattr(module, name, replacement)
+
+    def _record(self, stage, elapsed):
+
+        self.hist[stage].record(elapsed)
+        self.stage_ns[stage] += elapsed
+
+    def install(self, driver, writer=None):
+
+        # Instrument the mpu9250_i2c module `driver` and, if given, the
+        # collector module `writer` (its format_sample and write_line).
+
+        self._patch(driver, 'bus', CountingBus(driver.bus, self))
+
+        for name in ('read_raw_bits', 'read_burst'):
+            if hasattr(driver, name):
+                self._patch(driver, name, self._timed_register(getattr(driver, name)))
+
+        for name in ('mpu6050_conv', 'read_profile'):
+            if hasattr(driver, name):
+                self._patch(driver, name, self._timed_sample(getattr(driver, name)))
+
+        if writer is not None:
+            format_sample = writer.format_sample
+            @functools.wraps(format_sample)
+            def timed_format(*args, **kwargs):
+                start = time.perf_counter_ns()
+                line = format_sample(*args, **kwargs)
+                self._record('format', time.perf_counter_ns() - start)
+                return line
+            self._patch(writer, 'format_sample', timed_format)
+
+            write_line = writer.write_line
+            @functools.wraps(write_line)
+            def timed_write(*args, **kwargs):
+                start = time.perf_counter_ns()
+                write_line(*args, **kwargs)
+                end = time.perf_counter_ns()
+                self._record('io', end - start)
+                if self._sample_end is not None:
+                    self._sample_end = end    # a sample may be written to several files
+            self._patch(writer, 'write_line', timed_write)
+
+        return self
+
+    def _timed_register(self, read):
+
+        # Wrap a driver function that reads registers.
+
+        @functools.wraps(read)
+        def timed_read(*args, **kwargs):
+            start = time.perf_counter_ns()
+            value = read(*args, **kwargs)
+            self._record('register', time.perf_counter_ns() - start)
+            return value
+
+        return timed_read
+
+    def _timed_sample(self, read):
+
+        # Wrap a driver function that reads one sample.
+
+        @functools.wraps(read)
+        def timed_read(*args, **kwargs):
+            start = time.perf_counter_ns()
+            if self._sample_start is not None:
+                self._record('period', start - self._sample_start)
+            self._flush_sample()
+            self._sample_start = start
+            bus_ns, transactions = self.bus_ns, self.bus_transactions
+            values = read(*args, **kwargs)
+            elapsed = time.perf_counter_ns() - start
+            bus = self.bus_ns - bus_ns
+            self._record('bus', bus)
+            self._record('conversion', elapsed - bus)
+            self.transactions.record(self.bus_transactions - transactions)
+            self._sample_end = start + elapsed
+            return values
+
+        return timed_read
+
+    def _flush_sample(self):
+
+        # Record the time of the current sample, once all of its lines
+        # have been written (at the next sample or at the summary).
+
+        if self._sample_end is not None:
+            self._record('sample', self._sample_end - self._sample_start)
+            self._sample_end = None
+
+    def uninstall(self):
+
+        # Put back the original functions and bus object.
+
+        for module, name, original in reversed(self._patched):
+            setattr(module, name, original)
+        self._patched = []
+
+    def summary(self):
+
+        # Summary of the run: latency statistics of each stage in
+        # microseconds, I2C transactions per sample, and each stage's share
+        # of the time spent reading and writing samples.
+
+        self._flush_sample()
+        wall = (time.perf_counter_ns() - self._started) / 1e9
+        samples = self.transactions.n
+        parts = ('bus', 'conversion', 'format', 'io')
+        parts_ns = max(sum(self.stage_ns[name] for name in parts), 1)
+
+        return {'samples': samples,
+                'wall_s': wall,
+                'sample_rate_hz': samples / wall if wall > 0 else 0,
+                'latency_us': {name: self.hist[name].summary(scale=1000) for name in self.STAGES},
+                'i2c_transactions_per_sample': self.transactions.summary(),
+                'share_of_sample_time': {name: self.stage_ns[name] / parts_ns for name in parts}}
+
+    def report(self, FILENAME=None):
+
+        # Print the summary and optionally save it as JSON.
+
+        summary = self.summary()
+        print(f"Acquisition profile: {summary['samples']} samples, {summary['sample_rate_hz']:.1f} Hz,",
+              f"{summary['i2c_transactions_per_sample'].get('mean', 0):.1f} I2C transactions per sample")
+        print(f"  {'stage':<11}{'mean':>9}{'p50':>9}{'p99':>9}{'max':>10}  (us)   share")
+        for name in self.STAGES:
+            stats = summary['latency_us'][name]
+            if stats['count']:
+                share = summary['share_of_sample_time'].get(name)
+                print(f"  {name:<11}{stats['mean']:9.1f}{stats['p50']:9.1f}{stats['p99']:9.1f}{stats['max']:10.1f}",
+                      f"        {share:6.1%}" if share is not None else '')
+        if FILENAME is not None:
+            with open(FILENAME, 'w') as file:
+                json.dump(summary, file, indent=2)
+
+        return summary
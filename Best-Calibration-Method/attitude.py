@@ -0,0 +1,201 @@
+#############################################################################
+# Script Name: attitude.py
+
+# Gyro-aided attitude estimation and rotation to the world frame.
+
+# mpu6050_conv() returns the gyro rates with the acceleration, but the
+# calibration scripts only use the acceleration, so displacement is only
+# right for a sensor that never rotates. AttitudeFilter tracks the sensor's
+# orientation with a complementary (Mahony) filter: the gyro rates are
+# integrated into a quaternion, and the drift of that integration is
+# corrected towards the direction of gravity measured by the accelerometer
+# (only while the acceleration is close to 1 g, i.e. the sensor is not
+# accelerating hard) and, optionally, towards the magnetic field for the
+# heading. kp sets how fast the correction acts, ki removes a constant gyro
+# bias.
+
+# Each block's acceleration is then rotated into the world frame (z up)
+# with one batched matrix product, gravity is removed from world z, and the
+# result can be integrated as in calib_pipeline.integrate. The per-sample
+# filter step works on plain floats, where NumPy's call overhead on
+# 4-element arrays would cost more than the arithmetic, and runs at a few
+# hundred thousand samples per second.
+
+# Units: acceleration in g, gyro rates in deg/s (as mpu6050_conv returns
+# them), magnetic field in any unit (only its direction is used).
+
+# Usage:
+#     att = AttitudeFilter(kp=1.0)
+#     for times, accels, gyros in blocks:
+#         world = att.process(times, accels, gyros)    # (n, 3) m/s/s, gravity removed
+#     python attitude.py RECORDING_CSV    # columns: time, ax, ay, az, wx, wy, wz[, mx, my, mz]
+#############################################################################
+
+import math,time,argparse
+import numpy as np
+
+
+GRAVITY = 9.797    # m/s/s
+
+
+def quat_from_accel(accel, mag=None):
+
+    # Orientation (w, x, y, z) of a static sensor from the direction of
+    # gravity (roll and pitch) and, if given, of the magnetic field (yaw;
+    # otherwise 0).
+
+    ax, ay, az = accel
+    roll = math.atan2(ay, az)
+    pitch = math.atan2(-ax, math.sqrt(ay*ay + az*az))
+    yaw = 0.0
+    if mag is not None:
+        mx, my, mz = mag
+        cr, sr, cp, sp = math.cos(roll), math.sin(roll), math.cos(pitch), math.sin(pitch)
+        yaw = math.atan2(-(my*cr - mz*sr), mx*cp + my*sr*sp + mz*cr*sp)    # tilt-compensated heading
+
+    cr, sr = math.cos(roll/2), math.sin(roll/2)
+    cp, sp = math.cos(pitch/2), math.sin(pitch/2)
+    cy, sy = math.cos(yaw/2), math.sin(yaw/2)
+
+    return (cr*cp*cy + sr*sp*sy, sr*cp*cy - cr*sp*sy, cr*sp*cy + sr*cp*sy, cr*cp*sy - sr*sp*cy)
+
+
+def rotation_matrices(quats):
+
+    # (n, 3, 3) body-to-world rotation matrices of (n, 4) quaternions.
+
+    w, x, y, z = np.asarray(quats, dtype=float).T
+    R = np.empty((len(w), 3, 3))
+    R[:, 0, 0] = 1 - 2*(y*y + z*z)
+    R[:, 0, 1] = 2*(x*y - w*z)
+    R[:, 0, 2] = 2*(x*z + w*y)
+    R[:, 1, 0] = 2*(x*y + w*z)
+    R[:, 1, 1] = 1 - 2*(x*x + z*z)
+    R[:, 1, 2] = 2*(y*z - w*x)
+    R[:, 2, 0] = 2*(x*z - w*y)
+    R[:, 2, 1] = 2*(y*z + w*x)
+    R[:, 2, 2] = 1 - 2*(x*x + y*y)
+
+    return R
+
+
+def to_world(quats, vectors):
+
+    # Rotate (n, 3) body-frame vectors into the world frame.
+
+    return np.einsum('nij,nj->ni', rotation_matrices(quats), vectors)
+
+
+class AttitudeFilter:
+
+    def __init__(self, kp=1.0, ki=0.0, accel_gate=0.1, use_mag=True):
+
+        # kp: gain (1/s) of the correction towards gravity and the field
+        # ki: integral gain, for a constant gyro bias
+        # accel_gate: largest deviation of |acceleration| from 1 g (g) for
+        #     which the accelerometer is trusted as a gravity reference
+        # use_mag: correct the heading when magnetometer data is given
+
+        self.kp = kp
+        self.ki = ki
+        self.accel_gate = accel_gate
+        self.use_mag = use_mag
+        self.q = None                          # (w, x, y, z), body to world
+        self.integral = [0.0, 0.0, 0.0]        # integral of the error (rad/s)
+        self._last_time = None
+
+    def update(self, times, accels, gyros, mags=None):
+
+        # Run the filter over a block. Returns the (n, 4) orientation at
+        # every sample.
+
+        times, accels = np.asarray(times, dtype=float), np.asarray(accels, dtype=float)
+        gyros = np.radians(np.asarray(gyros, dtype=float))
+        use_mag = mags is not None and self.use_mag
+        if self.q is None:
+            self.q = quat_from_accel(accels[0], mags[0] if use_mag else None)
+            self._last_time = times[0]
+
+        dts = np.diff(np.concatenate(([self._last_time], times))).tolist()
+        mags = np.asarray(mags, dtype=float).tolist() if use_mag else [None] * len(times)
+        kp, ki, gate = self.kp, self.ki, self.accel_gate
+        qw, qx, qy, qz = self.q
+        ix, iy, iz = self.integral
+        quats = []
+        for dt, (ax, ay, az), (gx, gy, gz), mag in zip(dts, accels.tolist(), gyros.tolist(), mags):
+            ex = ey = ez = 0.0
+            norm = math.sqrt(ax*ax + ay*ay + az*az)
+            if abs(norm - 1.0) < gate:
+                ax, ay, az = ax/norm, ay/norm, az/norm
+                vx = 2*(qx*qz - qw*qy)                 # gravity direction the orientation predicts
+                vy = 2*(qw*qx + qy*qz)
+                vz = qw*qw - qx*qx - qy*qy + qz*qz
+                ex, ey, ez = ay*vz - az*vy, az*vx - ax*vz, ax*vy - ay*vx
+            if mag is not None:
+                mx, my, mz = mag
+                norm = math.sqrt(mx*mx + my*my + mz*mz)
+                if norm > 0:
+                    mx, my, mz = mx/norm, my/norm, mz/norm
+                    hx = 2*(mx*(0.5 - qy*qy - qz*qz) + my*(qx*qy - qw*qz) + mz*(qx*qz + qw*qy))    # field in the world frame
+                    hy = 2*(mx*(qx*qy + qw*qz) + my*(0.5 - qx*qx - qz*qz) + mz*(qy*qz - qw*qx))
+                    bx, bz = math.sqrt(hx*hx + hy*hy), 2*(mx*(qx*qz - qw*qy) + my*(qy*qz + qw*qx) + mz*(0.5 - qx*qx - qy*qy))
+                    wx = 2*(bx*(0.5 - qy*qy - qz*qz) + bz*(qx*qz - qw*qy))                          # and back, heading only
+                    wy = 2*(bx*(qx*qy - qw*qz) + bz*(qw*qx + qy*qz))
+                    wz = 2*(bx*(qw*qy + qx*qz) + bz*(0.5 - qx*qx - qy*qy))
+                    ex, ey, ez = ex + my*wz - mz*wy, ey + mz*wx - mx*wz, ez + mx*wy - my*wx
+            if ki:
+                ix, iy, iz = ix + ki*ex*dt, iy + ki*ey*dt, iz + ki*ez*dt
+            gx, gy, gz = gx + kp*ex + ix, gy + kp*ey + iy, gz + kp*ez + iz
+
+            # q += 1/2 q * (0, w) dt
+            h = 0.5 * dt
+            qw, qx, qy, qz = (qw - h*(qx*gx + qy*gy + qz*gz), qx + h*(qw*gx + qy*gz - qz*gy),
+                              qy + h*(qw*gy - qx*gz + qz*gx), qz + h*(qw*gz + qx*gy - qy*gx))
+            norm = math.sqrt(qw*qw + qx*qx + qy*qy + qz*qz)
+            qw, qx, qy, qz = qw/norm, qx/norm, qy/norm, qz/norm
+            quats.append((qw, qx, qy, qz))
+
+        self.q = (qw, qx, qy, qz)
+        self.integral = [ix, iy, iz]
+        self._last_time = times[-1]
+
+        return np.array(quats)
+
+    def process(self, times, accels, gyros, mags=None):
+
+        # Orientation of a block, then its acceleration rotated into the
+        # world frame, in m/s/s with gravity removed. Returns (n, 3).
+
+        world = to_world(self.update(times, accels, gyros, mags), accels) * GRAVITY
+        world[:, 2] -= GRAVITY
+
+        return world
+
+
+
+if __name__ == '__main__':
+
+    from calib_pipeline import integrate
+
+    parser = argparse.ArgumentParser(description="Rotate a recording's acceleration into the world frame and integrate it.")
+    parser.add_argument('recording_csv', help="CSV (2 header lines): time, ax, ay, az (g), wx, wy, wz (deg/s)[, mx, my, mz]")
+    parser.add_argument('--kp', type=float, default=1.0, help="correction gain (1/s)")
+    parser.add_argument('--ki', type=float, default=0.0, help="integral gain, for a constant gyro bias")
+    parser.add_argument('--block', type=int, default=1000, help="samples per block")
+    args = parser.parse_args()
+
+    data = np.loadtxt(args.recording_csv, skiprows = 2, delimiter=",", dtype=float, ndmin=2)
+    times, accels, gyros = data[:, 0], data[:, 1:4], data[:, 4:7]
+    mags = data[:, 7:10] if data.shape[1] >= 10 else None
+
+    att = AttitudeFilter(kp=args.kp, ki=args.ki)
+    start = time.perf_counter()
+    world = np.concatenate([att.process(times[ii:ii+args.block], accels[ii:ii+args.block], gyros[ii:ii+args.block],
+                                        None if mags is None else mags[ii:ii+args.block])
+                            for ii in range(0, len(times), args.block)])
+    elapsed = time.perf_counter() - start
+
+    displacement = integrate(times, world)
+    print(f"{len(times)} samples in {elapsed*1e3:.1f} ms: {len(times)/elapsed:.0f} samples/s")
+    print("Final orientation (w, x, y, z):", np.round(att.q, 4))
+    print(f"World Frame Final Displacement: {displacement[-1, 0]:0.3f}, {displacement[-1, 1]:0.3f}, {displacement[-1, 2]:0.3f}")
@@ -0,0 +1,406 @@
+#############################################################################
+# Script Name: benchmark.py
+
+# Benchmark of the calibration pipeline, stage by stage.
+
+# Runs the stages of the two-level calibration with the calib_pipeline.py
+# functions that two_levels_calib.py also calibrates with (load, fit
+# accelerometer models, calibrate, integrate, fit drift model, correct
+# drift) and of
+# Six-Position-Test/integrate.py (load, calibrate with models 1-3, integrate)
+# on the checked-in CSV files, and the calib_pipeline.py stages again on
+# synthetic recordings of 1, 15 and 24 hours. For every stage the wall time,
+# peak RSS and throughput (samples per second) are recorded and the results
+# are saved as JSON so runs can be compared.
+
+# Stages that scale badly are caught two ways: each stage's scaling exponent
+# is measured on two short prefixes of the data (1.0 = linear, 2.0 = O(N^2)),
+# and a stage whose projected time exceeds --max-stage-seconds is skipped
+# rather than run for hours. The projection is approximate: it scales the
+# measured time of the same stage (e.g. 'calibrate (model 3)' of the fit
+# recording, for the test recording) when there is one, and otherwise the
+# time of the largest prefix, so a stage may still run over the budget.
+
+# The startup time of the collectors and analysis modules (their module-level
+# imports, in a fresh interpreter) is measured too, along with any of
+# matplotlib.pyplot, scipy.optimize and scipy.integrate they load: those are
+# imported only when first used, so collection starts right away.
+
+# Usage:
+#     python benchmark.py                          # all datasets, results to benchmark.json
+#     python benchmark.py --hours 1 --output new.json --compare benchmark.json
+#############################################################################
+
+import os,sys,gc,ast,time,json,argparse,platform,resource,subprocess
+import importlib.util
+import numpy as np
+import scipy
+import calib_pipeline as pipeline
+import model_compare
+from synth_imu import SyntheticIMU
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+SIX_POS = os.path.join(ROOT, 'Six-Position-Test')
+BENCH_DATA = os.path.join(HERE, 'bench_data')    # synthetic CSV files are kept here
+RATE = 180.0    # sample rate (Hz) of the recorded datasets
+STARTUP_SCRIPTS = [os.path.join(HERE, 'collect_data_six_pos.py'),
+                   os.path.join(ROOT, 'Preliminary-Tests', 'collect_data.py'),
+                   os.path.join(ROOT, 'Preliminary-Tests', 'Start-Up-Shut-Down', 'collect_data.py'),
+                   os.path.join(ROOT, 'Preliminary-Tests', '15-Hours-Data', 'collect_data_15_hours.py'),
+                   os.path.join(HERE, 'calib_pipeline.py'),
+                   os.path.join(HERE, 'two_levels_calib.py'),
+                   os.path.join(SIX_POS, 'integrate.py'),
+                   os.path.join(SIX_POS, 'collect_data_six_pos.py'),
+                   os.path.join(SIX_POS, 'optim_accel_models.py')]
+HEAVY_MODULES = ('matplotlib.pyplot', 'scipy.optimize', 'scipy.integrate')    # should not load at startup
+
+
+
+#############################
+# Measurement helpers
+#############################
+
+def reset_peak_rss():
+
+    # Reset the kernel's peak RSS counter for this process (Linux only).
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+
+    # Peak resident set size of this process in MB since the last reset.
+
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024    # kB on Linux, never reset
+
+
+def measure(function, *args):
+
+    # Run function(*args) and return its result, wall time and peak RSS.
+
+    gc.collect()
+    reset_peak_rss()
+    start = time.perf_counter()
+    result = function(*args)
+    wall = time.perf_counter() - start
+
+    return result, wall, peak_rss_mb()
+
+
+def scaling_exponent(function, sliced_args, n_samples, n_small=1000, min_seconds=1.0):
+
+    # Estimate k in time ~ N^k by timing function on prefixes of the data,
+    # doubling the prefix until a run takes at least min_seconds (so fixed
+    # per-call costs do not hide the growth) or reaches half of n_samples.
+    # sliced_args(n) must return the arguments for a prefix of n samples.
+    # Returns (k, seconds for the last prefix, length of the last prefix).
+
+    n, previous, elapsed = n_small, None, None
+    while True:
+        args = sliced_args(n)
+        start = time.perf_counter()
+        function(*args)
+        previous, elapsed = elapsed, time.perf_counter() - start
+        if previous is not None and (elapsed >= min_seconds or 2*n > n_samples // 2):
+            break
+        n *= 2
+
+    return np.log2(max(elapsed, 1e-9) / max(previous, 1e-9)), elapsed, n
+
+
+class Bench:
+
+    # Collects one record per (dataset, stage).
+
+    def __init__(self, max_stage_seconds):
+
+        self.max_stage_seconds = max_stage_seconds
+        self.records = []
+        self.measured = {}    # kind -> (wall time, samples, scaling exponent) of its last run
+
+    def stage(self, dataset, name, n_samples, function, *args, sliced_args=None, kind=None):
+
+        # Time one stage. If sliced_args is given, the stage is skipped when
+        # its projected run time on n_samples is over the budget: projected
+        # from the last run of the same kind of stage (default: the same
+        # name) if there was one, or else from the scaling measured on
+        # prefixes. Returns the stage's result (None when skipped).
+
+        record = {'dataset': dataset, 'stage': name, 'samples': int(n_samples)}
+        kind = name if kind is None else kind
+        exponent = None
+        if sliced_args is not None and n_samples > 4000:
+            if kind in self.measured:
+                t_run, n_run, exponent = self.measured[kind]
+            else:
+                exponent, t_run, n_run = scaling_exponent(function, sliced_args, n_samples)
+            projected = t_run * (n_samples / n_run) ** max(exponent, 1.0)
+            record['scaling_exponent'] = round(float(exponent), 2)
+            if projected > self.max_stage_seconds:
+                record.update(skipped=True, projected_s=float(projected))
+                self.records.append(record)
+                print(f"  {dataset:>12} {name:<24} skipped (projected {projected:,.0f} s, N^{exponent:.1f})")
+                return None
+
+        result, wall, peak = measure(function, *args)
+        if exponent is not None:
+            self.measured[kind] = (wall, n_samples, exponent)
+        record.update(wall_s=wall, peak_rss_mb=peak, samples_per_s=n_samples / wall if wall > 0 else None)
+        self.records.append(record)
+        print(f"  {dataset:>12} {name:<24} {wall:9.3f} s {peak:9.1f} MB", f"{n_samples / max(wall, 1e-9):14,.0f} samples/s" if n_samples else '')
+
+        return result
+
+    def set_samples(self, n_samples):
+
+        # Set the sample count of the last stage (for loads, where it is
+        # only known afterwards) and recompute its throughput.
+
+        record = self.records[-1]
+        record['samples'] = int(n_samples)
+        if record.get('wall_s'):
+            record['samples_per_s'] = n_samples / record['wall_s']
+
+
+
+#############################
+# Datasets
+#############################
+
+def load_script(path, name):
+
+    # Import an analysis script by path (its __main__ block is not run).
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def synthetic_recording(csv_file, hours, rate=RATE, seed=0):
+
+    # Write a synthetic static recording (z up) in the collectors' CSV layout,
+    # with the default (real sensor like) errors of synth_imu.py.
+
+    SyntheticIMU(rate=rate, seed=seed).write_csv(csv_file, hours * 3600)
+
+    return
+
+
+def synthetic_six_position(seed=0):
+
+    # Six-position summary (true, mean, std per axis) matching synthetic_recording.
+
+    return SyntheticIMU(seed=seed).six_position()
+
+
+
+#############################
+# Pipeline stages
+#############################
+
+def two_levels_stages(bench, dataset, six_pos, fit_csv, test_csv):
+
+    # Run every stage of the two-level calibration with the calib_pipeline.py
+    # functions. six_pos is either the path of the six-position CSV file or
+    # an already built summary array.
+
+    if isinstance(six_pos, str):
+        read_data = bench.stage(dataset, 'load six-position', 6, pipeline.load_six_position, six_pos)
+    else:
+        read_data = six_pos
+    params, _ = bench.stage(dataset, 'fit accel models', 6, pipeline.fit_accel_models, read_data)
+    bias, scale_f = pipeline.model_3(params)
+
+    for label, csv_file in (('fit', fit_csv), ('test', test_csv)):
+        time_array, accels = bench.stage(dataset, f'load {label} data', 0, pipeline.load_recording, csv_file)
+        n = len(time_array)
+        bench.set_samples(n)
+
+        accel_calib = bench.stage(dataset, f'calibrate {label} (model 3)', n, pipeline.apply_accel_model, accels, bias, scale_f,
+                                  sliced_args=lambda m: (accels[:m], bias, scale_f), kind='calibrate (model 3)')
+        if accel_calib is None:
+            return
+        accel_calib = pipeline.to_m_s_s(accel_calib)
+        displacement = bench.stage(dataset, f'integrate {label}', n, pipeline.integrate, time_array, accel_calib)
+
+        if label == 'fit':
+            drift, _ = bench.stage(dataset, 'fit drift model', n, pipeline.fit_drift_model, time_array, displacement)
+        else:
+            bench.stage(dataset, 'correct drift', n, pipeline.correct_drift, time_array, displacement, drift)
+
+    return
+
+
+def six_position_stages(bench, dataset, trial_dir, trial):
+
+    # Run every stage of Six-Position-Test/integrate.py for one trial.
+
+    script = load_script(os.path.join(SIX_POS, 'integrate.py'), 'six_position_integrate')
+    time_array, accels = bench.stage(dataset, 'load test data', 0, pipeline.load_recording,
+                                     os.path.join(trial_dir, f'six_position_test_data_{trial}.csv'))
+    n = len(time_array)
+    bench.set_samples(n)
+    param_data = pipeline.load_params(os.path.join(trial_dir, f'optim_params_{trial}.csv'))
+
+    bias_3 = param_data[2, 0:3]
+    scale_f_3 = np.array([param_data[2, 3:6], param_data[2, 6:9], param_data[2, 9:]]).T
+    calibrated = [accels,
+                  bench.stage(dataset, 'calibrate model 1', n, script.bias_model, accels, param_data[0, 0:3]),
+                  bench.stage(dataset, 'calibrate model 2', n, script.scale_factor_model, accels, param_data[1, 0:3], param_data[1, 3:6]),
+                  bench.stage(dataset, 'calibrate model 3', n, script.misalignment_model, accels, bias_3, scale_f_3,
+                              sliced_args=lambda m: (accels[:m], bias_3, scale_f_3))]
+    calibrated = [pipeline.to_m_s_s(accel_calib) for accel_calib in calibrated if accel_calib is not None]
+
+    def integrate_all():
+        return [script.integrate_data(time_array, accel_calib) for accel_calib in calibrated]
+    bench.stage(dataset, f'integrate x{len(calibrated)}', n*len(calibrated), integrate_all)
+
+    # The same four variants in one pass (model_compare.py)
+    names, biases, matrices = model_compare.variants_from_params(param_data)
+    bench.stage(dataset, f'compare variants x{len(names)}', n*len(names), model_compare.compare_variants,
+                time_array, accels, biases, matrices, 2, True)
+
+    return
+
+
+
+#############################
+# Startup time
+#############################
+
+def startup_code(script):
+
+    # The module-level imports (and sys.path changes) of a script, which
+    # run before it can do anything. The IMU driver is left out, since
+    # importing it starts the hardware.
+
+    tree = ast.parse(open(script).read())
+    statements = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if 'mpu9250_i2c' not in ast.unparse(node):
+                statements.append(ast.unparse(node))
+        elif isinstance(node, ast.Try) and all(isinstance(n, (ast.Import, ast.ImportFrom)) for n in node.body):
+            statements.append(ast.unparse(node))
+        elif isinstance(node, ast.Expr) and ast.unparse(node).startswith('sys.path'):
+            statements.append(ast.unparse(node))
+
+    return '\n'.join(statements)
+
+
+def startup_time(script, repeat=3):
+
+    # Run a script's startup imports in fresh interpreters. Returns the best
+    # import time, the best total process time (interpreter start included)
+    # and the heavy modules that got loaded.
+
+    probe = ('import time,sys\nstart = time.perf_counter()\n' + startup_code(script) +
+             f'\nprint(time.perf_counter() - start, [m for m in {HEAVY_MODULES!r} if m in sys.modules])')
+    imports, process = [], []
+    for ii in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', probe], cwd=os.path.dirname(script),
+                                capture_output=True, text=True, check=True).stdout.split(' ', 1)
+        process.append(time.perf_counter() - start)
+        imports.append(float(output[0]))
+
+    return min(imports), min(process), ast.literal_eval(output[1])
+
+
+def startup_stages(bench):
+
+    # Record the startup time of the collectors and analysis modules.
+
+    for script in STARTUP_SCRIPTS:
+        name = os.path.relpath(script, ROOT)
+        imports, process, heavy = startup_time(script)
+        bench.records.append({'dataset': 'startup', 'stage': name, 'samples': 0, 'wall_s': imports,
+                              'process_s': process, 'heavy_modules': heavy})
+        print(f"  {'startup':>12} {name:<24} {imports:9.3f} s (process {process:.3f} s)", ', '.join(heavy))
+
+    return
+
+
+
+#############################
+# Reporting
+#############################
+
+def compare(records, old_file):
+
+    # Print the ratio of new to old wall time for every stage in both runs.
+
+    with open(old_file) as file:
+        old = {(r['dataset'], r['stage']): r for r in json.load(file)['results']}
+    print(f"\nComparison with {old_file} (new / old wall time)")
+    for record in records:
+        before = old.get((record['dataset'], record['stage']))
+        if before and before.get('wall_s') and record.get('wall_s'):
+            ratio = record['wall_s'] / before['wall_s']
+            flag = '  <-- slower' if ratio > 1.25 else ''
+            print(f"  {record['dataset']:>12} {record['stage']:<24} {ratio:6.2f}x{flag}")
+
+    return
+
+
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Benchmark the calibration pipeline stage by stage.")
+    parser.add_argument('--hours', type=float, nargs='*', default=[1, 15, 24], help="lengths of the synthetic recordings (hours)")
+    parser.add_argument('--no-recorded', action='store_true', help="skip the checked-in datasets")
+    parser.add_argument('--no-startup', action='store_true', help="skip the startup time of the scripts")
+    parser.add_argument('--max-stage-seconds', type=float, default=300, help="skip stages projected to take longer than this (approximate, see the header)")
+    parser.add_argument('--output', default='benchmark.json', help="JSON file for the results")
+    parser.add_argument('--compare', help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    bench = Bench(args.max_stage_seconds)
+    print(f"{'dataset':>14} {'stage':<24} {'wall':>11} {'peak RSS':>12} {'throughput':>24}")
+
+    if not args.no_startup:
+        startup_stages(bench)
+
+    if not args.no_recorded:
+        final_trial = os.path.join(SIX_POS, 'data', 'final_trial')
+        two_levels_stages(bench, 'final_trial', os.path.join(final_trial, 'six_position_data.csv'),
+                          os.path.join(final_trial, 'six_position_test_data.csv'),
+                          os.path.join(final_trial, 'six_position_final_test_data.csv'))
+        for trial in (1, 2, 3):
+            six_position_stages(bench, f'trial_{trial}', os.path.join(SIX_POS, 'data', f'trial_{trial}'), trial)
+
+    for hours in args.hours:
+        dataset = f'synthetic_{hours:g}h'
+        csv_file = os.path.join(BENCH_DATA, f'{dataset}.csv')
+        if not os.path.exists(csv_file):
+            print(f"  writing {csv_file}")
+            synthetic_recording(csv_file, hours)
+        two_levels_stages(bench, dataset, synthetic_six_position(), csv_file, csv_file)
+
+    results = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+               'machine': platform.machine(), 'cpus': os.cpu_count(),
+               'results': bench.records}
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print("Saved", args.output)
+
+    if args.compare:
+        compare(bench.records, args.compare)
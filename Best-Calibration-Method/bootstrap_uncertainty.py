@@ -0,0 +1,219 @@
+#############################################################################
+# Script Name: bootstrap_uncertainty.py
+
+# Monte Carlo / bootstrap uncertainty of the accelerometer model parameters.
+
+# The "Uncertainties (%)" of two_levels_calib.py are curve_fit covariances
+# of a six point fit, divided by the parameter, so they blow up for the
+# near-zero misalignment terms. Here the six-position data is instead
+# replicated thousands of times and every replicate is refitted:
+#     sigma       each position's mean is perturbed by its standard
+#                 error, the measured standard deviation divided by
+#                 sqrt(samples in the window): from the file's samples
+#                 column (collect_data_six_pos.py records it), or --samples
+#                 for older files, which do not
+#     residual    the weighted residuals of the model 3 fit are resampled
+#                 with replacement and added back to the fitted values
+# All three models are linear in their parameters, and the design matrix
+# and weights are the same for every replicate, so each weighted least
+# squares fit is a fixed (p, 6) projection of the replicate's means. A
+# chunk of replicates is refitted with one batched product, and chunks are
+# spread over a process pool. The results are the parameters' spread,
+# confidence intervals, and correlation matrix (absolute values, not
+# percentages).
+
+# Usage:
+#     python bootstrap_uncertainty.py SIX_POS_CSV [--replicates 10000]
+#         [--mode sigma|residual] [--samples N] [--workers N] [--level 95]
+#         [--output intervals.csv] [--correlation correlation.csv]
+#############################################################################
+
+import time,argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from calib_pipeline import load_six_position
+
+
+PARAM_NAMES = ['b_x', 'b_y', 'b_z', 'Sxx', 'Sxy', 'Sxz', 'Syx', 'Syy', 'Syz', 'Szx', 'Szy', 'Szz']
+CHUNK = 1000    # replicates per task (fixed, so results do not depend on workers)
+
+
+#############################
+# Batched fits
+#############################
+
+def projections(read_data):
+
+    # Weighted least squares projections of every model and axis: the fit of
+    # an axis' six means y is P @ y. Returns three lists (models 1-3) of
+    # three (p, 6) matrices (x, y, z), and the three model 1 offsets (its
+    # bias is fitted to y - true, so P @ y is off by P @ true).
+
+    true = read_data[:, [0, 3, 6]]
+    ones = np.ones(len(read_data))
+    models = ([], [], [])
+    for ii in range(3):
+        weights = 1 / read_data[:, 3*ii+2]
+        for model, design in zip(models, (ones[:, None],
+                                          np.column_stack((ones, true[:, ii])),
+                                          np.column_stack((ones, true)))):
+            model.append(np.linalg.pinv(design * weights[:, None]) * weights)
+    offsets = np.array([models[0][ii][0] @ true[:, ii] for ii in range(3)])
+
+    return models, offsets
+
+
+def fit_batch(proj, offsets, means):
+
+    # Fit models 1-3 to a batch of six-position means, (R, 3, 6) with one
+    # row of six means per axis. Returns (R, 3, 12) parameters, each
+    # replicate laid out as the three rows of an optim_params CSV file.
+
+    params = np.zeros((len(means), 3, 12))
+    for ii in range(3):
+        y = means[:, ii, :]
+        params[:, 0, ii] = y @ proj[0][ii][0] - offsets[ii]
+        p2 = y @ proj[1][ii].T
+        params[:, 1, ii], params[:, 1, 3+ii] = p2[:, 0], p2[:, 1]
+        p3 = y @ proj[2][ii].T
+        params[:, 2, ii] = p3[:, 0]
+        params[:, 2, 3+3*ii:6+3*ii] = p3[:, 1:]
+
+    return params
+
+
+def point_fit(read_data):
+
+    # Parameters (3, 12) and model 3 fitted means (3, 6) of the measured data.
+
+    proj, offsets = projections(read_data)
+    means = read_data[:, [1, 4, 7]].T
+    params = fit_batch(proj, offsets, means[None])[0]
+    design = np.column_stack((np.ones(len(read_data)), read_data[:, [0, 3, 6]]))
+    fitted = np.array([design @ params[2, [ii, 3+3*ii, 4+3*ii, 5+3*ii]] for ii in range(3)])
+
+    return params, fitted
+
+
+
+#############################
+# Replicates
+#############################
+
+def window_samples(csv_file):
+
+    # Samples in each position's window, from the column headed 'samples'
+    # of a six-position file, or None if the file has no such column.
+
+    with open(csv_file) as file:
+        header = [name.strip().lower() for name in file.readline().split(',')]
+    if 'samples' not in header:
+        return None
+    read_data = np.loadtxt(csv_file, skiprows = 1, delimiter=",", dtype=float, ndmin=2)
+
+    return read_data[:, header.index('samples')]
+
+
+def replicate_chunk(read_data, count, seed, mode='sigma', samples=1):
+
+    # Refit `count` replicates of the six-position data. Returns (count, 3, 12).
+    # samples: per window, one value or one per position (row).
+
+    rng = np.random.default_rng(seed)
+    proj, offsets = projections(read_data)
+    means = read_data[:, [1, 4, 7]].T              # (axis, position)
+    stds = read_data[:, [2, 5, 8]].T
+
+    if mode == 'sigma':
+        replicates = means + stds / np.sqrt(samples) * rng.standard_normal((count, 3, len(read_data)))
+    elif mode == 'residual':
+        _, fitted = point_fit(read_data)
+        n = len(read_data)
+        residuals = (means - fitted) / stds * np.sqrt(n / (n - 4))    # weighted, inflated for the 4 fitted parameters
+        picks = rng.integers(0, n, (count, 3, n))
+        replicates = fitted + stds * np.take_along_axis(np.broadcast_to(residuals, (count, 3, n)), picks, axis=2)
+    else:
+        raise ValueError("mode must be 'sigma' or 'residual'")
+
+    return fit_batch(proj, offsets, replicates)
+
+
+def bootstrap(read_data, replicates=10000, mode='sigma', samples=1, workers=1, seed=0):
+
+    # Refit `replicates` replicates of the six-position data, in chunks of
+    # CHUNK on `workers` processes (None: one per core). The same seed gives
+    # the same replicates for any number of workers. Returns (R, 3, 12).
+
+    counts = [CHUNK] * (replicates // CHUNK) + ([replicates % CHUNK] if replicates % CHUNK else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    n = len(counts)
+    if workers == 1 or n == 1:
+        chunks = list(map(replicate_chunk, [read_data]*n, counts, seeds, [mode]*n, [samples]*n))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(replicate_chunk, [read_data]*n, counts, seeds, [mode]*n, [samples]*n))
+
+    return np.concatenate(chunks)
+
+
+def summarize(replicates, level=95):
+
+    # Spread of the model 3 parameters over the replicates: standard
+    # deviations, percentile confidence intervals at `level` percent (12
+    # each) and the (12, 12) correlation matrix.
+
+    model_3 = replicates[:, 2, :]
+    low, high = np.percentile(model_3, [(100 - level) / 2, (100 + level) / 2], axis=0)
+
+    return {'std': np.std(model_3, axis=0, ddof=1), 'low': low, 'high': high,
+            'correlation': np.corrcoef(model_3, rowvar=False)}
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Bootstrap uncertainty of the accelerometer model parameters.")
+    parser.add_argument('six_position_csv', help="six-position summary CSV file")
+    parser.add_argument('--replicates', type=int, default=10000, help="number of refits")
+    parser.add_argument('--mode', choices=['sigma', 'residual'], default='sigma', help="perturb by the measured std, or resample residuals")
+    parser.add_argument('--samples', type=float, help="samples per static window, for files without a samples column (sigma mode uses std/sqrt(samples))")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--level', type=float, default=95, help="confidence level (%%)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    parser.add_argument('--output', help="save the parameters and intervals as CSV")
+    parser.add_argument('--correlation', help="save the correlation matrix as CSV")
+    args = parser.parse_args()
+
+    read_data = load_six_position(args.six_position_csv)
+    samples = args.samples
+    if samples is None:
+        samples = window_samples(args.six_position_csv)
+    if samples is None:
+        if args.mode == 'sigma':
+            parser.error("the file has no samples column: give --samples (samples per static window) in sigma mode")
+        samples = 1    # not used in residual mode
+    params, _ = point_fit(read_data)
+    start = time.perf_counter()
+    replicates = bootstrap(read_data, args.replicates, args.mode, samples, args.workers, args.seed)
+    elapsed = time.perf_counter() - start
+    summary = summarize(replicates, args.level)
+
+    print(f"{len(replicates)} replicates ({args.mode}) in {elapsed:.3f} s")
+    print(f"{'param':<6} {'value':>10} {'std':>10} {f'{args.level:g}% interval':>24}")
+    for ii, name in enumerate(PARAM_NAMES):
+        print(f"{name:<6} {params[2, ii]:10.5f} {summary['std'][ii]:10.2e} {summary['low'][ii]:11.5f} {summary['high'][ii]:11.5f}")
+    print("Correlation:")
+    for name, row in zip(PARAM_NAMES, summary['correlation']):
+        print(f"{name:<6}", ' '.join(f"{c:5.2f}" for c in row))
+
+    if args.output:
+        file = open(args.output, 'w')
+        file.write(f'Model 3 parameters, {len(replicates)} {args.mode} replicates\n')
+        file.write(f'param,value,std,low ({args.level:g}%),high ({args.level:g}%)\n')
+        for ii, name in enumerate(PARAM_NAMES):
+            file.write(f"{name},{params[2, ii]},{summary['std'][ii]},{summary['low'][ii]},{summary['high'][ii]}\n")
+        file.close()
+        print("Saved", args.output)
+    if args.correlation:
+        np.savetxt(args.correlation, summary['correlation'], delimiter=",", header=','.join(PARAM_NAMES), comments='')
+        print("Saved", args.correlation)
@@ -0,0 +1,420 @@
+#############################################################################
+# Script Name: calib_pipeline.py
+
+# The two-level calibration of two_levels_calib.py as a reusable pipeline.
+
+# Each step is a function that takes and returns arrays, so the steps can be
+# chained in memory, reused from other scripts, or run one at a time:
+#     load_six_position / load_recording   read the CSV files
+#     fit_accel_models                     fit models 1-3 to the six-position data
+#     fit_gyro_model                       fit the gyro bias to the same windows
+#     apply_accel_model                    calibrate with model 3 (vectorized)
+#     to_m_s_s                             g to m/s/s, remove gravity
+#     integrate                            acceleration to displacement
+#     fit_drift_model                      fit the displacement error model
+#     correct_drift                        remove the fitted drift
+# calibrate() runs the whole procedure and calibrate_batch() applies one fit
+# to many recordings in the same interpreter. With --cache, stage results
+# are kept in a content-addressed cache (stage_cache.py) and only the stages
+# whose inputs changed are recomputed.
+
+# Usage:
+#     python calib_pipeline.py SIX_POS_CSV FIT_CSV TEST_CSV [TEST_CSV ...]
+#     python calib_pipeline.py data/final_trial/six_position_data.csv \
+#         data/final_trial/six_position_test_data.csv \
+#         data/final_trial/six_position_final_test_data.csv --test-seconds 60 \
+#         --params optim_params.csv --plot
+#############################################################################
+
+import os,sys,argparse
+import numpy as np
+from stage_timer import StageTimer
+from stage_cache import StageCache
+from scipy_compat import cumtrapz
+from two_levels_calib import bias_model, scale_factor_model, misalignment_model, disp_model
+
+
+GRAVITY = 9.797    # m/s/s
+
+
+#############################
+# Load
+#############################
+
+def load_six_position(csv_file):
+
+    # Six-position summary: one row per position of
+    # x_true, x_mean, x_std, y_true, y_mean, y_std, z_true, z_mean, z_std,
+    # followed in newer files by wx_mean, wx_std, wy_mean, wy_std, wz_mean,
+    # wz_std of the gyro (deg/s).
+
+    return np.loadtxt(csv_file, skiprows = 1, delimiter=",", dtype=float, ndmin=2)
+
+
+def load_recording(csv_file, seconds=None):
+
+    # Time stamps (s) and x, y, z acceleration (g) of a recording in the
+    # collectors' CSV layout, optionally only its first `seconds`.
+
+    accel_data = np.loadtxt(csv_file, skiprows = 2, delimiter=",", dtype=float, ndmin=2)
+    times, accels = accel_data[:, 0], accel_data[:, 1:4]
+    if seconds is not None:
+        n = np.searchsorted(times, times[0] + seconds)
+        times, accels = times[:n], accels[:n]
+
+    return times, accels
+
+
+
+#############################
+# Accelerometer model
+#############################
+
+def fit_accel_models(read_data):
+
+    # Fit models 1, 2 and 3 (bias; bias and scale factors; bias and scale
+    # factor matrix) to each axis, each model starting from the previous one.
+    # Returns the parameters as the three rows of an optim_params CSV file
+    # (b_x, b_y, b_z, then Sxx, Syy, Szz for model 2 or Sxx, Sxy, ... Szz for
+    # model 3, zero padded) and the (3, 4, 4) covariance of each axis' model 3
+    # parameters (bias and three scale factors). The percent uncertainties
+    # printed by two_levels_calib.py are sqrt(diag(covariance))/params * 100.
+
+    from scipy.optimize import curve_fit    # SciPy is loaded on first use
+
+    true = read_data[:, [0, 3, 6]].T
+    params = np.zeros((3, 12))
+    covariance = np.zeros((3, 4, 4))
+    for ii in range(3):
+        axis_true, axis_mean, axis_std = read_data[:, 3*ii], read_data[:, 3*ii+1], read_data[:, 3*ii+2]
+
+        p1, covar = curve_fit(bias_model, axis_true, axis_mean, sigma=axis_std)
+        p2, covar = curve_fit(scale_factor_model, axis_true, axis_mean, p0=(p1[0], 1), sigma=axis_std)
+        p0 = [p2[0], 0, 0, 0]
+        p0[ii+1] = p2[1]
+        p3, covar = curve_fit(misalignment_model, true, axis_mean, p0=p0, sigma=axis_std)
+
+        params[:, ii] = p1[0], p2[0], p3[0]
+        params[1, 3+ii] = p2[1]
+        params[2, 3+3*ii:6+3*ii] = p3[1:]
+        covariance[ii] = covar
+
+    return params, covariance
+
+
+def fit_gyro_model(read_data, g_sensitivity=False):
+
+    # Fit the gyro bias (deg/s) of each axis to the static windows of the
+    # six-position data, weighted by 1/std^2; with g_sensitivity, also the
+    # gyro's sensitivity to the true acceleration (deg/s/g). Static windows
+    # hold no rotation, so the gyro scale factors cannot be fitted here.
+    # Returns a row in the optim_params layout: bias, then the 3x3
+    # sensitivity matrix (zero without g_sensitivity).
+
+    true = read_data[:, [0, 3, 6]]
+    row = np.zeros(12)
+    for ii in range(3):
+        means, weights = read_data[:, 9+2*ii], 1 / read_data[:, 10+2*ii]
+        design = np.ones((len(read_data), 1)) if not g_sensitivity else np.column_stack((np.ones(len(read_data)), true))
+        params = np.linalg.lstsq(design * weights[:, None], means * weights, rcond=None)[0]
+        row[ii] = params[0]
+        if g_sensitivity:
+            row[3+3*ii:6+3*ii] = params[1:]
+
+    return row
+
+
+def has_gyro(read_data):
+    return read_data.shape[1] >= 15
+
+
+def model_3(params):
+
+    # Bias and scale factor matrix of model 3 from optim_params rows, with
+    # the matrix transposed the way apply_accel_model expects it.
+
+    bias = params[2, 0:3]
+    scale_f = np.array([params[2, 3:6], params[2, 6:9], params[2, 9:12]]).T
+
+    return bias, scale_f
+
+
+def gyro_model(params):
+
+    # Gyro bias and sensitivity matrix (deg/s/g) from the fourth optim_params
+    # row, or None, None if the file has no gyro row.
+
+    if len(params) < 4:
+        return None, None
+
+    return params[3, 0:3], np.array([params[3, 3:6], params[3, 6:9], params[3, 9:12]])
+
+
+def apply_gyro_model(gyros, bias, sensitivity=None, accels=None):
+
+    # Calibrate (n, 3) angular rates (deg/s): subtract the bias and, given
+    # the calibrated accelerations (g), the g-sensitivity.
+
+    gyros = gyros - bias
+    if sensitivity is not None and accels is not None:
+        gyros -= accels @ sensitivity.T
+
+    return gyros
+
+
+def save_params(FILENAME, params, TITLE='Accelerometer Model Parameters Optimized'):
+
+    # Write the optim_params CSV file read by Six-Position-Test/integrate.py.
+    # A fourth row, if given, holds the gyro bias and g-sensitivity.
+
+    file = open(FILENAME, 'w')
+    file.write(TITLE + '\n')
+    file.write('b_x, b_y, b_z, Sxx, Sxy, Sxz, Syx, Syy, Syz, Szx, Szy, Szz \n')
+    for row in params:
+        file.write(','.join(repr(float(value)) for value in row) + '\n')
+    file.close()
+
+    return
+
+
+def load_params(FILENAME):
+    return np.loadtxt(FILENAME, skiprows = 2, delimiter=",", dtype=float)
+
+
+def apply_accel_model(accels, bias, scale_f):
+
+    # Calibrate (n, 3) accelerations with model 3:
+    # true_accel = (measured_accel - bias) * (scale_f_matrix)^-1.
+    # The inverse is taken once and all samples are converted in one matrix
+    # product (two_levels_calib.py uses this too).
+
+    return (accels - bias) @ np.linalg.inv(scale_f)
+
+
+
+#############################
+# Displacement
+#############################
+
+def to_m_s_s(accel_calib, gravity_axis=2, gravity_sign=1, gravity_samples=None):
+
+    # Convert from g to m/s/s and remove gravity from the axis facing up
+    # (gravity_sign=-1 if it faces down). With gravity_samples, gravity is
+    # instead estimated from the tilt of the first gravity_samples (static)
+    # samples and removed from all three axes (see gravity_comp.py). Returns
+    # a new array.
+
+    if gravity_samples is not None and gravity_samples < 1:
+        raise ValueError(f"gravity_samples must be at least 1, not {gravity_samples}")
+    accel_calib = accel_calib * GRAVITY
+    if gravity_samples is not None:
+        from gravity_comp import estimate_gravity
+        accel_calib -= estimate_gravity(accel_calib[:gravity_samples])
+    elif gravity_axis is not None:
+        accel_calib[:, gravity_axis] -= gravity_sign * GRAVITY
+
+    return accel_calib
+
+
+def integrate(times, accels):
+
+    # Integrate (n, 3) acceleration twice over time, all axes at once.
+    # Returns the (n, 3) displacement, starting at zero.
+
+    zero = np.zeros((1, accels.shape[1]))
+    velocity = np.concatenate((zero, cumtrapz(accels, x=times, axis=0)))
+
+    return np.concatenate((zero, cumtrapz(velocity, x=times, axis=0)))
+
+
+def fit_drift_model(times, displacement):
+
+    # Fit the displacement error model (q0 + q1*t + q2*t^2/2) to each axis.
+    # Returns a (3, 3) array with one row of q0, q1, q2 per axis and the
+    # (3, 3, 3) covariance of each row.
+
+    from scipy.optimize import curve_fit
+
+    fits = [curve_fit(disp_model, times, displacement[:, ii]) for ii in range(displacement.shape[1])]
+
+    return np.array([fit[0] for fit in fits]), np.array([fit[1] for fit in fits])
+
+
+def correct_drift(times, displacement, drift):
+
+    # Subtract the fitted displacement error of each axis.
+
+    return displacement - np.column_stack([disp_model(times, *q) for q in drift])
+
+
+
+#############################
+# Whole procedure
+#############################
+
+def _stage(cache, timer, stage, label, compute, inputs=(), params=None, samples=None):
+
+    # Run one stage under the timer, through the cache if there is one.
+    # compute() returns a dict of arrays. Returns (cache key, arrays).
+
+    with timer.stage(stage + label, samples=samples) as record:
+        if cache is None:
+            return None, compute()
+        hits = cache.hits
+        key, arrays = cache.cached(stage, compute, inputs, params)
+        record['cached'] = cache.hits > hits
+
+    return key, arrays
+
+
+def _load_recording(csv_file, seconds, timer, cache, label=''):
+
+    key, arrays = _stage(cache, timer, 'load', label, lambda: dict(zip(('times', 'accels'), load_recording(csv_file, seconds))),
+                         inputs=[csv_file], params={'seconds': seconds})
+
+    return key, arrays['times'], arrays['accels']
+
+
+def _calibrate_recording(times, accels, bias, scale_f, drift, timer, cache, key, label, gravity_seconds=None):
+
+    # calibrate_recording, also returning the cache key of the displacement.
+
+    gravity_samples = None if gravity_seconds is None else int(np.searchsorted(times, times[0] + gravity_seconds))
+    key, arrays = _stage(cache, timer, 'apply accel model', label,
+                         lambda: {'accel_calib': to_m_s_s(apply_accel_model(accels, bias, scale_f), gravity_samples=gravity_samples)},
+                         inputs=[key, bias, scale_f], params={'gravity': GRAVITY, 'gravity_seconds': gravity_seconds},
+                         samples=len(accels))
+    key, arrays = _stage(cache, timer, 'integrate', label, lambda: {'displacement': integrate(times, arrays['accel_calib'])},
+                         inputs=[key], samples=len(times))
+    if drift is not None:
+        displacement = arrays['displacement']
+        key, arrays = _stage(cache, timer, 'correct drift', label, lambda: {'displacement': correct_drift(times, displacement, drift)},
+                             inputs=[key, drift], samples=len(times))
+
+    return key, arrays['displacement']
+
+
+def calibrate_recording(times, accels, bias, scale_f, drift=None, timer=None, label='', cache=None, key=None,
+                        gravity_seconds=None):
+
+    # Calibrate one recording and integrate it for displacement; with a
+    # drift model, also correct the displacement. Returns the displacement.
+    # With a StageCache, `key` identifies the recording (by default its
+    # arrays are hashed). With gravity_seconds, gravity is estimated from
+    # the tilt during the recording's first (static) seconds instead of
+    # assuming z points straight up.
+
+    if cache is not None and key is None:
+        key = cache.key('recording', [times, accels])
+
+    return _calibrate_recording(times, accels, bias, scale_f, drift, timer or StageTimer(), cache, key, label, gravity_seconds)[1]
+
+
+def calibrate(six_position_csv, fit_csv, fit_seconds=None, timer=None, cache=None, gravity_seconds=None):
+
+    # Fit the accelerometer models to the six-position data, then the drift
+    # model to the calibrated and integrated fit recording. Returns the
+    # optim_params rows (and a gyro row, if the six-position file has gyro
+    # columns) and the (3, 3) drift model. With a StageCache
+    # (stage_cache.py), stages whose inputs have not changed are loaded
+    # instead of recomputed; their covariances are cached too. See
+    # calibrate_recording for gravity_seconds.
+
+    timer = timer or StageTimer()
+    with timer.stage('load six-position data'):
+        read_data = load_six_position(six_position_csv)
+    key, fit = _stage(cache, timer, 'fit accel models', '', lambda: dict(zip(('params', 'covariance'), fit_accel_models(read_data))),
+                      inputs=[read_data])
+    params = fit['params']
+    if has_gyro(read_data):
+        params = np.vstack((params, fit_gyro_model(read_data)))    # gyro bias row
+    bias, scale_f = model_3(params)
+
+    key, times, accels = _load_recording(fit_csv, fit_seconds, timer, cache, ' (fit)')
+    key, displacement = _calibrate_recording(times, accels, bias, scale_f, None, timer, cache, key, ' (fit)', gravity_seconds)
+    key, fit = _stage(cache, timer, 'fit drift model', '', lambda: dict(zip(('drift', 'covariance'), fit_drift_model(times, displacement))),
+                      inputs=[key], samples=len(times))
+
+    return params, fit['drift']
+
+
+def calibrate_batch(test_csvs, params, drift, test_seconds=None, timer=None, cache=None, gravity_seconds=None):
+
+    # Calibrate many recordings with one set of parameters. Yields the file
+    # name, time stamps and corrected displacement of each recording.
+
+    timer = timer or StageTimer()
+    bias, scale_f = model_3(params)
+    for csv_file in test_csvs:
+        label = f' ({os.path.basename(csv_file)})'
+        key, times, accels = _load_recording(csv_file, test_seconds, timer, cache, label)
+        yield csv_file, times, _calibrate_recording(times, accels, bias, scale_f, drift, timer, cache, key, label, gravity_seconds)[1]
+
+
+def graph_displacement(times, displacement, TITLE, FILENAME):
+
+    # Same plot as two_levels_calib.graph_data.
+
+    from two_levels_calib import graph_data    # imports matplotlib
+
+    graph_data(times, displacement[:, 0], displacement[:, 1], displacement[:, 2],
+               Y_AXIS="Displacement (m)", TITLE=TITLE, FILENAME=FILENAME)
+
+    return
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Two-level accelerometer calibration: fit the accelerometer models to six-position "
+                                                 "data and the drift model to a fit recording, then calibrate test recordings.")
+    parser.add_argument('six_position_csv', help="six-position summary CSV file")
+    parser.add_argument('fit_csv', help="static recording used to fit the drift model")
+    parser.add_argument('test_csvs', nargs='*', help="recordings to calibrate with the fitted models")
+    parser.add_argument('--fit-seconds', type=float, help="use only the first seconds of the fit recording")
+    parser.add_argument('--test-seconds', type=float, help="use only the first seconds of each test recording")
+    parser.add_argument('--gravity-seconds', type=float, help="estimate gravity from the tilt during each recording's first seconds")
+    parser.add_argument('--params', help="save the accelerometer model parameters (optim_params CSV layout)")
+    parser.add_argument('--output-dir', help="save the corrected displacement of each test recording here")
+    parser.add_argument('--plot', action='store_true', help="plot the corrected displacement of each test recording")
+    parser.add_argument('--profile', action='store_true', help="profile the run (see stage_timer.py)")
+    parser.add_argument('--timing', help="save the stage times as JSON")
+    parser.add_argument('--cache', nargs='?', const='.cache', help="reuse unchanged stage results from this directory (default .cache)")
+    parser.add_argument('--cache-max-mb', type=float, default=1024, help="evict least recently used results above this size")
+    args = parser.parse_args()
+    if args.gravity_seconds is not None and args.gravity_seconds <= 0:
+        parser.error("--gravity-seconds must be positive")
+
+    timer = StageTimer(profile=args.profile)
+    cache = StageCache(args.cache, args.cache_max_mb) if args.cache else None
+    params, drift = calibrate(args.six_position_csv, args.fit_csv, args.fit_seconds, timer=timer, cache=cache,
+                              gravity_seconds=args.gravity_seconds)
+    print("Model 3 bias:", params[2, 0:3])
+    print("Model 3 scale factors:", params[2, 3:])
+    if len(params) > 3:
+        print("Gyro bias (deg/s):", params[3, 0:3])
+    print("Drift model (q0, q1, q2 per axis):\n", drift)
+    if args.params:
+        save_params(args.params, params)
+        print("Saved", args.params)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    results = calibrate_batch(args.test_csvs, params, drift, args.test_seconds, timer=timer, cache=cache,
+                              gravity_seconds=args.gravity_seconds)
+    for csv_file, times, displacement in results:
+        name = os.path.splitext(os.path.basename(csv_file))[0]
+        print(f"{name} Final Displacement: {displacement[-1, 0]:0.0f}, {displacement[-1, 1]:0.0f}, {displacement[-1, 2]:0.0f}")
+        if args.output_dir:
+            file = open(os.path.join(args.output_dir, name + '_displacement.csv'), 'w')
+            file.write('Calibrated Displacement\ntime (s),x (m),y (m),z (m)\n')
+            np.savetxt(file, np.column_stack((times, displacement)), delimiter=",", fmt='%.9g')
+            file.close()
+        if args.plot:
+            graph_displacement(times, displacement, "Final Calibrated Displacement",
+                               os.path.join(args.output_dir or '.', name + '_displacement.png'))
+
+    if cache is not None:
+        print(f"Cache: {cache.hits} stages loaded, {cache.misses} computed")
+    if args.profile or args.timing:
+        timer.report(args.timing)
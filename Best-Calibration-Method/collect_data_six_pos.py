@@ -7,16 +7,36 @@
 # Data is collected after rotating the IMU to six static positions: 
 # (1) x-up,  (2) x-down,  (3) y-up,  (4) y-down,  (5) z-up,  (6) z-down.
 # Then, an additional one minute of data is collected for calibration tests.
+# The gyro is recorded with the accelerometer, so the same static windows
+# also calibrate the gyro bias (calib_pipeline.fit_gyro_model). The die
+# temperature (TEMP_OUT) is recorded too; six-position files taken at
+# different temperatures fit the temperature model of temp_calib.py.
 
 # The accelerometer should be placed on a level surface at all times. 
 # Collect data in a stable surface that will not vibrate or wobble. 
+
+# Run with --live to watch the acceleration in a live plot while collecting
+# (see live_view.py), e.g. to catch a bad orientation or vibration.
+# Run with --instrument to measure where the time of each sample goes
+# (see acq_instrument.py); the summary is saved to acquisition_profile.json.
+# Run with --calibration optim_params.csv to apply a saved calibration while
+# collecting (see realtime_calib.py): the calibrated test data is saved next
+# to the raw data in six_position_test_data_calibrated.csv, and the live view
+# shows calibrated acceleration.
+# Run with --online to fit the calibration while collecting (see
+# rls_calib.py): the estimate is updated after every position, and unless
+# --calibration is given it is applied to the test data as above.
 ##############################################################################
 
 
 import time,sys
 sys.path.append('../')
 import numpy as np
-import matplotlib.pyplot as plt
+
+LIVE_VIEW = '--live' in sys.argv    # show a live plot while collecting
+INSTRUMENT = '--instrument' in sys.argv    # profile the collection loop
+ONLINE = '--online' in sys.argv    # update an RLS calibration after every position
+CALIBRATION = sys.argv[sys.argv.index('--calibration') + 1] if '--calibration' in sys.argv else None    # optim_params CSV file
 
 # Wait for IMU to connect
 t0 = time.time()    # start time
@@ -35,52 +55,97 @@ if not start_bool:
     exit()
 else:
     print("IMU Started")
+    mpu9250_i2c.set_profile('accel_gyro_temp')    # accel, temperature and gyro in one burst read
     time.sleep(2)    # wait for MPU to load and settle
 
 
 
 
 def accel_cal(
-        total_time, FILENAME):
+        total_time, FILENAME, ring=None, calib=None, CALIB_FILENAME=None):
     
-    # Collect acceleration over time.
+    # Collect acceleration and angular rate over time.
     # Iteratively save to a CSV file. 
+    # If a calibration is given, each sample is also calibrated and saved
+    # to CALIB_FILENAME, and the calibrated sample is what the ring gets.
+    # If a ring buffer is given, every sample is also pushed to it.
     
     start_time = time.time()    # initialize start time
     while (time.time() - start_time) < total_time:    # collect data for total_time seconds
 
-        x_accel, y_accel, z_accel ,_,_,_ = mpu9250_i2c.mpu6050_conv()    # retrieve acceleration measurement
+        x_accel, y_accel, z_accel, temp, w_x, w_y, w_z = mpu9250_i2c.read_profile()    # retrieve acceleration, temperature and angular rate measurement
         elapsed_time = time.time() - start_time     # record a time stamp
+        if calib is not None:
+            x_accel_cal, y_accel_cal, z_accel_cal = calib.apply_sample(x_accel, y_accel, z_accel)
+            w_x_cal, w_y_cal, w_z_cal = calib.apply_gyro_sample(w_x, w_y, w_z, x_accel_cal, y_accel_cal, z_accel_cal)
+        if ring is not None:
+            if calib is not None:
+                ring.push([start_time + elapsed_time, x_accel_cal, y_accel_cal, z_accel_cal])    # feed the live view
+            else:
+                ring.push([start_time + elapsed_time, x_accel, y_accel, z_accel])
         
         # Save data and time stamp to CSV
-        file = open(FILENAME, 'a')
-        file.write(str(elapsed_time) + ',' + str(x_accel) + ',' + str(y_accel) + ',' + str(z_accel) + '\n')
-        file.close()
+        write_line(FILENAME, format_sample(elapsed_time, x_accel, y_accel, z_accel, w_x, w_y, w_z, temp))
+        if calib is not None:
+            write_line(CALIB_FILENAME, format_sample(elapsed_time, x_accel_cal, y_accel_cal, z_accel_cal, w_x_cal, w_y_cal, w_z_cal, temp))
+
+    return
+
+
+def format_sample(
+        elapsed_time, x_accel, y_accel, z_accel, w_x, w_y, w_z, temp):
+
+    # One line of the CSV file: time stamp, acceleration, angular rate and
+    # temperature.
+
+    return (str(elapsed_time) + ',' + str(x_accel) + ',' + str(y_accel) + ',' + str(z_accel) + ',' +
+            str(w_x) + ',' + str(w_y) + ',' + str(w_z) + ',' + str(temp) + '\n')
+
+
+def write_line(
+        FILENAME, line):
+
+    # Append one line to the CSV file.
+
+    file = open(FILENAME, 'a')
+    file.write(line)
+    file.close()
 
     return
 
 
 def accel_mean_std(
-        total_time):
+        total_time, ring=None):
 
-    # Read acceleration from the IMU. 
-    # Calculate mean and standard deviation
+    # Read acceleration, angular rate and temperature from the IMU. 
+    # Calculate mean and standard deviation, and count the samples
+    # If a ring buffer is given, every sample is also pushed to it.
 
     start_time = time.time()    # initialize start time
     x_data = []    # x_axis acceleration
     y_data = []    # y_axis acceleration
     z_data = []    # z_axis acceleration
+    w_data = []    # x, y, z angular rate
+    t_data = []    # temperature
 
     while (time.time() - start_time) < total_time:    # collect data for total_time seconds
 
-        x_accel, y_accel, z_accel ,_,_,_ = mpu9250_i2c.mpu6050_conv()    # retrieve acceleration measurements
+        x_accel, y_accel, z_accel, temp, w_x, w_y, w_z = mpu9250_i2c.read_profile()    # retrieve acceleration, temperature and angular rate measurements
         x_data.append(x_accel)    # append measurement to array
         y_data.append(y_accel)    # append measurement to array
         z_data.append(z_accel)    # append measurement to array
+        w_data.append((w_x, w_y, w_z))
+        t_data.append(temp)
+        if ring is not None:
+            ring.push([time.time(), x_accel, y_accel, z_accel])    # feed the live view
 
     data = [[np.mean(x_data), np.std(x_data)],    # store mean and standard deviation of x measurements
             [np.mean(y_data), np.std(y_data)],    # store mean and standard deviation of y measurements
             [np.mean(z_data), np.std(z_data)]]    # store mean and standard deviation of z measurements
+    w_data = np.array(w_data)
+    data += [[np.mean(w_data[:, ii]), np.std(w_data[:, ii])] for ii in range(3)]    # and of each gyro axis
+    data += [[np.mean(t_data), np.std(t_data)]]    # and of the temperature
+    data += [[len(x_data)]]    # samples in the window, for the standard error of the means
 
     return data
 
@@ -90,22 +155,70 @@ def save_csv(
 
     # Save true acceleration, 
     # mean measured acceleration, 
-    # and standard deviation to a CSV file.
+    # and standard deviation to a CSV file,
+    # then the gyro means and standard deviations,
+    # the temperature mean and standard deviation
+    # and the number of samples in the window.
 
     file = open(csv_file, 'a')        # means                     # standard devs
     file.write(str(true[0]) + ',' + str(measured[0][0]) + ',' + str(measured[0][1]) + ',' + # x
                str(true[1]) + ',' + str(measured[1][0]) + ',' + str(measured[1][1]) + ',' + # y
-               str(true[2]) + ',' + str(measured[2][0]) + ',' + str(measured[2][1]) + '\n') # z
+               str(true[2]) + ',' + str(measured[2][0]) + ',' + str(measured[2][1]) + ',' + # z
+               str(measured[3][0]) + ',' + str(measured[3][1]) + ',' +     # gyro x
+               str(measured[4][0]) + ',' + str(measured[4][1]) + ',' +     # gyro y
+               str(measured[5][0]) + ',' + str(measured[5][1]) + ',' +     # gyro z
+               str(measured[6][0]) + ',' + str(measured[6][1]) + ',' +     # temperature
+               str(measured[7][0]) + '\n')                                 # samples
     file.close()
 
     return
 
 
+def update_online(
+        rls, measured, true):
+
+    # Add one position's means and standard deviations to the online
+    # (recursive least squares) calibration and show the new bias.
+
+    if rls is None:
+        return
+    rls.update(true, [axis[0] for axis in measured[:3]], [axis[1] for axis in measured[:3]])
+    print("\t   Online bias estimate (g):", np.round(rls.theta[:, 0], 4))
+
+    return
+
+
 
 
 
 if __name__ == '__main__':
     
+    # Optionally load a saved calibration to apply while collecting
+    calib = None
+    if CALIBRATION is not None:
+        from realtime_calib import Calibration
+        calib = Calibration.from_params(CALIBRATION)
+        print("Calibration loaded from", CALIBRATION)
+
+    # Optionally fit the calibration while collecting
+    rls = None
+    if ONLINE:
+        from rls_calib import RLSCalibration
+        rls = RLSCalibration()
+
+    # Optionally start the live view in its own process
+    ring = None
+    if LIVE_VIEW:
+        import live_view    # only loaded when asked for
+        from ring_buffer import SampleRing
+        ring = SampleRing(capacity=4096)    # ~20 seconds of samples
+        viewer = live_view.start_live_view(ring)
+
+    # Optionally time every step of the collection loop
+    if INSTRUMENT:
+        import acq_instrument
+        inst = acq_instrument.Instrument().install(mpu9250_i2c, writer=sys.modules[__name__])
+
     # Open a CSV file for saving six-position data.
     # CSV will save true acceleration, mean acceleration
     # and standard deviation for each accelerometer axis.
@@ -113,7 +226,9 @@ if __name__ == '__main__':
     file = open(six_position_csv, 'a') 
     file.write('x_true (g)' + ',' + 'x_mean (g)' + ',' + 'x_std' + ',' + 
                'y_true (g)' + ',' + 'y_mean (g)' + ',' + 'y_std' + ',' +
-               'z_true (g)' + ',' + 'z_mean (g)' + ',' + 'z_std' + '\n')    # label each column
+               'z_true (g)' + ',' + 'z_mean (g)' + ',' + 'z_std' + ',' +
+               'wx_mean (dps)' + ',' + 'wx_std' + ',' + 'wy_mean (dps)' + ',' + 'wy_std' + ',' +
+               'wz_mean (dps)' + ',' + 'wz_std' + ',' + 'temp_mean (C)' + ',' + 'temp_std' + ',' + 'samples' + '\n')    # label each column
     file.close()
 
 
@@ -124,39 +239,50 @@ if __name__ == '__main__':
 
     # Orientation 1: Z-axis facing up
     input("\t1. Rotate Z up and press enter.")    # pause for user input
-    measured_data = accel_mean_std(total_time=30)    # collect over 30 seconds
+    measured_data = accel_mean_std(total_time=30, ring=ring)    # collect over 30 seconds
     true_data = [0.0, 0.0, 1.0] # ground truth acceleration
     save_csv(six_position_csv, measured_data, true_data)
+    update_online(rls, measured_data, true_data)
 
     # Orientation 2: Z-axis facing down
     input("\t2. Rotate Z down and press enter.")
-    measured_data = accel_mean_std(total_time=30)    
+    measured_data = accel_mean_std(total_time=30, ring=ring)    
     true_data = [0.0, 0.0, -1.0]    
     save_csv(six_position_csv, measured_data, true_data)
+    update_online(rls, measured_data, true_data)
 
     # Orientation 3: Y-axis facing up
     input("\t3. Rotate Y up and press enter.")
-    measured_data = accel_mean_std(total_time=30) 
+    measured_data = accel_mean_std(total_time=30, ring=ring) 
     true_data = [0.0, 1.0, 0.0] 
     save_csv(six_position_csv, measured_data, true_data)
+    update_online(rls, measured_data, true_data)
 
     # Orientation 4: Y-axis facing down
     input("\t4. Rotate Y down and press enter.")
-    measured_data = accel_mean_std(total_time=30) 
+    measured_data = accel_mean_std(total_time=30, ring=ring) 
     true_data = [0.0, -1.0, 0.0] 
     save_csv(six_position_csv, measured_data, true_data)
+    update_online(rls, measured_data, true_data)
 
     # Orientation 5: X-axis facing up
     input("\t5. Rotate X up and press enter.")
-    measured_data = accel_mean_std(total_time=30) 
+    measured_data = accel_mean_std(total_time=30, ring=ring) 
     true_data = [1.0, 0.0, 0.0] 
     save_csv(six_position_csv, measured_data, true_data)
+    update_online(rls, measured_data, true_data)
 
     # Orientation 6: X-axis facing down
     input("\t6. Rotate X down and press enter.")
-    measured_data = accel_mean_std(total_time=30) 
+    measured_data = accel_mean_std(total_time=30, ring=ring) 
     true_data = [-1.0, 0.0, 0.0] 
     save_csv(six_position_csv, measured_data, true_data)
+    update_online(rls, measured_data, true_data)
+
+    if rls is not None and calib is None:
+        from realtime_calib import Calibration
+        calib = Calibration(*rls.bias_scale())    # calibrate the test data with the online fit
+        print("Online calibration applied to the test data")
 
 
 
@@ -167,10 +293,28 @@ if __name__ == '__main__':
     test_csv = 'six_position_test_data.csv'    # CSV file for saving data
     file = open(test_csv, 'a') 
     file.write('Acceleration Data Collected on Level Surface. Z up.' + '\n' + 
-                'time (s)' + 'x (g)' + ',' + 'y (g)' + ',' + 'z (g)' + '\n')    # label each column
+                'time (s)' + ',' + 'x (g)' + ',' + 'y (g)' + ',' + 'z (g)' + ',' + 
+                'wx (dps)' + ',' + 'wy (dps)' + ',' + 'wz (dps)' + ',' + 'temp (C)' + '\n')    # label each column
     file.close()
+
+    calib_csv = None
+    if calib is not None:
+        calib_csv = 'six_position_test_data_calibrated.csv'    # calibrated copy of the test data
+        file = open(calib_csv, 'a') 
+        file.write('Calibrated Acceleration Data Collected on Level Surface. Z up.' + '\n' + 
+                    'time (s)' + ',' + 'x (g)' + ',' + 'y (g)' + ',' + 'z (g)' + ',' + 
+                    'wx (dps)' + ',' + 'wy (dps)' + ',' + 'wz (dps)' + ',' + 'temp (C)' + '\n')    # label each column
+        file.close()
     
-    accel_cal(total_time=60, FILENAME=test_csv)    # collect data for 1 minute and save to CSV
+    accel_cal(total_time=60, FILENAME=test_csv, ring=ring, calib=calib, CALIB_FILENAME=calib_csv)    # collect data for 1 minute and save to CSV
+
+    if ring is not None:
+        ring.close_writer()    # stops the live view
+        viewer.join()
+        ring.release()
+
+    if INSTRUMENT:
+        inst.report('acquisition_profile.json')
 
 
     print("Finished.")
\ No newline at end of file
@@ -0,0 +1,224 @@
+#############################################################################
+# Script Name: drift_kalman.py
+
+# Streaming Kalman filter for the accelerometer bias and displacement drift.
+
+# The two-level method fits a fixed quadratic drift (disp_model) to one
+# recording and subtracts it from another, which fails as soon as the
+# drift changes. Here the drift is tracked while the data streams in. The
+# state of each axis is position, velocity and accelerometer bias:
+#     velocity' = measured_accel - bias (+ noise)
+#     bias'     = random walk
+# Whenever the sensor is detected to be stationary (the acceleration of
+# every axis varies less than still_std over a segment), it takes the
+# pseudo-measurements velocity = 0 and, with hold_position, position =
+# where it stopped. These make the bias observable and keep the
+# displacement error bounded instead of growing with t^2.
+
+# Samples are processed in segments (segment samples, 100 by default).
+# Within a segment the state is propagated with cumulative sums of the
+# measured acceleration (trapezoid rule, as calib_pipeline.integrate), and
+# the covariance with the closed-form transition and process noise of the
+# whole segment. The filter step (and stationary test) runs once per
+# segment, with the three axes updated together as a (3, 3, 3) batch, so
+# its cost per sample is a few additions; 1 kHz input needs ten filter
+# steps per second.
+
+# Accelerations are in m/s/s, with gravity removed (see
+# calib_pipeline.to_m_s_s).
+
+# Usage:
+#     kf = DriftKalman()
+#     for times, accels in blocks:
+#         displacement, bias = kf.process(times, accels)    # (n, 3) each
+#     kf.bias, kf.position, kf.std()
+#     python drift_kalman.py TEST_CSV [--params optim_params.csv] [--seconds 60]
+#############################################################################
+
+import time,argparse
+import numpy as np
+
+
+class DriftKalman:
+
+    # x[axis] = (position, velocity, bias), P[axis] is its 3x3 covariance.
+
+    def __init__(self, accel_noise=0.004, bias_walk=1e-4, bias_std=0.5, zupt_std=0.002,
+                 hold_std=0.001, still_std=0.1, segment=100, hold_position=True):
+
+        # accel_noise: white noise density of the acceleration (m/s/s/sqrt(Hz))
+        # bias_walk: random walk density of the bias (m/s/s/s/sqrt(Hz))
+        # bias_std: initial bias uncertainty (m/s/s)
+        # zupt_std, hold_std: uncertainty of the velocity (m/s) and position
+        #     (m) pseudo-measurements
+        # still_std: largest std of the acceleration (m/s/s) of a stationary segment
+
+        self.accel_noise = accel_noise
+        self.bias_walk = bias_walk
+        self.zupt_std = zupt_std
+        self.hold_std = hold_std
+        self.still_std = still_std
+        self.segment = segment
+        self.hold_position = hold_position
+
+        self.x = np.zeros((3, 3))
+        self.P = np.tile(np.diag([0.0, 0.0, bias_std**2]), (3, 1, 1))
+        self.hold = None          # position held while stationary
+        self._last = None         # time and acceleration of the last sample
+        self.updates = 0
+
+    @property
+    def position(self):
+        return self.x[:, 0]
+
+    @property
+    def velocity(self):
+        return self.x[:, 1]
+
+    @property
+    def bias(self):
+        return self.x[:, 2]
+
+    def std(self):
+
+        # Standard deviation of position, velocity and bias, (3 axes, 3).
+
+        return np.sqrt(np.diagonal(self.P, axis1=1, axis2=2))
+
+    @staticmethod
+    def transition(T):
+
+        # Transition of (position, velocity, bias) over T seconds.
+
+        return np.array([[1.0, T, -T*T/2],
+                         [0.0, 1.0, -T],
+                         [0.0, 0.0, 1.0]])
+
+    def process_noise(self, T):
+
+        # Process noise accumulated over T seconds: white acceleration noise
+        # on the velocity and a random walk of the bias.
+
+        qa, qb = self.accel_noise**2, self.bias_walk**2
+        T2, T3, T4, T5 = T**2, T**3, T**4, T**5
+
+        return (qa * np.array([[T3/3, T2/2, 0.0], [T2/2, T, 0.0], [0.0, 0.0, 0.0]]) +
+                qb * np.array([[T5/20, T4/8, -T3/6], [T4/8, T3/3, -T2/2], [-T3/6, -T2/2, T]]))
+
+    def propagate(self, times, accels):
+
+        # Propagate the state through one segment of samples. Returns the
+        # (n, 3) position at every sample.
+
+        if self._last is None:
+            self._last = (times[0], accels[0])
+        t0, a0 = self._last
+        t = np.concatenate(([t0], times))
+        a = np.concatenate((a0[None], accels))
+        tau = (t - t0)[1:, None]
+
+        # Trapezoid rule, continuing from the previous segment's last sample
+        dt = np.diff(t)[:, None]
+        velocity = np.cumsum((a[1:] + a[:-1]) / 2 * dt, axis=0)
+        v_prev = np.concatenate((np.zeros((1, 3)), velocity[:-1]))
+        position = np.cumsum((velocity + v_prev) / 2 * dt, axis=0)
+
+        p0, v0, b = self.x[:, 0], self.x[:, 1], self.x[:, 2]
+        positions = p0 + v0 * tau + position - b * tau**2 / 2
+        self.x[:, 0] = positions[-1]
+        self.x[:, 1] = v0 + velocity[-1] - b * tau[-1]
+
+        F = self.transition(tau[-1, 0])
+        self.P = F @ self.P @ F.T + self.process_noise(tau[-1, 0])
+        self._last = (times[-1], accels[-1])
+
+        return positions
+
+    def stationary(self, accels):
+
+        # Whether a segment of (n, 3) accelerations is stationary.
+
+        return len(accels) > 1 and np.max(np.std(accels, axis=0)) < self.still_std
+
+    def update_stationary(self):
+
+        # Pseudo-measurements while stationary: velocity = 0 and, with
+        # hold_position, position = where the sensor stopped. All three axes
+        # are updated together.
+
+        if self.hold_position:
+            if self.hold is None:
+                self.hold = self.x[:, 0].copy()
+            H = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+            R = np.diag([self.hold_std**2, self.zupt_std**2])
+            z = np.column_stack((self.hold, np.zeros(3)))     # (3, 2)
+        else:
+            H = np.array([[0.0, 1.0, 0.0]])
+            R = np.array([[self.zupt_std**2]])
+            z = np.zeros((3, 1))
+
+        PHt = self.P @ H.T                                    # (3, 3, m)
+        S = H @ PHt + R                                       # (3, m, m)
+        K = PHt @ np.linalg.inv(S)                            # (3, 3, m)
+        innovation = z - self.x @ H.T                         # (3, m)
+        self.x += np.einsum('aij,aj->ai', K, innovation)
+        self.P -= K @ H @ self.P
+        self.P = (self.P + self.P.transpose(0, 2, 1)) / 2    # keep it symmetric
+        self.updates += 1
+
+        return
+
+    def process(self, times, accels):
+
+        # Run the filter over a block of samples (any length). Returns the
+        # (n, 3) drift-corrected displacement and the (n, 3) bias estimate
+        # in effect at each sample.
+
+        times = np.asarray(times, dtype=float)
+        accels = np.asarray(accels, dtype=float)
+        displacement = np.empty_like(accels)
+        bias = np.empty_like(accels)
+        for start in range(0, len(times), self.segment):
+            end = min(start + self.segment, len(times))
+            bias[start:end] = self.x[:, 2]
+            displacement[start:end] = self.propagate(times[start:end], accels[start:end])
+            if self.stationary(accels[start:end]):
+                self.update_stationary()
+            else:
+                self.hold = None
+
+        return displacement, bias
+
+
+
+if __name__ == '__main__':
+
+    from calib_pipeline import load_recording, load_params, model_3, apply_accel_model, to_m_s_s, integrate
+
+    parser = argparse.ArgumentParser(description="Track the bias and drift of a recording with a Kalman filter.")
+    parser.add_argument('test_csv', help="recording in the collectors' CSV layout")
+    parser.add_argument('--params', help="calibrate with the model 3 row of this optim_params CSV file first")
+    parser.add_argument('--seconds', type=float, help="use only the first seconds of the recording")
+    parser.add_argument('--block', type=int, default=1000, help="samples per block fed to the filter")
+    parser.add_argument('--no-hold', action='store_true', help="only zero-velocity updates while stationary")
+    args = parser.parse_args()
+
+    times, accels = load_recording(args.test_csv, args.seconds)
+    if args.params:
+        accels = apply_accel_model(accels, *model_3(load_params(args.params)))
+    accels = to_m_s_s(accels)
+
+    kf = DriftKalman(hold_position=not args.no_hold)
+    start = time.perf_counter()
+    results = [kf.process(times[ii:ii+args.block], accels[ii:ii+args.block]) for ii in range(0, len(times), args.block)]
+    elapsed = time.perf_counter() - start
+    displacement = np.concatenate([r[0] for r in results])
+
+    raw = integrate(times, accels)[-1]
+    print(f"{len(times)} samples ({times[-1] - times[0]:.0f} s) in {elapsed*1e3:.1f} ms: "
+          f"{len(times)/elapsed:.0f} samples/s, {kf.updates} stationary updates")
+    print(f"Bias estimate (m/s/s): {kf.bias[0]:.5f}, {kf.bias[1]:.5f}, {kf.bias[2]:.5f}  "
+          f"(std {kf.std()[0, 2]:.1e}, {kf.std()[1, 2]:.1e}, {kf.std()[2, 2]:.1e})")
+    print(f"Integrated Final Displacement: {raw[0]:0.3f}, {raw[1]:0.3f}, {raw[2]:0.3f}")
+    print(f"Kalman Final Displacement: {displacement[-1, 0]:0.3f}, {displacement[-1, 1]:0.3f}, {displacement[-1, 2]:0.3f}")
+    print(f"Kalman Max Displacement: {np.max(np.abs(displacement)):0.3f}")
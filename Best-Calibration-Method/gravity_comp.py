@@ -0,0 +1,145 @@
+#############################################################################
+# Script Name: gravity_comp.py
+
+# Gravity compensation from the estimated tilt of the sensor.
+
+# The calibration scripts remove gravity by subtracting 9.797 m/s/s from
+# the z axis, which assumes z points exactly up. A tilt of a fraction of a
+# degree leaks g*sin(tilt) into x and y, and double integrated that error
+# dominates the displacement. Here the gravity vector is estimated in the
+# sensor frame instead, from the mean acceleration of an initial static
+# window (scaled to 9.797 m/s/s, so only its direction is taken from the
+# data), and subtracted from every sample with one broadcast subtraction.
+
+# GravityCompensator does the same on a stream of blocks. Until the static
+# window is complete, each sample uses the mean of the samples so far.
+# With tau (s), the tilt is tracked instead: gravity is the acceleration
+# low-passed with time constant tau, so a slowly changing mounting
+# orientation is followed (as is any real acceleration slower than tau).
+# Tracking starts from the static window's estimate, or from the first
+# sample without a window, so give both for a clean start.
+
+# Accelerations are calibrated, in m/s/s, with gravity still in them
+# (calib_pipeline.to_m_s_s with gravity_axis=None).
+
+# Usage:
+#     gravity = estimate_gravity(accels[:n])       # (3,) m/s/s
+#     accels = compensate(accels, gravity)
+#     comp = GravityCompensator(window=900)        # or window=900, tau=30.0
+#     for times, accels in blocks:
+#         accels = comp.process(times, accels)
+#############################################################################
+
+import numpy as np
+
+
+GRAVITY = 9.797    # m/s/s
+
+
+def estimate_gravity(accels, normalize=True):
+
+    # Gravity vector (m/s/s, sensor frame) from static (n, 3) accelerations,
+    # scaled to GRAVITY unless normalize is False.
+
+    gravity = np.mean(accels, axis=0)
+    if normalize:
+        gravity = gravity * GRAVITY / np.linalg.norm(gravity)
+
+    return gravity
+
+
+def tilt(gravity):
+
+    # Angle (deg) between the gravity vector and each sensor axis' direction
+    # of "up" -- 0 for the axis facing straight up.
+
+    gravity = np.asarray(gravity, dtype=float)
+
+    return np.degrees(np.arccos(np.clip(gravity / np.linalg.norm(gravity, axis=-1, keepdims=True), -1, 1)))
+
+
+def compensate(accels, gravity):
+
+    # Subtract a (3,) gravity vector, or one (n, 3) vector per sample.
+
+    return accels - gravity
+
+
+def _normalize(gravity):
+    return gravity * GRAVITY / np.linalg.norm(gravity, axis=-1, keepdims=True)
+
+
+class GravityCompensator:
+
+    # Streaming gravity compensation of (n, 3) blocks.
+
+    def __init__(self, window=None, tau=None, normalize=True):
+
+        # window: samples in the initial static window (None: all samples
+        #     until tracking starts, or until the end without tau)
+        # tau: time constant (s) of the tilt tracking, None for a fixed tilt
+
+        self.window = window
+        self.tau = tau
+        self.normalize = normalize
+        self.count = 0
+        self.sum = np.zeros(3)
+        self.gravity = None        # current estimate
+        self._last_time = None
+
+    def _static(self, accels):
+
+        # Gravity of each sample while the static window fills: the mean of
+        # the window so far (cumulative sums, vectorized over the block).
+
+        limit = len(accels) if self.window is None else max(0, min(len(accels), self.window - self.count))
+        sums = self.sum + np.cumsum(accels[:limit], axis=0)
+        counts = self.count + np.arange(1, limit + 1)
+        gravity = np.empty_like(accels)
+        gravity[:limit] = sums / counts[:, None]
+        if limit:
+            self.sum, self.count = sums[-1], counts[-1]
+            self.gravity = gravity[limit - 1]
+        gravity[limit:] = self.gravity
+
+        return gravity
+
+    def _track(self, times, accels):
+
+        # Gravity of each sample as the acceleration low-passed with time
+        # constant tau (first order, with the block's mean time step),
+        # starting from the current estimate.
+
+        from scipy.signal import lfilter    # SciPy is loaded on first use
+
+        if self.gravity is None:
+            self.gravity = accels[0].copy()
+        last_time = times[0] if self._last_time is None else self._last_time
+        alpha = 1 - np.exp(-(times[-1] - last_time) / len(times) / self.tau)
+        gravity, _ = lfilter([alpha], [1, alpha - 1], accels, axis=0, zi=((1 - alpha) * self.gravity)[None])
+        self.gravity = gravity[-1]
+
+        return gravity
+
+    def process(self, times, accels):
+
+        # Remove gravity from a block. Returns the (n, 3) compensated block
+        # (an empty block, e.g. from a non-blocking read, unchanged).
+
+        times = np.asarray(times, dtype=float)
+        accels = np.asarray(accels, dtype=float)
+        if len(accels) == 0:
+            return accels
+        if self.tau is None:
+            gravity = self._static(accels)
+        else:
+            head = 0 if self.window is None else max(0, min(len(accels), self.window - self.count))    # rest of the static window
+            gravity = np.empty_like(accels)
+            gravity[:head] = self._static(accels[:head])
+            if head < len(accels):
+                gravity[head:] = self._track(times[head:], accels[head:])
+        self._last_time = times[-1]
+        if self.normalize:
+            gravity = _normalize(gravity)
+
+        return accels - gravity
@@ -0,0 +1,117 @@
+#############################################################################
+# Script Name: live_view.py
+
+# Live plot of the accelerometer while data is being collected.
+
+# The view runs in its own (low priority) process and reads the newest
+# samples from the acquisition ring buffer (ring_buffer.py), so drawing never
+# slows down the sampling loop. It shows a scrolling plot of the last few
+# seconds of x, y and z acceleration, the running mean and standard deviation
+# of each axis, and the achieved sample rate. Only the changing artists are
+# redrawn each frame (blitting), which keeps it near 20 frames per second on
+# a Raspberry Pi.
+
+# Usage from a collector:
+#     ring = SampleRing()
+#     viewer = start_live_view(ring)
+#     ... ring.push([time.time(), x, y, z]) for every sample ...
+#     ring.close_writer(); viewer.join(); ring.release()
+#############################################################################
+
+import os,time
+import multiprocessing
+import numpy as np
+from ring_buffer import SampleRing
+
+
+def run_dashboard(ring_name, capacity, width, window=10.0, fps=20, max_frames=None):
+
+    # Body of the viewer process. Attach to the ring, draw the figure once,
+    # then redraw only the lines and text at `fps` until the window is closed
+    # or the writer closes the ring. `window` is the plotted time span (s).
+
+    import matplotlib.pyplot as plt    # only the viewer process needs matplotlib
+
+    try:
+        os.nice(10)    # the sampling loop always wins the CPU
+    except OSError:
+        pass
+
+    ring = SampleRing(capacity, width, name=ring_name)
+    colors = ['r', 'b', 'g']
+    labels = ['X', 'Y', 'Z']
+
+    fig, axs = plt.subplots(3, 1, sharex=True)
+    lines, stats = [], []
+    for ii in range(3):
+        lines.append(axs[ii].plot([], [], color=colors[ii], linewidth=0.8, animated=True)[0])
+        stats.append(axs[ii].text(0.01, 0.95, '', transform=axs[ii].transAxes, va='top', animated=True))
+        axs[ii].set_ylabel(labels[ii] + ' Accel. [g]')
+        axs[ii].set_xlim(-window, 0)
+    axs[2].set_xlabel('Time (seconds before now)')
+    rate = axs[0].set_title('', animated=True)
+    artists = lines + stats + [rate]
+
+    plt.show(block=False)
+    plt.pause(0.1)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+
+    period = 1.0 / fps
+    frames = 0
+    while plt.fignum_exists(fig.number) and not ring.closed:
+        frame_start = time.perf_counter()
+
+        rows, count = ring.latest(capacity)
+        if len(rows) > 1:
+            rows = rows[rows[:, 0] >= rows[-1, 0] - window]    # samples inside the window
+            rel_t = rows[:, 0] - rows[-1, 0]
+            rescale = False
+            for ii in range(3):
+                values = rows[:, ii+1]
+                mean, std = np.mean(values), np.std(values)
+                lines[ii].set_data(rel_t, values)
+                stats[ii].set_text(f"mean = {mean:.4f} g, std = {std:.4f} g")
+
+                # Re-center the axis when the data leaves it or becomes a thin line in it
+                low, high = axs[ii].get_ylim()
+                span = max(values.max() - values.min(), 1e-3)
+                if values.min() < low or values.max() > high or span < 0.05*(high - low):
+                    half = max(3*span, 0.02)
+                    axs[ii].set_ylim(mean - half, mean + half)
+                    rescale = True
+
+            if rows[-1, 0] > rows[0, 0]:
+                rate.set_text(f"{(len(rows) - 1) / (rows[-1, 0] - rows[0, 0]):.1f} Hz, {count} samples")
+            if rescale:    # axis limits changed: redraw the static parts once
+                fig.canvas.draw()
+                background = fig.canvas.copy_from_bbox(fig.bbox)
+
+        fig.canvas.restore_region(background)
+        for artist in artists:
+            fig.draw_artist(artist)
+        fig.canvas.blit(fig.bbox)
+        fig.canvas.flush_events()
+
+        frames += 1
+        if max_frames is not None and frames >= max_frames:
+            break
+        time.sleep(max(0.0, period - (time.perf_counter() - frame_start)))
+
+    plt.close(fig)
+    ring.release()
+
+    return
+
+
+def start_live_view(ring, window=10.0, fps=20):
+
+    # Start the live view for `ring` in a separate process and return the
+    # process. The process is forked so it does not re-run the collector's
+    # IMU start-up code; it exits when the ring's writer is closed.
+
+    context = multiprocessing.get_context('fork')
+    viewer = context.Process(target=run_dashboard, args=(ring.name, ring.capacity, ring.width, window, fps), daemon=True)
+    viewer.start()
+
+    return viewer
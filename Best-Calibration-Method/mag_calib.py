@@ -0,0 +1,174 @@
+#############################################################################
+# Script Name: mag_calib.py
+
+# Hard and soft iron calibration of the AK8963 magnetometer.
+
+# Samples of the magnetic field taken while the sensor is turned through
+# many orientations lie on an ellipsoid: shifted by the hard iron offset
+# (the center) and stretched by soft iron and the axes' differing
+# sensitivities. The correction maps it back onto a sphere with the radius
+# of the local field:
+#     field = soft_iron @ (measured - center)
+# fit_ellipsoid() solves it in two steps:
+#     1. Algebraic fit: the quadric through all samples is one linear
+#        least squares solve (9 unknowns), giving the center and shape in
+#        closed form.
+#     2. Gauss-Newton refinement of the geometric error
+#        |soft_iron @ (m - center)| - field, with the Jacobian of all
+#        samples built as one (n, 9) array per iteration.
+# 20000 samples take about 20 ms.
+
+# MagCalibration applies the correction, and the factory sensitivity
+# adjustment (ASAX) for samples read without it, as one matrix product
+# and offset per block. mpu9250_i2c.AK8963_conv applies ASAX itself, so
+# asa is only needed for samples recorded before it did.
+
+# Usage:
+#     calib = fit_ellipsoid(mags)                 # (n, 3) uT
+#     field = calib.apply(mags)                   # (n, 3), |field| ~ calib.field
+#     calib.save('mag_params.csv'); MagCalibration.load('mag_params.csv')
+#     python mag_calib.py MAG_CSV [--params mag_params.csv] [--asa 1.18 1.19 1.14]
+#############################################################################
+
+import argparse
+import numpy as np
+
+
+class MagCalibration:
+
+    def __init__(self, center, soft_iron, field, asa=None):
+
+        # center: hard iron offset (uT), soft_iron: symmetric 3x3 matrix,
+        # field: radius of the corrected sphere (uT), asa: ASAX, ASAY, ASAZ
+        # coefficients to apply first (None if already applied)
+
+        self.center = np.asarray(center, dtype=float)
+        self.soft_iron = np.asarray(soft_iron, dtype=float)
+        self.field = float(field)
+        self.asa = np.ones(3) if asa is None else np.asarray(asa, dtype=float)
+
+        # field = soft_iron @ (asa * measured - center) = measured @ matrix.T - offset
+        self.matrix = self.soft_iron * self.asa
+        self.offset = self.soft_iron @ self.center
+
+    def apply(self, mags):
+
+        # Correct an (n, 3) block of magnetometer samples.
+
+        return np.asarray(mags, dtype=float) @ self.matrix.T - self.offset
+
+    def save(self, FILENAME, TITLE='Magnetometer Calibration'):
+
+        # One row: center, soft iron matrix (row by row), field, asa.
+
+        file = open(FILENAME, 'w')
+        file.write(TITLE + '\n')
+        file.write('c_x, c_y, c_z, Wxx, Wxy, Wxz, Wyx, Wyy, Wyz, Wzx, Wzy, Wzz, field, asa_x, asa_y, asa_z \n')
+        row = np.concatenate((self.center, self.soft_iron.ravel(), [self.field], self.asa))
+        file.write(','.join(repr(float(value)) for value in row) + '\n')
+        file.close()
+
+        return
+
+    @classmethod
+    def load(cls, FILENAME):
+
+        row = np.loadtxt(FILENAME, skiprows = 2, delimiter=",", dtype=float)
+
+        return cls(row[0:3], row[3:12].reshape(3, 3), row[12], row[13:16])
+
+
+def fit_algebraic(mags):
+
+    # Closed-form ellipsoid fit: least squares quadric
+    #     A x^2 + B y^2 + C z^2 + 2D xy + 2E xz + 2F yz + 2G x + 2H y + 2I z = 1
+    # Returns the center, the symmetric soft iron matrix and the field
+    # (the radius after correction).
+
+    x, y, z = mags.T
+    design = np.column_stack((x*x, y*y, z*z, 2*x*y, 2*x*z, 2*y*z, 2*x, 2*y, 2*z))
+    A, B, C, D, E, F, G, H, I = np.linalg.lstsq(design, np.ones(len(mags)), rcond=None)[0]
+
+    shape = np.array([[A, D, E], [D, B, F], [E, F, C]])
+    center = -np.linalg.solve(shape, [G, H, I])
+    shape = shape / (1 + center @ shape @ center)    # (m - c)^T shape (m - c) = 1 on the ellipsoid
+
+    values, vectors = np.linalg.eigh(shape)
+    if np.any(values <= 0):
+        raise ValueError("samples do not fit an ellipsoid; turn the sensor through more orientations")
+    soft_iron = vectors @ np.diag(np.sqrt(values)) @ vectors.T    # maps the ellipsoid onto the unit sphere
+    radius = np.prod(1 / np.sqrt(values)) ** (1/3)                 # geometric mean of the semi-axes (uT)
+
+    return center, soft_iron * radius, radius    # onto a sphere of that radius, determinant 1
+
+
+def _unpack(params):
+
+    center = params[:3]
+    a, b, c, d, e, f = params[3:]
+
+    return center, np.array([[a, d, e], [d, b, f], [e, f, c]])
+
+
+def refine(mags, center, soft_iron, field, iterations=10, tol=1e-10):
+
+    # Gauss-Newton refinement of |soft_iron @ (m - center)| - field over the
+    # center and the six soft iron terms, field held fixed (it only sets the
+    # scale). The Jacobian of all samples is built at once.
+
+    W = soft_iron
+    params = np.concatenate((center, [W[0, 0], W[1, 1], W[2, 2], W[0, 1], W[0, 2], W[1, 2]]))
+    pairs = [(0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2)]
+    for _ in range(iterations):
+        center, W = _unpack(params)
+        d = mags - center                          # (n, 3)
+        u = d @ W                                  # W is symmetric
+        norm = np.linalg.norm(u, axis=1)
+        residual = norm - field
+
+        jacobian = np.empty((len(mags), 9))
+        jacobian[:, :3] = -(u @ W) / norm[:, None]
+        for col, (j, k) in enumerate(pairs, start=3):
+            if j == k:
+                jacobian[:, col] = u[:, j] * d[:, j] / norm
+            else:
+                jacobian[:, col] = (u[:, j] * d[:, k] + u[:, k] * d[:, j]) / norm
+        step = np.linalg.lstsq(jacobian, -residual, rcond=None)[0]
+        params = params + step
+        if np.max(np.abs(step)) < tol * max(1.0, np.max(np.abs(params))):
+            break
+
+    return _unpack(params) + (field,)
+
+
+def fit_ellipsoid(mags, asa=None, iterations=10):
+
+    # Fit the hard and soft iron correction to (n, 3) samples (uT). If the
+    # samples lack the ASAX adjustment, give it as asa; it is applied before
+    # fitting and folded into the returned calibration's matrix.
+
+    mags = np.asarray(mags, dtype=float)
+    adjusted = mags if asa is None else mags * asa
+    center, soft_iron, field = refine(adjusted, *fit_algebraic(adjusted), iterations=iterations)
+
+    return MagCalibration(center, soft_iron, field, asa)
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Fit the hard and soft iron correction of the magnetometer.")
+    parser.add_argument('mag_csv', help="CSV (2 header lines): time, mx, my, mz (uT), taken while turning the sensor")
+    parser.add_argument('--asa', type=float, nargs=3, help="ASAX, ASAY, ASAZ, if the samples were read without them")
+    parser.add_argument('--params', default='mag_params.csv', help="save the calibration here")
+    args = parser.parse_args()
+
+    mags = np.loadtxt(args.mag_csv, skiprows = 2, delimiter=",", dtype=float, ndmin=2)[:, 1:4]
+    calib = fit_ellipsoid(mags, args.asa)
+    radius = np.linalg.norm(calib.apply(mags), axis=1)
+    print("Hard iron offset (uT):", np.round(calib.center, 3))
+    print("Soft iron matrix:\n", np.round(calib.soft_iron / calib.field, 5))
+    print(f"Field: {calib.field:.2f} uT, corrected radius std: {np.std(radius):.3f} uT "
+          f"(raw: {np.std(np.linalg.norm(mags - np.mean(mags, axis=0), axis=1)):.3f} uT)")
+    calib.save(args.params)
+    print("Saved", args.params)
@@ -0,0 +1,183 @@
+#############################################################################
+# Script Name: model_compare.py
+
+# Compares many calibrations of one recording in a single pass.
+
+# Every accelerometer model used here is affine in the measured
+# acceleration: model 1 subtracts a bias, model 2 also divides by scale
+# factors, and model 3 multiplies by the inverse scale factor matrix.
+# Each variant (raw data, or a model with a set of parameters) is reduced
+# to a bias vector and a 3x3 matrix, with the conversion to m/s/s and the
+# gravity removal folded in, so K variants are calibrated together:
+#     accel_calib[k] = (measured - bias[k]) @ matrix[k] * g - gravity
+# calibrate_stack() does this as one broadcast (K, N, 3) product, and
+# stack_stats() and integrate_stack() reduce and integrate the whole stack
+# at once. compare_variants() goes further: since the calibration is affine
+# and integration is linear, the recording is integrated and reduced only
+# once and each variant costs a few 3x3 products, so comparing dozens of
+# parameter sets costs about as much as calibrating once.
+
+# Usage:
+#     names, biases, matrices = variants_from_params(param_data)
+#     result = compare_variants(times, accels, biases, matrices, full=True)
+#     result['means'], result['stds'], result['final_displacement']    # (K, 3)
+#     result['displacement']                                           # (K, N, 3) m
+#     stack = calibrate_stack(accels, biases, matrices)                # (K, N, 3) m/s/s
+#     python model_compare.py TEST_CSV PARAMS_CSV [PARAMS_CSV ...]
+#############################################################################
+
+import os,argparse
+import numpy as np
+from scipy_compat import cumtrapz
+
+
+GRAVITY = 9.797    # m/s/s
+MODEL_NAMES = ['Bias Calibrated', 'Add Scale Factors', 'Add Misalignments']
+
+
+def variant(bias=None, scale_f=None):
+
+    # Bias and matrix of one variant. scale_f is None (model 1), a vector
+    # of scale factors (model 2) or the scale factor matrix, transposed the
+    # way misalignment_model expects it (model 3). No bias is raw data.
+
+    bias = np.zeros(3) if bias is None else np.asarray(bias, dtype=float)
+    if scale_f is None:
+        matrix = np.eye(3)
+    elif np.ndim(scale_f) == 1:
+        matrix = np.diag(1 / np.asarray(scale_f, dtype=float))
+    else:
+        matrix = np.linalg.inv(scale_f)
+
+    return bias, matrix
+
+
+def variants_from_params(param_data, raw=True, prefix=''):
+
+    # The variants of an optim_params file's three rows (models 1-3),
+    # preceded by the raw data if raw is True. Returns names, (K, 3) biases
+    # and (K, 3, 3) matrices.
+
+    variants = [variant(param_data[0, 0:3]),
+                variant(param_data[1, 0:3], param_data[1, 3:6]),
+                variant(param_data[2, 0:3], np.array([param_data[2, 3:6], param_data[2, 6:9], param_data[2, 9:12]]).T)]
+    names = [prefix + name for name in MODEL_NAMES]
+    if raw:
+        variants.insert(0, variant())
+        names.insert(0, prefix + 'Uncalibrated Data')
+
+    return names, np.array([v[0] for v in variants]), np.array([v[1] for v in variants])
+
+
+def affine_terms(biases, matrices, gravity_axis=2):
+
+    # Fold the bias, the conversion to m/s/s and the gravity removal into
+    # (K, 3, 3) matrices and (K, 3) offsets, so that for every variant
+    #     accel_calib[k] = measured @ matrices[k] - offsets[k]
+
+    matrices = np.asarray(matrices, dtype=float) * GRAVITY
+    offsets = np.einsum('ki,kij->kj', biases, matrices)    # bias term, after the matrix
+    if gravity_axis is not None:
+        offsets[:, gravity_axis] += GRAVITY
+
+    return matrices, offsets
+
+
+def calibrate_stack(accels, biases, matrices, gravity_axis=2):
+
+    # Calibrate (N, 3) accelerations (g) with K variants at once. Returns
+    # the (K, N, 3) acceleration in m/s/s with gravity removed from the axis
+    # facing up (gravity_axis=None to keep it).
+
+    matrices, offsets = affine_terms(biases, matrices, gravity_axis)
+    stack = np.matmul(accels, matrices)    # (N, 3) @ (K, 3, 3) -> (K, N, 3)
+    stack -= offsets[:, None, :]
+
+    return stack
+
+
+def stack_stats(stack):
+
+    # Mean and standard deviation of every variant and axis, (K, 3) each.
+
+    return np.mean(stack, axis=1), np.std(stack, axis=1)
+
+
+def integrate_stack(times, stack):
+
+    # Integrate a (K, N, 3) stack twice over time (trapezoid rule, starting
+    # from zero). Returns the (K, N, 3) displacement.
+
+    velocity = cumtrapz(stack, x=times, axis=1, initial=0)
+
+    return cumtrapz(velocity, x=times, axis=1, initial=0)
+
+
+def compare_variants(times, accels, biases, matrices, gravity_axis=2, full=False):
+
+    # Statistics and displacement of K variants without calibrating the
+    # recording K times. Calibration is affine and integration, means and
+    # covariances are linear, so the recording (and a constant) is reduced
+    # and integrated once, and each variant only costs a few 3x3 products:
+    #     mean[k]         = mean(measured) @ M[k] - offset[k]
+    #     std[k]^2        = diag(M[k]^T cov(measured) M[k])
+    #     displacement[k] = D(measured) @ M[k] - D(1) * offset[k]
+    # where D() is the double integration. Returns (K, 3) means, stds and
+    # final displacements, and the (K, N, 3) displacement if full is True.
+
+    matrices, offsets = affine_terms(biases, matrices, gravity_axis)
+    mean = np.mean(accels, axis=0)
+    centered = accels - mean
+    covariance = centered.T @ centered / len(accels)
+
+    # Integrate the recording and a constant of 1 together, as a (1, N, 4) stack
+    integrated = integrate_stack(times, np.column_stack((accels, np.ones(len(accels))))[None])[0]
+    disp_accels, disp_one = integrated[:, :3], integrated[:, 3]
+
+    variance = np.einsum('kij,il,klj->kj', matrices, covariance, matrices)    # diag(M^T C M) of every variant
+    result = {'means': mean @ matrices - offsets,
+              'stds': np.sqrt(np.maximum(variance, 0)),
+              'final_displacement': disp_accels[-1] @ matrices - disp_one[-1] * offsets}
+    if full:
+        result['displacement'] = np.matmul(disp_accels, matrices) - disp_one[None, :, None] * offsets[:, None, :]
+
+    return result
+
+
+def print_comparison(names, means, stds, final_displacement):
+
+    # Print the statistics and (K, 3) final displacement of every variant.
+
+    width = max(len(name) for name in names)
+    print("Statistical Analysis")
+    for name, mean, std in zip(names, means, stds):
+        print(f"{name:<{width}} (mean, std): x({mean[0]:.4f}, {std[0]:.4f}),",
+              f"y({mean[1]:.4f}, {std[1]:.4f}),", f"z({mean[2]:.4f}, {std[2]:.4f})")
+    for name, final in zip(names, final_displacement):
+        print(f"{name + ':':<{width + 1}} {final[0]:0.0f}, {final[1]:0.0f}, {final[2]:0.0f}")
+
+    return
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Compare the models of one or more optim_params files on one recording.")
+    parser.add_argument('test_csv', help="recording in the collectors' CSV layout")
+    parser.add_argument('params_csvs', nargs='+', help="optim_params CSV files")
+    args = parser.parse_args()
+
+    accel_data = np.loadtxt(args.test_csv, skiprows = 2, delimiter=",", dtype=float)
+    time_array, accels = accel_data[:, 0], accel_data[:, 1:4]
+
+    names, biases, matrices = ['Uncalibrated Data'], [np.zeros((1, 3))], [np.eye(3)[None]]
+    for params_csv in args.params_csvs:
+        param_data = np.loadtxt(params_csv, skiprows = 2, delimiter=",", dtype=float)
+        prefix = os.path.splitext(os.path.basename(params_csv))[0] + ' ' if len(args.params_csvs) > 1 else ''
+        n, b, m = variants_from_params(param_data, raw=False, prefix=prefix)
+        names += n
+        biases.append(b)
+        matrices.append(m)
+
+    result = compare_variants(time_array, accels, np.concatenate(biases), np.concatenate(matrices))
+    print_comparison(names, result['means'], result['stds'], result['final_displacement'])
@@ -0,0 +1,269 @@
+#############################################################################
+# Script Name: model_select.py
+
+# Cross-validated selection between accelerometer error models.
+
+# Every model is linear in its parameters: for each axis, the measured mean
+# acceleration is a weighted sum of columns built from the true
+# orientation (and, when recorded, the temperature). The models are kept in
+# a registry, MODELS, so a new model is one function:
+#     @register('name')
+#     def name(true, axis, temp):
+#         return [np.ones(len(true)), true[:, axis], ...]    # design columns
+# (or (columns, offset) when part of the measurement is known, as the true
+# acceleration in bias_model's measured = true + bias),
+# with bias, scale_factor and misalignment matching bias_model,
+# scale_factor_model and misalignment_model of two_levels_calib.py, plus
+# higher order terms (a quadratic nonlinearity, a temperature
+# coefficient, the temperature model of temp_calib.py).
+
+# Each model's weighted design matrices (one per axis, weights 1/std as
+# curve_fit uses them) are built once and shared by every fold. Each model
+# is then scored on a process pool:
+#     AIC, BIC       from the weighted residuals of the fit to all positions
+#     CV residual    RMS error of the held-out means, with leave-one-
+#                    position-out (all rows of one orientation, across
+#                    trials) or k-fold cross validation
+#     CV drift       the displacement that held-out error integrates to
+#                    over `seconds` (1/2 * error * g * t^2)
+# Several six-position files (trials) can be pooled. The k folds never
+# hold out both poles of an axis (+x and -x), which would leave that axis's
+# scale factor unconstrained. A model whose design loses rank when a fold is
+# held out (the quadratic term, leave-one-position-out) cannot be fitted
+# on that fold: it is reported as unidentifiable, not scored with a
+# minimum-norm solution.
+
+# Usage:
+#     python model_select.py data/trial_*/six_position_data_*.csv
+#     python model_select.py SIX_POS_CSV [...] --folds 3 --seconds 60 --workers 4
+#############################################################################
+
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+GRAVITY = 9.797    # m/s/s
+MODELS = {}        # name -> function(true, axis, temp) returning the design columns
+
+
+def register(name):
+
+    # Decorator adding a model to MODELS.
+
+    def add(columns):
+        MODELS[name] = columns
+        return columns
+
+    return add
+
+
+@register('bias')
+def bias(true, axis, temp):
+    return [np.ones(len(true))], true[:, axis]    # measured - true = bias
+
+
+@register('scale_factor')
+def scale_factor(true, axis, temp):
+    return [np.ones(len(true)), true[:, axis]]
+
+
+@register('misalignment')
+def misalignment(true, axis, temp):
+    return [np.ones(len(true)), true[:, 0], true[:, 1], true[:, 2]]
+
+
+@register('quadratic')
+def quadratic(true, axis, temp):
+    return misalignment(true, axis, temp) + [true[:, axis]**2]
+
+
+@register('temperature')
+def temperature(true, axis, temp):
+    if temp is None:
+        return None    # needs a temperature column
+    return misalignment(true, axis, temp) + [temp - np.mean(temp)]
+
+
+@register('temperature_scale')
+def temperature_scale(true, axis, temp):
+    if temp is None:
+        return None    # as temp_calib.py: quadratic bias(T), linear S(T)
+    dT = temp - np.mean(temp)
+    return misalignment(true, axis, temp) + [dT, dT**2] + [dT * true[:, j] for j in range(3)]
+
+
+
+#############################
+# Data and design matrices
+#############################
+
+def load_positions(csv_files):
+
+    # Pool six-position files. Returns the (N, 3) true orientations, (N, 3)
+    # means and stds, the (N,) temperature (None unless every file has a
+    # column whose header starts with 'temp') and an (N,) orientation label
+    # per row.
+
+    data, temps = [], []
+    for csv_file in csv_files:
+        with open(csv_file) as file:
+            header = [name.strip().lower() for name in file.readline().split(',')]
+        read_data = np.loadtxt(csv_file, skiprows = 1, delimiter=",", dtype=float, ndmin=2)
+        data.append(read_data[:, :9])
+        columns = [ii for ii, name in enumerate(header) if name.startswith('temp')]
+        temps.append(read_data[:, columns[0]] if columns else None)
+    data = np.concatenate(data)
+    true, means, stds = data[:, [0, 3, 6]], data[:, [1, 4, 7]], data[:, [2, 5, 8]]
+    temp = None if any(t is None for t in temps) else np.concatenate(temps)
+    _, labels = np.unique(true, axis=0, return_inverse=True)
+
+    return true, means, stds, temp, labels.ravel()
+
+
+def design(name, true, means, stds, temp):
+
+    # Weighted design matrices and targets of one model, built once: a list
+    # of three (X (N, p), y (N,), weights (N,)), or None if the data lacks an
+    # input.
+
+    axes = []
+    for axis in range(3):
+        columns = MODELS[name](true, axis, temp)
+        if columns is None:
+            return None
+        offset = 0
+        if isinstance(columns, tuple):    # (columns, known offset) as in bias_model
+            columns, offset = columns
+        weights = 1 / stds[:, axis]
+        axes.append((np.column_stack(columns) * weights[:, None], (means[:, axis] - offset) * weights, weights))
+
+    return axes
+
+
+def folds_of(true, labels, k=None):
+
+    # Held-out row indices of each fold: one fold per orientation, or k
+    # folds of orientations. For k folds the orientations are ordered pole
+    # by pole (+x, -x, +y, -y, ...) and dealt round-robin, so the two poles
+    # of an axis always land in different folds.
+
+    groups = np.unique(labels)
+    if k is None:
+        return [np.flatnonzero(labels == group) for group in groups]
+    if not 2 <= k <= len(groups):
+        raise ValueError(f"--folds must be between 2 and the number of orientations ({len(groups)}), not {k}")
+
+    orientations = [true[labels == group][0] for group in groups]
+    order = []
+    for group in groups:
+        if group in order:
+            continue
+        order.append(group)
+        opposite = [other for other in groups
+                    if other not in order and np.array_equal(orientations[other], -orientations[group])]
+        order += opposite[:1]
+
+    return [np.flatnonzero(np.isin(labels, order[fold::k])) for fold in range(k)]
+
+
+def identifiable(X):
+
+    # True if the columns of a design matrix are linearly independent.
+
+    return np.linalg.matrix_rank(X) == X.shape[1]
+
+
+
+#############################
+# Scoring
+#############################
+
+def score(name, axes, folds, seconds=60.0):
+
+    # AIC, BIC, CV residual (g) and CV drift (m) of one model. A score that
+    # needs a rank-deficient fit is NaN (AIC and BIC if the fit to all
+    # positions is, the CV scores if any fold's training fit is) and
+    # 'identifiable' is then False.
+
+    n = sum(len(y) for _, y, _ in axes)
+    k = sum(X.shape[1] for X, _, _ in axes)
+    rss = 0.0
+    held_out = []
+    full_rank, cv_rank = True, True
+    for X, y, weights in axes:
+        full_rank = full_rank and identifiable(X)
+        params = np.linalg.lstsq(X, y, rcond=None)[0]
+        rss += np.sum((y - X @ params)**2)
+
+        # Cross validation: unweighted error of each held-out mean, in g
+        for test in folds:
+            train = np.setdiff1d(np.arange(len(y)), test)
+            if not identifiable(X[train]):
+                cv_rank = False
+                break
+            params = np.linalg.lstsq(X[train], y[train], rcond=None)[0]
+            held_out.append((y[test] - X[test] @ params) / weights[test])
+
+    cv = np.sqrt(np.mean(np.concatenate(held_out)**2)) if cv_rank else np.nan
+    if not full_rank:
+        rss = np.nan
+
+    return {'model': name, 'params': k, 'rss': rss,
+            'aic': n * np.log(rss / n) + 2 * k,
+            'bic': n * np.log(rss / n) + k * np.log(n),
+            'cv_residual': cv,
+            'cv_drift': 0.5 * cv * GRAVITY * seconds**2,
+            'identifiable': full_rank and cv_rank}
+
+
+def select(csv_files, k=None, seconds=60.0, workers=1, names=None):
+
+    # Score every registered model (or `names`) on the pooled six-position
+    # files, models in parallel on `workers` processes (None: one per
+    # core). Returns the scores, best (lowest CV drift) first and the
+    # unidentifiable models last.
+
+    true, means, stds, temp, labels = load_positions(csv_files)
+    folds = folds_of(true, labels, k)
+    names = list(MODELS) if names is None else names
+    designs = {name: design(name, true, means, stds, temp) for name in names}
+    names = [name for name in names if designs[name] is not None]
+
+    args = ([designs[name] for name in names], [folds]*len(names), [seconds]*len(names))
+    if workers == 1:
+        scores = list(map(score, names, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scores = list(pool.map(score, names, *args))
+
+    return sorted(scores, key=lambda s: (not s['identifiable'], s['cv_drift']))
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Cross-validated selection between accelerometer error models.")
+    parser.add_argument('six_position_csvs', nargs='+', help="six-position summary CSV files (pooled)")
+    parser.add_argument('--folds', type=int, help="k-fold over orientations (default: leave one orientation out)")
+    parser.add_argument('--seconds', type=float, default=60.0, help="duration for the CV drift (s)")
+    parser.add_argument('--models', nargs='+', choices=list(MODELS), help="models to score (default: all)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    args = parser.parse_args()
+
+    try:
+        scores = select(args.six_position_csvs, args.folds, args.seconds, args.workers, args.models)
+    except ValueError as error:
+        parser.error(str(error))
+    skipped = [name for name in (args.models or MODELS) if name not in [s['model'] for s in scores]]
+    print(f"{'model':<18} {'params':>6} {'AIC':>10} {'BIC':>10} {'CV residual (g)':>16} {f'CV drift {args.seconds:g}s (m)':>18}")
+    for s in scores:
+        if s['identifiable']:
+            print(f"{s['model']:<18} {s['params']:>6} {s['aic']:10.1f} {s['bic']:10.1f} {s['cv_residual']:16.2e} {s['cv_drift']:18.3f}")
+        else:
+            print(f"{s['model']:<18} {s['params']:>6} {s['aic']:10.1f} {s['bic']:10.1f} {'unidentifiable':>16} {'':>18}")
+    unidentifiable = [s['model'] for s in scores if not s['identifiable']]
+    if unidentifiable:
+        print("Unidentifiable (a rank-deficient fit with these folds):", ', '.join(unidentifiable))
+    if skipped:
+        print("Skipped (no temperature column):", ', '.join(skipped))
@@ -0,0 +1,94 @@
+#############################################################################
+# Script Name: realtime_calib.py
+
+# Applies a saved accelerometer calibration while data is being collected.
+
+# Loads the model 3 parameters (bias and scale factor matrix) from an
+# optim_params CSV file, as saved by calib_pipeline.py, and inverts the
+# scale factor matrix once. Every acquired sample or block is then
+# calibrated with one subtraction and one 3x3 product:
+#     true_accel = (measured_accel - bias) * (scale_f_matrix)^-1
+# so the calibrated acceleration is available as soon as it is read, with
+# no offline pass. If the file has a gyro row, the angular rate is
+# calibrated in the same pass (bias and g-sensitivity subtracted).
+
+# Usage from a collector:
+#     calib = Calibration.from_params('optim_params.csv')
+#     x, y, z = calib.apply_sample(x_accel, y_accel, z_accel)    # one sample
+#     accels = calib.apply(block)                                # (n, 3) block
+#     w_x, w_y, w_z = calib.apply_gyro_sample(w_x, w_y, w_z, x, y, z)
+#############################################################################
+
+import numpy as np
+from calib_pipeline import load_params, model_3, gyro_model
+
+
+class Calibration:
+
+    # Model 3 calibration with the inverse scale factor matrix precomputed.
+    # scale_f is transposed the way calib_pipeline.apply_accel_model expects it.
+
+    def __init__(self, bias, scale_f, gyro_bias=None, gyro_sens=None):
+
+        self.bias = np.asarray(bias, dtype=float)
+        self.scale_f = np.asarray(scale_f, dtype=float)
+        self.inv_scale = np.linalg.inv(self.scale_f)    # the only inverse ever taken
+
+        # Plain floats for the per-sample path, where NumPy's call overhead
+        # on 3-element arrays costs more than the arithmetic
+        self._bias = tuple(float(b) for b in self.bias)
+        self._inv = tuple(tuple(float(m) for m in row) for row in self.inv_scale)
+
+        # Gyro bias (deg/s) and g-sensitivity (deg/s/g), zero if not given
+        self.gyro_bias = np.zeros(3) if gyro_bias is None else np.asarray(gyro_bias, dtype=float)
+        self.gyro_sens = np.zeros((3, 3)) if gyro_sens is None else np.asarray(gyro_sens, dtype=float)
+        self._gyro_bias = tuple(float(b) for b in self.gyro_bias)
+        self._gyro_sens = tuple(tuple(float(g) for g in row) for row in self.gyro_sens)
+
+    @classmethod
+    def from_params(cls, FILENAME):
+
+        # Load the model 3 row (and gyro row, if any) of an optim_params CSV file.
+
+        params = load_params(FILENAME)
+
+        return cls(*model_3(params), *gyro_model(params))
+
+    def apply(self, accels):
+
+        # Calibrate an (n, 3) block of accelerations (g).
+
+        return (np.asarray(accels, dtype=float) - self.bias) @ self.inv_scale
+
+    def apply_sample(self, x_accel, y_accel, z_accel):
+
+        # Calibrate one sample (g). Same result as apply().
+
+        dx, dy, dz = x_accel - self._bias[0], y_accel - self._bias[1], z_accel - self._bias[2]
+        m = self._inv
+
+        return (dx*m[0][0] + dy*m[1][0] + dz*m[2][0],
+                dx*m[0][1] + dy*m[1][1] + dz*m[2][1],
+                dx*m[0][2] + dy*m[1][2] + dz*m[2][2])
+
+    def apply_gyro(self, gyros, accels=None):
+
+        # Calibrate an (n, 3) block of angular rates (deg/s), given the
+        # calibrated accelerations (g) for the g-sensitivity.
+
+        gyros = np.asarray(gyros, dtype=float) - self.gyro_bias
+        if accels is not None:
+            gyros = gyros - np.asarray(accels, dtype=float) @ self.gyro_sens.T
+
+        return gyros
+
+    def apply_gyro_sample(self, w_x, w_y, w_z, x_accel=0.0, y_accel=0.0, z_accel=0.0):
+
+        # Calibrate one angular rate sample (deg/s), given the calibrated
+        # acceleration (g). Same result as apply_gyro().
+
+        b, g = self._gyro_bias, self._gyro_sens
+
+        return (w_x - b[0] - g[0][0]*x_accel - g[0][1]*y_accel - g[0][2]*z_accel,
+                w_y - b[1] - g[1][0]*x_accel - g[1][1]*y_accel - g[1][2]*z_accel,
+                w_z - b[2] - g[2][0]*x_accel - g[2][1]*y_accel - g[2][2]*z_accel)
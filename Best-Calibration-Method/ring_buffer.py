@@ -0,0 +1,93 @@
+#############################################################################
+# Script Name: ring_buffer.py
+
+# Fixed-size ring buffer of samples in shared memory.
+
+# The acquisition loop pushes each (time, x, y, z) sample into the ring and
+# other processes (such as the live view in live_view.py) attach to it by
+# name and read the most recent samples. There is one writer and any number
+# of readers; the writer never blocks and never waits for the readers.
+#############################################################################
+
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class SampleRing:
+
+    # Ring of `capacity` rows of `width` floats, stored in shared memory.
+    # A small header holds the total number of rows ever written and a
+    # flag the writer sets when acquisition is finished.
+    #     ring = SampleRing(capacity=8192)            # writer (creates it)
+    #     view = SampleRing(name=ring.name, ...)      # reader (attaches)
+
+    HEADER = 2    # int64 header slots: [rows written, writer closed]
+
+    def __init__(self, capacity=8192, width=4, name=None):
+
+        self.capacity = capacity
+        self.width = width
+        size = 8*(self.HEADER + capacity*width)
+        self.owner = name is None    # the creating process unlinks the memory
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.header = np.ndarray((self.HEADER,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((capacity, width), dtype=float, buffer=self.shm.buf, offset=8*self.HEADER)
+        if self.owner:
+            self.header[:] = 0
+
+    def push(self, row):
+
+        # Append one sample. The row is written before the count is
+        # advanced, so readers never see a half written row as new.
+
+        count = self.header[0]
+        self.data[count % self.capacity] = row
+        self.header[0] = count + 1
+
+    def push_block(self, rows):
+
+        # Append an (n, width) block of samples.
+
+        rows = np.asarray(rows, dtype=float)[-self.capacity:]
+        count = self.header[0]
+        idx = np.arange(count, count + len(rows)) % self.capacity
+        self.data[idx] = rows
+        self.header[0] = count + len(rows)
+
+    def latest(self, n):
+
+        # Copy of the most recent n samples (fewer if not yet written),
+        # oldest first, and the total number of samples written so far.
+
+        count = int(self.header[0])
+        n = min(n, count, self.capacity)
+        idx = np.arange(count - n, count) % self.capacity
+
+        return self.data[idx].copy(), count
+
+    @property
+    def count(self):
+        return int(self.header[0])
+
+    @property
+    def closed(self):
+        return bool(self.header[1])
+
+    def close_writer(self):
+
+        # Tell the readers that no more samples will arrive.
+
+        self.header[1] = 1
+
+    def release(self):
+
+        # Detach from the shared memory (and free it, in the owning process).
+
+        del self.header, self.data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,129 @@
+#############################################################################
+# Script Name: rls_calib.py
+
+# Recursive least squares (RLS) estimate of the accelerometer calibration.
+
+# Fits the same model as model 3 of two_levels_calib.py (bias plus scale
+# factor matrix) for each axis,
+#     measured = b + s1*x_true + s2*y_true + s3*z_true
+# but one observation at a time instead of as a batch after collection
+# ends. Each static window summary (true orientation, mean and standard
+# deviation of each axis) or block of samples at a known orientation
+# updates the estimate and its covariance in O(p^2), p = 4 parameters per
+# axis, so the current calibration is available at any time. Observations
+# are weighted by 1/std^2, as curve_fit weights them, and fed the same
+# six-position data the estimate matches the batch fit. A forgetting
+# factor below 1 discounts old observations, so the calibration of a
+# deployed sensor keeps following slow changes.
+
+# Usage:
+#     rls = RLSCalibration(forgetting=1.0)
+#     rls.update(true, means, stds)         # one static window summary
+#     rls.update_block(true, accels)        # (n, 3) samples at one orientation
+#     bias, scale_f = rls.bias_scale()      # as calib_pipeline.model_3 returns
+#     calib = Calibration(*rls.bias_scale())    # realtime_calib.py
+#     python rls_calib.py SIX_POS_CSV [--forgetting 0.99]
+#############################################################################
+
+import argparse
+import numpy as np
+
+
+class RLSCalibration:
+
+    # theta[axis] = (b, s1, s2, s3), covariance[axis] is its 4x4 covariance.
+
+    def __init__(self, forgetting=1.0, prior_std=100, bias=None, scale_f=None):
+
+        # Start from bias and scale_f (transposed the way
+        # calib_pipeline.apply_accel_model expects it), by default no bias
+        # and unit scale factors, with a prior standard deviation of
+        # prior_std on every parameter. The default lets the data decide (the prior weighs ~1e-9
+        # of one window) without a huge initial covariance, whose update
+        # would lose precision to cancellation.
+
+        self.forgetting = forgetting
+        bias = np.zeros(3) if bias is None else np.asarray(bias, dtype=float)
+        scale_f = np.eye(3) if scale_f is None else np.asarray(scale_f, dtype=float)
+        self.theta = np.column_stack((bias, scale_f.T))
+        self.covariance = np.tile(np.eye(4) * prior_std**2, (3, 1, 1))
+        self.count = 0
+
+    def update(self, true, means, stds=None):
+
+        # Add one observation per axis: the mean measured acceleration of
+        # each axis (g) at orientation `true` (g), weighted by 1/stds^2
+        # (unweighted if stds is None).
+
+        phi = np.concatenate(([1.0], np.asarray(true, dtype=float)))
+        variance = np.ones(3) if stds is None else np.asarray(stds, dtype=float)**2
+
+        P_phi = self.covariance @ phi                                 # (3, 4)
+        gain = P_phi / (self.forgetting * variance + P_phi @ phi)[:, None]
+        self.theta += gain * (np.asarray(means, dtype=float) - self.theta @ phi)[:, None]
+        self.covariance -= gain[:, :, None] * P_phi[:, None, :]
+        self.covariance = (self.covariance + self.covariance.transpose(0, 2, 1)) / (2 * self.forgetting)    # keep it symmetric
+        self.count += 1
+
+        return self.theta
+
+    def update_block(self, true, accels):
+
+        # Add a block of (n, 3) samples taken at orientation `true`, summarised
+        # the way collect_data_six_pos.py summarises a static window.
+
+        accels = np.asarray(accels, dtype=float)
+
+        return self.update(true, np.mean(accels, axis=0), np.std(accels, axis=0))
+
+    def update_many(self, read_data):
+
+        # Add every row of six-position data (load_six_position's layout).
+
+        for row in read_data:
+            self.update(row[[0, 3, 6]], row[[1, 4, 7]], row[[2, 5, 8]])
+
+        return self.theta
+
+    def bias_scale(self):
+
+        # Current bias and scale factor matrix, transposed the way
+        # calib_pipeline.apply_accel_model expects it (as model_3).
+
+        return self.theta[:, 0].copy(), self.theta[:, 1:].T.copy()
+
+    def params(self):
+
+        # Current estimate as the model 3 row of an optim_params CSV file.
+
+        return np.concatenate((self.theta[:, 0], self.theta[:, 1:].ravel()))
+
+    def std(self):
+
+        # Standard deviation of every parameter, in the layout of params().
+
+        sigma = np.sqrt(np.diagonal(self.covariance, axis1=1, axis2=2))
+
+        return np.concatenate((sigma[:, 0], sigma[:, 1:].ravel()))
+
+
+
+if __name__ == '__main__':
+
+    from calib_pipeline import load_six_position, fit_accel_models
+
+    parser = argparse.ArgumentParser(description="Fit model 3 to six-position data one window at a time.")
+    parser.add_argument('six_position_csv', help="six-position summary CSV file")
+    parser.add_argument('--forgetting', type=float, default=1.0, help="forgetting factor (1 keeps all observations)")
+    args = parser.parse_args()
+
+    read_data = load_six_position(args.six_position_csv)
+    rls = RLSCalibration(forgetting=args.forgetting)
+    for ii, row in enumerate(read_data):
+        rls.update(row[[0, 3, 6]], row[[1, 4, 7]], row[[2, 5, 8]])
+        print(f"Window {ii+1}: bias", np.round(rls.theta[:, 0], 5))
+
+    params, _ = fit_accel_models(read_data)
+    print("RLS model 3:  ", np.round(rls.params(), 6))
+    print("Batch model 3:", np.round(params[2], 6))
+    print("Max difference:", np.max(np.abs(rls.params() - params[2])))
@@ -0,0 +1,202 @@
+#############################################################################
+# Script Name: scheduler.py
+
+# Multi-rate acquisition: each channel group polled at its own rate.
+
+# The collectors read every channel on every pass of their loop, but the
+# channel groups have very different useful rates: the accelerometer (and
+# gyro) run at kHz, the AK8963 magnetometer measures at 100 Hz
+# (AK8963_samp_rate in mpu9250_i2c.AK8963_start) and the temperature
+# changes over minutes. Reading the slow channels on every pass only eats
+# into the accelerometer's bus time.
+
+# Scheduler polls a list of Channels, each with its own read function and
+# rate (None: on every pass of the loop, as fast as the bus allows). A
+# channel is read when its deadline comes up, then the deadline moves one
+# period on, so the rate holds on average; ticks missed while the loop was
+# busy are skipped and counted, not made up in a burst. When nothing is due
+# the loop sleeps until the next deadline. Every sample is stamped with the
+# middle of its read, in seconds since the start of the run, so the
+# channels' separate streams share one time base, and aligned() resamples a
+# slow stream onto the time stamps of a fast one.
+
+# Usage:
+#     sched = Scheduler(imu_channels(mpu9250_i2c, 'accel', temp_rate=1.0, mag_rate=100.0))
+#     sched.run(total_time=60)
+#     times, accels = sched.stream('imu')
+#     temps = sched.aligned('temp', times)           # (n, 1), held between readings
+#     sched.save('multi_rate')                       # multi_rate_imu.csv, multi_rate_temp.csv, ...
+#     python scheduler.py [--seconds 60] [--profile accel] [--mag-rate 100] [--temp-rate 1]
+#############################################################################
+
+import time,argparse
+import numpy as np
+
+
+class Channel:
+
+    # One channel group: a function reading one sample (a tuple of floats)
+    # and the samples read so far.
+
+    def __init__(self, name, read, rate=None, columns=()):
+
+        # rate: polls per second, None to poll on every pass of the loop
+        # columns: header of each value of a sample, for save()
+
+        self.name = name
+        self.read = read
+        self.rate = rate
+        self.columns = list(columns)
+        self.period = 0.0 if rate is None else 1.0 / rate
+        self.due = 0.0         # next deadline, seconds since the start
+        self.missed = 0        # ticks skipped because the loop was late
+        self.times = []
+        self.samples = []
+
+
+def imu_channels(driver, profile='accel', rate=None, temp_rate=1.0, mag_rate=100.0):
+
+    # Standard channels of the mpu9250_i2c module `driver`: 'imu' (the
+    # acquisition profile, at `rate`), and 'temp' and 'mag' at their own
+    # rates (None or 0 leaves them out). Selects the profile, keeping the
+    # temperature sensor on if it is polled.
+
+    words, _, temp_on, mag_on = driver.PROFILES[profile]
+    driver.set_profile(profile, temp=temp_on or bool(temp_rate))
+
+    columns = ['x (g)', 'y (g)', 'z (g)']
+    if temp_on:
+        columns += ['temp (C)']
+    if words == 7:
+        columns += ['wx (dps)', 'wy (dps)', 'wz (dps)']
+    if mag_on:
+        columns += ['mx (uT)', 'my (uT)', 'mz (uT)']
+    channels = [Channel('imu', driver.read_profile, rate, columns)]
+    if temp_rate:
+        channels.append(Channel('temp', lambda: (driver.read_temp(),), temp_rate, ['temp (C)']))
+    if mag_rate:
+        channels.append(Channel('mag', driver.AK8963_conv, mag_rate, ['mx (uT)', 'my (uT)', 'mz (uT)']))
+
+    return channels
+
+
+class Scheduler:
+
+    def __init__(self, channels, clock=time.perf_counter, sleep=time.sleep):
+
+        self.channels = {channel.name: channel for channel in channels}
+        self.clock = clock
+        self.sleep = sleep
+        self.elapsed = 0.0
+
+    def run(self, total_time):
+
+        # Poll the channels for total_time seconds. When several are due
+        # together the slowest goes first, since the fast ones come round
+        # again soon anyway.
+
+        order = sorted(self.channels.values(), key=lambda channel: -channel.period)
+        clock = self.clock
+        start = clock()
+        for channel in order:
+            channel.due = 0.0
+        while True:
+            now = clock() - start
+            if now >= total_time:
+                break
+            due = [channel for channel in order if channel.due <= now]
+            if not due:
+                wait = min(channel.due for channel in order) - now
+                if wait > 0.002:
+                    self.sleep(wait - 0.001)    # wake early, the sleep may overshoot
+                continue
+            for channel in due:
+                before = clock()
+                sample = channel.read()
+                after = clock()
+                channel.times.append((before + after) / 2 - start)
+                channel.samples.append(sample)
+                if channel.period:
+                    channel.due += channel.period
+                    late = after - start - channel.due
+                    if late >= channel.period:    # skip whole ticks already missed
+                        skipped = int(late // channel.period)
+                        channel.missed += skipped
+                        channel.due += skipped * channel.period
+        self.elapsed = clock() - start
+
+        return
+
+    def stream(self, name):
+
+        # Time stamps (n,) and samples (n, values) of one channel.
+
+        channel = self.channels[name]
+        samples = np.array(channel.samples, dtype=float).reshape(len(channel.times), -1)
+
+        return np.array(channel.times), samples
+
+    def aligned(self, name, times, hold=True):
+
+        # Samples of one channel at the given time stamps (e.g. a faster
+        # channel's): the last reading at or before each time (hold), or
+        # linearly interpolated. Times before the first reading take the
+        # first reading.
+
+        stream_times, samples = self.stream(name)
+        if hold:
+            index = np.searchsorted(stream_times, times, side='right') - 1
+            return samples[np.clip(index, 0, len(stream_times) - 1)]
+
+        return np.column_stack([np.interp(times, stream_times, column) for column in samples.T])
+
+    def summary(self):
+
+        # Samples, achieved rate and missed ticks of each channel.
+
+        return {name: {'samples': len(channel.times),
+                       'rate_hz': len(channel.times) / self.elapsed if self.elapsed else 0.0,
+                       'target_hz': channel.rate,
+                       'missed': channel.missed}
+                for name, channel in self.channels.items()}
+
+    def save(self, prefix):
+
+        # Save each channel to its own CSV file, PREFIX_NAME.csv, with the
+        # collectors' two header lines.
+
+        filenames = []
+        for name, channel in self.channels.items():
+            times, samples = self.stream(name)
+            FILENAME = prefix + '_' + name + '.csv'
+            rate = 'every pass' if channel.rate is None else f'{channel.rate:g} Hz'
+            file = open(FILENAME, 'w')
+            file.write(f'Multi-rate acquisition, {name} channel ({rate}).' + '\n' +
+                       ','.join(['time (s)'] + channel.columns) + '\n')
+            np.savetxt(file, np.column_stack((times, samples)), delimiter=',', fmt='%.12g')
+            file.close()
+            filenames.append(FILENAME)
+
+        return filenames
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Record each IMU channel group at its own rate.")
+    parser.add_argument('--seconds', type=float, default=60.0, help="duration of the recording (s)")
+    parser.add_argument('--profile', default='accel', choices=['accel', 'accel_gyro'], help="acquisition profile of the fast channel")
+    parser.add_argument('--rate', type=float, help="rate of the fast channel (Hz, default: as fast as possible)")
+    parser.add_argument('--temp-rate', type=float, default=1.0, help="temperature rate (Hz, 0 to leave it out)")
+    parser.add_argument('--mag-rate', type=float, default=100.0, help="magnetometer rate (Hz, 0 to leave it out)")
+    parser.add_argument('--prefix', default='multi_rate', help="CSV files are PREFIX_imu.csv, PREFIX_temp.csv, ...")
+    args = parser.parse_args()
+
+    import mpu9250_i2c    # starts the IMU
+
+    sched = Scheduler(imu_channels(mpu9250_i2c, args.profile, args.rate, args.temp_rate, args.mag_rate))
+    sched.run(args.seconds)
+    for name, stats in sched.summary().items():
+        target = 'max' if stats['target_hz'] is None else f"{stats['target_hz']:g} Hz"
+        print(f"{name:<5} {stats['samples']:8d} samples  {stats['rate_hz']:9.1f} Hz (target {target}), {stats['missed']} missed")
+    print("Saved", ', '.join(sched.save(args.prefix)))
@@ -0,0 +1,26 @@
+#############################################################################
+# Script Name: scipy_compat.py
+
+# SciPy names that changed between the versions the scripts run on.
+
+# scipy.integrate.cumtrapz was renamed cumulative_trapezoid in SciPy 1.6 and
+# the old name was removed in 1.14. cumtrapz() here calls whichever exists,
+# and imports SciPy only when first called, so scripts that import it still
+# start quickly.
+
+# Usage:
+#     from scipy_compat import cumtrapz
+#     velocity = cumtrapz(accels, x=times, axis=0, initial=0)
+#############################################################################
+
+
+def cumtrapz(y, x=None, axis=-1, initial=None):
+
+    # Cumulative trapezoid integral of y along axis, as scipy.integrate's.
+
+    try:
+        from scipy.integrate import cumulative_trapezoid as integral
+    except ImportError:
+        from scipy.integrate import cumtrapz as integral
+
+    return integral(y, x=x, axis=axis, initial=initial)
@@ -0,0 +1,158 @@
+#############################################################################
+# Script Name: stage_cache.py
+
+# Content-addressed cache of the calibration stages' results.
+
+# Every stage result (fitted parameters and covariances, loaded recordings,
+# calibrated acceleration, displacement) is saved as a .npz file named by a
+# hash of everything it depends on: the contents of its input files, the
+# keys of the stages it was computed from and its own parameters. Running
+# an unchanged analysis again only loads the files, and changing a late
+# stage (or one input file) only recomputes the stages downstream of it.
+# When the cache grows past max_mb, the least recently used files are
+# deleted.
+
+# Usage:
+#     cache = StageCache('.cache')
+#     key, result = cache.cached('fit accel models', compute, inputs=[csv_file])
+#     key2, result2 = cache.cached('calibrate', compute2, inputs=[key, test_csv], params={'gravity_axis': 2})
+# compute() returns a dict of arrays; inputs are file paths, keys of earlier
+# stages or arrays, and params any JSON-serializable values.
+#############################################################################
+
+import os,json,hashlib
+import numpy as np
+
+
+class StageCache:
+
+    HASH_INDEX = 'file_hashes.json'    # remembers file hashes by size and modification time
+
+    def __init__(self, directory='.cache', max_mb=1024):
+
+        self.directory = directory
+        self.max_bytes = max_mb * 2**20
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, self.HASH_INDEX)) as file:
+                self._file_hashes = json.load(file)
+        except (OSError, ValueError):
+            self._file_hashes = {}
+
+    def file_hash(self, path):
+
+        # Hash of a file's contents. Files are only read again when their
+        # size or modification time has changed.
+
+        path = os.path.abspath(path)
+        info = os.stat(path)
+        known = self._file_hashes.get(path)
+        if known is not None and known[0] == info.st_size and known[1] == info.st_mtime_ns:
+            return known[2]
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(2**20), b''):
+                digest.update(chunk)
+        self._file_hashes[path] = [info.st_size, info.st_mtime_ns, digest.hexdigest()]
+        temp = os.path.join(self.directory, f'{self.HASH_INDEX}.{os.getpid()}.tmp')
+        with open(temp, 'w') as file:
+            json.dump(self._file_hashes, file)
+        os.replace(temp, os.path.join(self.directory, self.HASH_INDEX))
+
+        return digest.hexdigest()
+
+    def key(self, stage, inputs=(), params=None):
+
+        # Key of a stage result. An input is a file path (hashed by
+        # contents), the key of another stage, or an array.
+
+        digest = hashlib.blake2b(stage.encode(), digest_size=20)
+        for item in inputs:
+            if isinstance(item, np.ndarray):
+                digest.update(str((item.dtype.str, item.shape)).encode())
+                digest.update(np.ascontiguousarray(item).tobytes())
+            elif isinstance(item, str) and os.path.isfile(item):
+                digest.update(b'file:' + self.file_hash(item).encode())
+            else:
+                digest.update(b'key:' + str(item).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+
+        return stage.replace(' ', '_') + '-' + digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+
+        # The arrays saved under key, or None. Reading a file marks it as
+        # recently used.
+
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:    # evicted by another process meanwhile
+            pass
+
+        return arrays
+
+    def put(self, key, arrays):
+
+        # Save a dict of arrays under key, then evict if over the size limit.
+        # The file is written under a temporary name and renamed, so a
+        # crash never leaves a half written entry and processes sharing the
+        # cache never read one.
+
+        temp = self.path(key) + f'.{os.getpid()}.tmp.npz'
+        np.savez(temp, **arrays)
+        os.replace(temp, self.path(key))
+        self.evict()
+
+        return
+
+    def cached(self, stage, compute, inputs=(), params=None):
+
+        # Return (key, arrays) of a stage, computing and saving it only if
+        # it is not in the cache.
+
+        key = self.key(stage, inputs, params)
+        arrays = self.get(key)
+        if arrays is None:
+            self.misses += 1
+            arrays = {name: np.asarray(value) for name, value in compute().items()}
+            self.put(key, arrays)
+        else:
+            self.hits += 1
+
+        return key, arrays
+
+    def evict(self):
+
+        # Delete the least recently used entries until the cache fits in max_mb.
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                try:
+                    info = os.stat(os.path.join(self.directory, name))
+                except OSError:    # removed by another process
+                    continue
+                entries.append((info.st_mtime_ns, info.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+        return
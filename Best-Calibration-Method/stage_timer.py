@@ -0,0 +1,114 @@
+#############################################################################
+# Script Name: stage_timer.py
+
+# Named stage timers and opt-in profiling for the calibration scripts.
+
+# Wrap each step of a script in a named stage:
+#     timer = StageTimer(profile='--profile' in sys.argv)
+#     with timer.stage('fit accel models'):
+#         ...
+#     timer.report('two_levels_calib_timing.json')
+
+# Every stage records its wall time and CPU time (and, optionally, the number
+# of samples it processed, for a throughput). In profile mode the whole run is
+# also profiled with cProfile (saved as a .prof file for pstats/snakeviz),
+# tracemalloc records each stage's peak Python/NumPy allocation, and the
+# report includes the lines that hold the most memory at the end of the run.
+#############################################################################
+
+import io,json,time,cProfile,pstats,tracemalloc
+from contextlib import contextmanager
+
+
+class StageTimer:
+
+    def __init__(self, profile=False):
+
+        self.profile = profile
+        self.stages = []
+        self._start = time.perf_counter()
+        self._profiler = None
+        self._peaks = []    # peak traced memory so far of each open stage (bytes)
+        if profile:
+            tracemalloc.start()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    @contextmanager
+    def stage(self, name, samples=None):
+
+        # Time the with-block as stage `name`. Stages may be nested: the
+        # traced peak is reset for each stage, so the peak an outer stage
+        # reached before a nested one is kept in self._peaks, and a nested
+        # stage's peak is passed on to the stage around it.
+
+        record = {'stage': name}
+        if samples is not None:
+            record['samples'] = int(samples)
+        if self.profile:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+            start_mem = tracemalloc.get_traced_memory()[0]
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record    # the block may add fields, e.g. record['samples'] = n
+        finally:
+            record['wall_s'] = time.perf_counter() - start_wall
+            record['cpu_s'] = time.process_time() - start_cpu
+            if record.get('samples') and record['wall_s'] > 0:
+                record['samples_per_s'] = record['samples'] / record['wall_s']
+            if self.profile:
+                peak = max(tracemalloc.get_traced_memory()[1], self._peaks.pop())
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                record['peak_alloc_mb'] = (peak - start_mem) / 2**20
+            self.stages.append(record)
+
+    def report(self, FILENAME=None, prof_file=None, top=20):
+
+        # Print a table of the stages and optionally save the report as
+        # JSON. In profile mode the cProfile statistics are saved to
+        # prof_file (FILENAME with .prof, by default) and the top functions
+        # by cumulative time and the top allocation sites are included.
+
+        report = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'total_wall_s': time.perf_counter() - self._start,
+                  'stages': self.stages}
+
+        if self.profile:
+            self._profiler.disable()
+            if prof_file is None and FILENAME is not None:
+                prof_file = FILENAME.rsplit('.', 1)[0] + '.prof'
+            if prof_file is not None:
+                self._profiler.dump_stats(prof_file)
+                report['prof_file'] = prof_file
+
+            text = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=text).sort_stats('cumulative')
+            stats.print_stats(top)
+            report['profile_top'] = [{'function': pstats.func_std_string(func), 'calls': nc,
+                                      'tottime_s': tt, 'cumtime_s': ct}
+                                     for func, (cc, nc, tt, ct, callers) in
+                                     sorted(stats.stats.items(), key=lambda item: -item[1][3])[:top]]
+
+            snapshot = tracemalloc.take_snapshot()
+            report['top_allocations'] = [{'line': str(stat.traceback), 'size_mb': stat.size / 2**20, 'blocks': stat.count}
+                                         for stat in snapshot.statistics('lineno')[:top]]
+            report['peak_alloc_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+        width = max([36] + [len(record['stage']) + 2 for record in self.stages])
+        print(f"\n{'stage':<{width}}{'wall (s)':>10}{'cpu (s)':>10}")
+        for record in self.stages:
+            print(f"{record['stage']:<{width}}{record['wall_s']:10.3f}{record['cpu_s']:10.3f}")
+        print(f"{'total':<{width}}{report['total_wall_s']:10.3f}")
+        if self.profile:
+            print(text.getvalue())
+
+        if FILENAME is not None:
+            with open(FILENAME, 'w') as file:
+                json.dump(report, file, indent=2)
+
+        return report
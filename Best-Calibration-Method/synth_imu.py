@@ -0,0 +1,198 @@
+#############################################################################
+# Script Name: synth_imu.py
+
+# Synthetic accelerometer recordings with known errors.
+
+# Generates recordings of any length and sample rate from a sensor model
+# with known parameters, so the fitters and integrators can be checked
+# against the truth and the pipeline can be run on 24-hour, 1 kHz workloads
+# without the hardware. The measured acceleration of every sample is
+
+#     measured = scale @ true + bias + bias walk + temp_coeff*(T - temp_ref) + noise
+
+# where scale is the 3x3 scale factor/misalignment matrix (rows: Sxx Sxy Sxz,
+# Syx Syy Syz, Szx Szy Szz, as in the optim_params CSV files), the bias walk
+# is a random walk, T follows a warm-up curve, and the result is clipped and
+# quantized to the +-2 g, 16 bit LSB of the MPU6050. Time stamps are the
+# nominal sample times plus a random delay (jitter), like time.time() in the
+# collection loop.
+
+# Output is in the collectors' CSV layout (two header lines, then time (s),
+# x, y, z (g)), or as a stream of (times, accels) blocks so long recordings
+# never have to fit in memory.
+
+# Usage:
+#     imu = SyntheticIMU(rate=1000, seed=1)
+#     imu.write_csv('synthetic_24h.csv', 24*3600)
+#     for times, accels in SyntheticIMU().blocks(3600): ...
+#     python synth_imu.py --hours 24 --rate 1000 --output synthetic_24h.csv
+#############################################################################
+
+import os,argparse
+import numpy as np
+
+
+# Default errors, close to the values fitted for the real sensor
+SCALE = np.array([[1.0000, 0.0080, 0.0090],
+                  [-0.0064, 1.0004, 0.0106],
+                  [-0.0102, -0.0044, 1.0220]])
+BIAS = np.array([0.0916, 0.0473, -0.2502])    # g
+NOISE = np.array([0.003, 0.005, 0.004])       # g, standard deviation of each sample
+LSB = 1 / 16384                               # g, +-2 g range, 16 bit
+SIX_POSITIONS = np.array([[0, 0, 1], [0, 0, -1], [0, 1, 0], [0, -1, 0], [1, 0, 0], [-1, 0, 0]], dtype=float)
+
+
+class SyntheticIMU:
+
+    # Accelerometer model. All error terms are per axis (x, y, z):
+    #     true        : true acceleration (g), constant, z up by default
+    #     rate        : nominal sample rate (Hz)
+    #     scale, bias : scale factor/misalignment matrix and bias (g)
+    #     noise       : white noise standard deviation (g)
+    #     bias_walk   : bias random walk (g/sqrt(s))
+    #     temp_coeff  : bias temperature coefficient (g/degC)
+    #     temp_start, temp_rise, temp_tau : the temperature starts at
+    #                   temp_start and rises by temp_rise (degC) with time
+    #                   constant temp_tau (s); temp_ref is the temperature
+    #                   at which `bias` holds
+    #     jitter      : largest random delay of a time stamp (s)
+    #     quantize    : clip and round to the +-2 g int16 LSB
+
+    def __init__(self, true=(0.0, 0.0, 1.0), rate=180.0, scale=SCALE, bias=BIAS, noise=NOISE,
+                 bias_walk=0.0, temp_coeff=0.0, temp_start=25.0, temp_rise=0.0, temp_tau=600.0,
+                 temp_ref=25.0, jitter=None, quantize=True, seed=0):
+
+        self.true = np.asarray(true, dtype=float)
+        self.rate = rate
+        self.scale = np.asarray(scale, dtype=float)
+        self.bias = np.broadcast_to(np.asarray(bias, dtype=float), (3,))
+        self.noise = np.broadcast_to(np.asarray(noise, dtype=float), (3,))
+        self.bias_walk = np.broadcast_to(np.asarray(bias_walk, dtype=float), (3,))
+        self.temp_coeff = np.broadcast_to(np.asarray(temp_coeff, dtype=float), (3,))
+        self.temp_start = temp_start
+        self.temp_rise = temp_rise
+        self.temp_tau = temp_tau
+        self.temp_ref = temp_ref
+        self.jitter = 0.2 / rate if jitter is None else jitter    # keeps the time stamps in order
+        self.quantize = quantize
+        self.seed = seed
+
+    def truth(self):
+
+        # The model's parameters, for checking fitted values against.
+
+        return {'true': self.true.tolist(), 'rate': self.rate, 'scale': self.scale.tolist(),
+                'bias': self.bias.tolist(), 'noise': self.noise.tolist(),
+                'bias_walk': self.bias_walk.tolist(), 'temp_coeff': self.temp_coeff.tolist(),
+                'temp_start': self.temp_start, 'temp_rise': self.temp_rise,
+                'temp_tau': self.temp_tau, 'temp_ref': self.temp_ref,
+                'jitter': self.jitter, 'quantize': self.quantize, 'seed': self.seed}
+
+    def temperature(self, times):
+
+        # Sensor temperature (degC) at the given times (s).
+
+        return self.temp_start + self.temp_rise * (1 - np.exp(-np.asarray(times) / self.temp_tau))
+
+    def blocks(self, duration, block_size=100000, true=None):
+
+        # Generate `duration` seconds of samples as (times, accels) blocks of
+        # at most block_size samples, accels in g with shape (n, 3). The bias
+        # walk carries over from block to block, so the blocks join into one
+        # recording. The same seed always gives the same recording.
+
+        rng = np.random.default_rng(self.seed)
+        true = self.true if true is None else np.asarray(true, dtype=float)
+        n_total = int(round(duration * self.rate))
+        static = self.scale @ true + self.bias    # error-free part of every sample
+        walk = np.zeros(3)
+        walk_step = self.bias_walk * np.sqrt(1 / self.rate)
+
+        for start in range(0, n_total, block_size):
+            n = min(block_size, n_total - start)
+            times = np.arange(start, start + n) / self.rate + rng.uniform(0, self.jitter, n)
+            accels = static + rng.normal(0, 1, (n, 3)) * self.noise
+
+            if np.any(self.bias_walk):
+                steps = np.cumsum(rng.normal(0, 1, (n, 3)) * walk_step, axis=0)
+                accels += walk + steps
+                walk = walk + steps[-1]
+            if np.any(self.temp_coeff):
+                accels += np.outer(self.temperature(times) - self.temp_ref, self.temp_coeff)
+            if self.quantize:
+                accels = np.round(np.clip(accels, -2, 2 - LSB) / LSB) * LSB
+
+            yield times, accels
+
+    def generate(self, duration, true=None):
+
+        # The whole recording as one (times, accels) pair.
+
+        blocks = list(self.blocks(duration, true=true))
+        if not blocks:
+            return np.empty(0), np.empty((0, 3))
+
+        return np.concatenate([b[0] for b in blocks]), np.concatenate([b[1] for b in blocks])
+
+    def write_csv(self, FILENAME, duration, TITLE='Synthetic Acceleration Data. Z up.', block_size=100000):
+
+        # Write a recording in the collectors' CSV layout, one block at a time.
+
+        if os.path.dirname(FILENAME):
+            os.makedirs(os.path.dirname(FILENAME), exist_ok=True)
+        with open(FILENAME, 'w') as file:
+            file.write(TITLE + '\n' + 'time (s),x (g),y (g),z (g)' + '\n')
+            for times, accels in self.blocks(duration, block_size):
+                np.savetxt(file, np.column_stack((times, accels)), delimiter=",", fmt='%.9g')
+
+        return
+
+    def six_position(self, duration=5.0):
+
+        # Six-position test of this sensor: `duration` seconds in each
+        # orientation of SIX_POSITIONS. Returns the rows of the
+        # six_position_data.csv layout (x_true, x_mean, x_std, y_true, ... z_std).
+
+        rows = []
+        for ii, true in enumerate(SIX_POSITIONS):
+            imu = SyntheticIMU(**{**self.truth(), 'seed': self.seed + ii + 1})
+            times, accels = imu.generate(duration, true=true)
+            means, stds = np.mean(accels, axis=0), np.std(accels, axis=0)
+            rows.append([value for axis in range(3) for value in (true[axis], means[axis], stds[axis])])
+
+        return np.array(rows)
+
+    def write_six_position_csv(self, FILENAME, duration=5.0):
+
+        # Write six_position() in the layout of six_position_data.csv.
+
+        if os.path.dirname(FILENAME):
+            os.makedirs(os.path.dirname(FILENAME), exist_ok=True)
+        with open(FILENAME, 'w') as file:
+            file.write('x_true (g),x_mean (g),x_std,y_true (g),y_mean (g),y_std,z_true (g),z_mean (g),z_std' + '\n')
+            np.savetxt(file, self.six_position(duration), delimiter=",", fmt='%.17g')
+
+        return
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Write a synthetic accelerometer recording in the collectors' CSV layout.")
+    parser.add_argument('--hours', type=float, default=1.0, help="length of the recording (hours)")
+    parser.add_argument('--rate', type=float, default=180.0, help="sample rate (Hz)")
+    parser.add_argument('--output', default='synthetic_data.csv', help="CSV file for the recording")
+    parser.add_argument('--six-position', help="also write a six-position summary CSV file")
+    parser.add_argument('--bias-walk', type=float, default=0.0, help="bias random walk (g/sqrt(s))")
+    parser.add_argument('--temp-coeff', type=float, default=0.0, help="bias temperature coefficient (g/degC)")
+    parser.add_argument('--temp-rise', type=float, default=0.0, help="warm-up temperature rise (degC)")
+    parser.add_argument('--no-quantize', action='store_true', help="do not round to the int16 LSB")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    imu = SyntheticIMU(rate=args.rate, bias_walk=args.bias_walk, temp_coeff=args.temp_coeff,
+                       temp_rise=args.temp_rise, quantize=not args.no_quantize, seed=args.seed)
+    imu.write_csv(args.output, args.hours * 3600)
+    print("Saved", args.output)
+    if args.six_position:
+        imu.write_six_position_csv(args.six_position)
+        print("Saved", args.six_position)
@@ -0,0 +1,288 @@
+#############################################################################
+# Script Name: temp_calib.py
+
+# Temperature-compensated accelerometer calibration.
+
+# The 15-hour and start-up/shut-down tests show a slow drift of the bias,
+# most likely thermal, which the two-level method can only remove with a
+# drift fit per session. Here the misalignment model (model 3) is extended
+# with the die temperature (TEMP_OUT, recorded by the collectors):
+#     measured = bias(T) + S(T) @ true
+#     bias(T)  = b0 + b1 dT + b2 dT^2 + ...     (bias_order)
+#     S(T)     = S0 + S1 dT + ...               (scale_order)
+# with dT = T - reference (the mean temperature of the fit data). The model
+# is linear in its coefficients, so every axis is one weighted least squares
+# problem with a shared design matrix, and the three axes are solved
+# together with one stacked pseudo-inverse (as bootstrap_uncertainty.py's
+# projections), weights 1/std as curve_fit uses them.
+
+# The fit needs data over a range of temperatures: six-position files taken
+# at different temperatures (pooled, with the temp_mean column), and/or
+# windows of a long static recording with a temperature column (--static).
+# S(T) can only be told apart from bias(T) with several orientations: for a
+# single one (static recordings only) S is held at a model 3 fit (--scale,
+# an optim_params file) and only bias(T) is fitted.
+
+# TempCalibration inverts the model on a temperature grid once (bias and
+# inverse scale matrix every `step` degrees, by default 0.01 C) and then
+# calibrates a block with one table lookup per sample and one batched 3x3
+# product. Temperatures outside the grid (the fit range plus a margin) use
+# its edge, rather than extrapolating the polynomials.
+
+# Usage:
+#     calib = fit_temp_model(true, means, stds, temps)     # see model_select.load_positions
+#     accels = calib.apply(accels, temps)                  # (n, 3) g, temps (n,) or one value
+#     calib.save('temp_params.csv'); TempCalibration.load('temp_params.csv')
+#     python temp_calib.py data/trial_*/six_position_data.csv [--static accel_over_time.csv] \
+#         [--bias-order 2] [--scale-order 1] [--scale OPTIM_PARAMS_CSV] [--test RECORDING_CSV]
+#############################################################################
+
+import argparse
+import numpy as np
+
+
+class TempCalibration:
+
+    # bias_coeffs (bias_order + 1, 3): bias = sum_k bias_coeffs[k] dT^k
+    # scale_coeffs (scale_order + 1, 3, 3): S = sum_k scale_coeffs[k] dT^k,
+    #     S[i, j] the response of axis i to true acceleration along j
+
+    def __init__(self, bias_coeffs, scale_coeffs, reference, low, high, step=0.01):
+
+        self.bias_coeffs = np.asarray(bias_coeffs, dtype=float)
+        self.scale_coeffs = np.asarray(scale_coeffs, dtype=float)
+        self.reference = float(reference)
+        self.low, self.high, self.step = float(low), float(high), float(step)
+
+        # Lookup table: bias and inverse scale matrix at every grid point,
+        # so that true = (measured - bias) @ inverse
+        self.grid = self.low + self.step * np.arange(int(round((self.high - self.low) / self.step)) + 1)
+        self.table_bias = self.bias(self.grid)
+        self.table_inverse = np.linalg.inv(self.scale(self.grid)).transpose(0, 2, 1)
+
+    def bias(self, temps):
+
+        # (n, 3) bias at each temperature.
+
+        powers = np.power.outer(np.atleast_1d(temps) - self.reference, np.arange(len(self.bias_coeffs)))
+
+        return powers @ self.bias_coeffs
+
+    def scale(self, temps):
+
+        # (n, 3, 3) scale matrix at each temperature.
+
+        powers = np.power.outer(np.atleast_1d(temps) - self.reference, np.arange(len(self.scale_coeffs)))
+
+        return np.tensordot(powers, self.scale_coeffs, axes=1)
+
+    def index(self, temps):
+
+        # Grid index of each temperature, edges for those outside the grid.
+
+        index = np.rint((np.asarray(temps, dtype=float) - self.low) / self.step).astype(int)
+
+        return np.clip(index, 0, len(self.grid) - 1)
+
+    def apply(self, accels, temps):
+
+        # Calibrate an (n, 3) block of accelerations (g) at the given
+        # temperatures, (n,) or one value for the whole block.
+
+        accels = np.asarray(accels, dtype=float)
+        index = self.index(temps)
+        if index.ndim == 0 or index.min() == index.max():    # one grid point: one matrix product
+            index = int(index.flat[0])
+            return (accels - self.table_bias[index]) @ self.table_inverse[index]
+
+        return np.einsum('ni,nij->nj', accels - self.table_bias[index], self.table_inverse[index])
+
+    def save(self, FILENAME, TITLE='Temperature Model Parameters'):
+
+        # One row: reference, grid (low, high, step), orders, then the bias
+        # and scale coefficients (row by row, lowest power first).
+
+        file = open(FILENAME, 'w')
+        file.write(TITLE + '\n')
+        file.write('reference (C), low (C), high (C), step (C), bias order, scale order, '
+                   'bias coefficients (k, axis), scale coefficients (k, axis, true axis) \n')
+        row = np.concatenate(([self.reference, self.low, self.high, self.step,
+                               len(self.bias_coeffs) - 1, len(self.scale_coeffs) - 1],
+                              self.bias_coeffs.ravel(), self.scale_coeffs.ravel()))
+        file.write(','.join(repr(float(value)) for value in row) + '\n')
+        file.close()
+
+        return
+
+    @classmethod
+    def load(cls, FILENAME):
+
+        row = np.loadtxt(FILENAME, skiprows = 2, delimiter=",", dtype=float)
+        reference, low, high, step = row[:4]
+        kb, ks = int(row[4]) + 1, int(row[5]) + 1
+        bias_coeffs = row[6:6 + 3*kb].reshape(kb, 3)
+        scale_coeffs = row[6 + 3*kb:6 + 3*kb + 9*ks].reshape(ks, 3, 3)
+
+        return cls(bias_coeffs, scale_coeffs, reference, low, high, step)
+
+
+
+#############################
+# Fit
+#############################
+
+def design(true, temps, reference, bias_order=2, scale_order=1):
+
+    # Design matrix shared by the three axes, (N, bias_order + 1 +
+    # 3*(scale_order + 1)): the powers of dT, then dT^k * true for every k.
+
+    dT = np.asarray(temps, dtype=float) - reference
+    columns = [dT**k for k in range(bias_order + 1)]
+    columns += [dT**k * true[:, j] for k in range(scale_order + 1) for j in range(3)]
+
+    return np.column_stack(columns)
+
+
+def fit_temp_model(true, means, stds, temps, bias_order=2, scale_order=1, margin=5.0, step=0.01, scale=None):
+
+    # Fit the model to (N, 3) true orientations, means and stds (g) and (N,)
+    # temperatures (C), one row per static window. With a (3, 3) `scale`
+    # matrix S is held there and only bias(T) is fitted (scale_order is
+    # then ignored). Returns a TempCalibration with its grid spanning the
+    # fit's temperatures plus `margin` degrees each side.
+
+    temps = np.asarray(temps, dtype=float)
+    reference = float(np.mean(temps))
+    kb = bias_order + 1
+    if scale is not None:
+        scale = np.asarray(scale, dtype=float)
+        scale_order = 0
+        means = means - true @ scale.T
+    X = design(true, temps, reference, bias_order, scale_order)
+    if scale is not None:
+        X = X[:, :kb]
+    if len(X) < X.shape[1]:
+        raise ValueError(f"{len(X)} windows for {X.shape[1]} parameters per axis; pool more six-position files")
+    if (bias_order or scale_order) and np.ptp(temps) < 0.5:
+        raise ValueError(f"the windows span only {np.ptp(temps):.2f} C; pool data taken at different temperatures")
+    rank = np.linalg.matrix_rank(X)
+    if rank < X.shape[1]:
+        orientations = len(np.unique(true, axis=0))
+        raise ValueError(f"the model is not identifiable from this data (design rank {rank} for {X.shape[1]} parameters "
+                         f"per axis, {orientations} orientation(s)); S(T) needs several orientations, or hold S fixed "
+                         f"with a model 3 scale matrix and fit only bias(T)")
+
+    # All three axes at once: (3, N, p) weighted designs, one stacked pseudo-inverse
+    weights = 1 / stds.T                                         # (3, N)
+    params = np.einsum('apn,an->ap', np.linalg.pinv(X * weights[:, :, None]), means.T * weights)
+
+    bias_coeffs = params[:, :kb].T                               # (kb, 3)
+    if scale is not None:
+        scale_coeffs = scale[None]
+    else:
+        scale_coeffs = params[:, kb:].reshape(3, scale_order + 1, 3).transpose(1, 0, 2)
+
+    return TempCalibration(bias_coeffs, scale_coeffs, reference,
+                           np.floor(temps.min() - margin), np.ceil(temps.max() + margin), step)
+
+
+def residuals(calib, true, means, temps):
+
+    # (N, 3) error of the model's predicted means (g).
+
+    predicted = calib.bias(temps) + np.einsum('nij,nj->ni', calib.scale(temps), true)
+
+    return means - predicted
+
+
+
+#############################
+# Data
+#############################
+
+def load_temperature_recording(csv_file):
+
+    # Time, (n, 3) acceleration and (n,) temperature of a recording with a
+    # column whose header starts with 'temp' (one or two header lines, as
+    # the 15-hour and the six-position collectors write them).
+
+    with open(csv_file) as file:
+        lines = [file.readline(), file.readline()]
+    skiprows = 1 if lines[1][:1] in '-.0123456789' and lines[1][:1] else 2
+    header = [name.strip().lower() for name in lines[skiprows - 1].split(',')]
+    columns = [ii for ii, name in enumerate(header) if name.startswith('temp')]
+    if not columns:
+        raise ValueError(f"{csv_file} has no temperature column")
+    data = np.loadtxt(csv_file, skiprows = skiprows, delimiter=",", dtype=float, ndmin=2)
+
+    return data[:, 0], data[:, 1:4], data[:, columns[0]]
+
+
+def static_windows(accels, temps, true, size=1000):
+
+    # Split a static recording into windows of `size` samples. Returns the
+    # (N, 3) true orientation, means and stds and the (N,) mean temperature
+    # of each window, as model_select.load_positions does for six-position
+    # files.
+
+    count = len(accels) // size
+    accels = accels[:count*size].reshape(count, size, 3)
+    temps = temps[:count*size].reshape(count, size)
+
+    return (np.tile(true, (count, 1)), accels.mean(axis=1), accels.std(axis=1),
+            temps.mean(axis=1))
+
+
+
+if __name__ == '__main__':
+
+    from model_select import load_positions
+
+    parser = argparse.ArgumentParser(description="Fit the temperature-dependent accelerometer model.")
+    parser.add_argument('six_position_csvs', nargs='*', help="six-position files with a temp_mean column (pooled)")
+    parser.add_argument('--static', nargs='+', default=[], help="static recordings with a temperature column")
+    parser.add_argument('--true', type=float, nargs=3, default=[0.0, 0.0, 1.0], help="orientation of the static recordings (g)")
+    parser.add_argument('--window', type=int, default=1000, help="samples per window of the static recordings")
+    parser.add_argument('--bias-order', type=int, default=2, help="polynomial order of bias(T)")
+    parser.add_argument('--scale-order', type=int, default=1, help="polynomial order of S(T)")
+    parser.add_argument('--scale', help="hold S at model 3 of this optim_params file and fit only bias(T) (needed for one orientation)")
+    parser.add_argument('--params', default='temp_params.csv', help="save the model here")
+    parser.add_argument('--test', help="calibrate this recording (with a temperature column) and integrate it")
+    args = parser.parse_args()
+
+    parts = []
+    if args.six_position_csvs:
+        true, means, stds, temps, _ = load_positions(args.six_position_csvs)
+        if temps is None:
+            parser.error("every six-position file needs a temperature column")
+        parts.append((true, means, stds, temps))
+    for csv_file in args.static:
+        _, accels, temps = load_temperature_recording(csv_file)
+        parts.append(static_windows(accels, temps, args.true, args.window))
+    if not parts:
+        parser.error("give six-position files and/or --static recordings")
+    true, means, stds, temps = (np.concatenate(arrays) for arrays in zip(*parts))
+
+    scale = None
+    if args.scale:
+        from calib_pipeline import load_params, model_3
+        scale = model_3(load_params(args.scale))[1].T    # S[i, j], as scale_coeffs
+    try:
+        calib = fit_temp_model(true, means, stds, temps, args.bias_order, args.scale_order, scale=scale)
+        flat = fit_temp_model(true, means, stds, np.full(len(temps), calib.reference), 0, 0, scale=scale)    # model 3, no temperature
+    except ValueError as error:
+        parser.error(f"{error}{'' if args.scale else ' (--scale)'}")
+    print(f"{len(temps)} windows, {temps.min():.2f} to {temps.max():.2f} C (reference {calib.reference:.2f} C)")
+    print("Bias(T) coefficients (g/C^k), one row per power:\n", calib.bias_coeffs)
+    print("Scale factor diagonal slope (1/C):", np.round(np.diagonal(calib.scale_coeffs[1]) if len(calib.scale_coeffs) > 1 else np.zeros(3), 7))
+    for name, model in (('model 3', flat), ('temperature model', calib)):
+        rms = np.sqrt(np.mean(residuals(model, true, means, temps)**2, axis=0))
+        print(f"RMS residual, {name}: {rms[0]:.2e}, {rms[1]:.2e}, {rms[2]:.2e} g")
+    calib.save(args.params)
+    print("Saved", args.params)
+
+    if args.test:
+        from calib_pipeline import to_m_s_s, integrate
+        times, accels, temps = load_temperature_recording(args.test)
+        displacement = integrate(times, to_m_s_s(calib.apply(accels, temps)))
+        print(f"Temperature Calibrated Final Displacement: {displacement[-1, 0]:0.3f}, {displacement[-1, 1]:0.3f}, {displacement[-1, 2]:0.3f}")
@@ -13,14 +13,22 @@
 # least-squares optimization. Finally, the second set of test data is calibrated
 # using the optimized acceleration model, integrated for displacement, and
 # calibrated again using the optimized displacement model. 
+
+# Gravity is removed from the z axis, which assumes z points exactly up.
+# Run with --gravity-seconds S to instead estimate gravity from the tilt of
+# each recording's first S (static) seconds and remove it from all three
+# axes (calib_pipeline.to_m_s_s, gravity_comp.py).
+
+# Each step is timed as a named stage and the times are saved to
+# two_levels_calib_timing.json. Run with --profile to also save cProfile
+# statistics (two_levels_calib_timing.prof) and tracemalloc allocation peaks.
 ##############################################################################
 
 import sys
 sys.path.append('../')
 import numpy as np   
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
-from scipy.integrate import cumtrapz    
+from stage_timer import StageTimer
+from scipy_compat import cumtrapz
 
 
 def bias_model(true_accel, bias):
@@ -38,17 +46,6 @@ def misalignment_model(true_accel, bias, s1, s2, s3):
     # measured_accel = scale_factor_matrix * true_accel + bias
     return (true_accel[0]*s1 + true_accel[1]*s2 + true_accel[2]*s3 + bias)
 
-def misalignment_model_2(measured_accel, bias, scale_f_matrix):
-    # Accelerometer Output Model -- Bias and Scale Factor Matrix (includes misalignment)
-    # measured_accel = true_accel*scale_f_matrix + bias
-    # true_accel = (measured_accel - bias)*(scale_f_matrix)^-1
-    true_accel = np.array([np.dot((measured_accel[0]-bias), np.linalg.inv(scale_f_matrix))])
-    
-    for ii in range(1, np.shape(measured_accel)[0]):
-        true_accel = np.append(true_accel, [np.dot((measured_accel[ii]-bias), np.linalg.inv(scale_f_matrix))], axis=0)
-   
-    return (true_accel)
-
 def disp_model(times, q0, q1, q2):
     # Error in displacement model
     return (0.5*q2*times*times + q1*times + q0) # equals calculated displacement
@@ -78,6 +75,8 @@ def graph_data(times, x, y, z, Y_AXIS, TITLE, FILENAME):
     
     # Graph x, y, and z data on one plot.
 
+    import matplotlib.pyplot as plt    # loaded on first use, not at import
+
     fig = plt.figure()
     axs = fig.add_subplot(1,1,1)
 
@@ -89,6 +88,7 @@ def graph_data(times, x, y, z, Y_AXIS, TITLE, FILENAME):
     axs.set_title(TITLE)
     axs.legend()
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
@@ -98,77 +98,89 @@ def graph_data(times, x, y, z, Y_AXIS, TITLE, FILENAME):
 
 if __name__ == '__main__':
     
+    from scipy.optimize import curve_fit
+    from calib_pipeline import apply_accel_model, to_m_s_s    # model 3 inverted once, all samples in one product
+
+    timer = StageTimer(profile='--profile' in sys.argv)    # times each stage below
+    gravity_seconds = None    # remove gravity from z (facing up)
+    if '--gravity-seconds' in sys.argv:
+        gravity_seconds = float(sys.argv[sys.argv.index('--gravity-seconds') + 1])    # estimate gravity from the tilt
+        if gravity_seconds <= 0:
+            sys.exit("--gravity-seconds must be positive")
+
     ##########################################################
     # Read all of the six-position data from CSV file
     ##########################################################
 
-    # Read six-position data from CSV file
-    file = open("data/final_trial/six_position_data.csv") 
-    read_data = np.loadtxt(file, skiprows = 1, delimiter=",", dtype=float) 
+    with timer.stage('load six-position data'):
+        # Read six-position data from CSV file
+        file = open("data/final_trial/six_position_data.csv") 
+        read_data = np.loadtxt(file, skiprows = 1, delimiter=",", dtype=float) 
     
-    # Divide data into seperate arrays
-    x_true = read_data[:, 0]  # true x acceleration (gravity)
-    x_mean = read_data[:, 1]  # mean x measured acceleration
-    x_std  = read_data[:, 2]  # standard deviation of each meaurement -- NOT the SDOM of x_mean!!!!
-    y_true = read_data[:, 3]  # y
-    y_mean = read_data[:, 4]  # y
-    y_std  = read_data[:, 5]  # y
-    z_true = read_data[:, 6]  # z
-    z_mean = read_data[:, 7]  # z
-    z_std  = read_data[:, 8]  # z
+        # Divide data into seperate arrays
+        x_true = read_data[:, 0]  # true x acceleration (gravity)
+        x_mean = read_data[:, 1]  # mean x measured acceleration
+        x_std  = read_data[:, 2]  # standard deviation of each meaurement -- NOT the SDOM of x_mean!!!!
+        y_true = read_data[:, 3]  # y
+        y_mean = read_data[:, 4]  # y
+        y_std  = read_data[:, 5]  # y
+        z_true = read_data[:, 6]  # z
+        z_mean = read_data[:, 7]  # z
+        z_std  = read_data[:, 8]  # z
     
-    true = np.stack((x_true, y_true, z_true), axis = 0) # combine all truth data, for convenience
+        true = np.stack((x_true, y_true, z_true), axis = 0) # combine all truth data, for convenience
 
 
     ##########################################################
     # Optimize the paramters in all three accelerometer models
     ##########################################################
 
-    # Optimize Parameters for X
-    print('X Parameters')
-    params, covar = curve_fit(bias_model, x_true, x_mean, sigma=x_std)
-    b_x1 = params.item()
-    #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) # extract diagonal components (variances) and square them to get std dev
-
-    params, covar = curve_fit(scale_factor_model, x_true, x_mean, p0=(b_x1, 1), sigma=x_std)
-    b_x2, Sxx2 = params[0].item(), params[1].item()
-    #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
-
-    params, covar = curve_fit(misalignment_model, true, x_mean, p0=(b_x2, Sxx2, 0, 0), sigma=x_std)
-    b_x3, Sxx3, Sxy3, Sxz3 = params[0].item(), params[1].item(), params[2].item(), params[3].item()
-    print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) 
-    print('')
+    with timer.stage('fit accel models'):
+        # Optimize Parameters for X
+        print('X Parameters')
+        params, covar = curve_fit(bias_model, x_true, x_mean, sigma=x_std)
+        b_x1 = params.item()
+        #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) # extract diagonal components (variances) and square them to get std dev
+
+        params, covar = curve_fit(scale_factor_model, x_true, x_mean, p0=(b_x1, 1), sigma=x_std)
+        b_x2, Sxx2 = params[0].item(), params[1].item()
+        #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
+
+        params, covar = curve_fit(misalignment_model, true, x_mean, p0=(b_x2, Sxx2, 0, 0), sigma=x_std)
+        b_x3, Sxx3, Sxy3, Sxz3 = params[0].item(), params[1].item(), params[2].item(), params[3].item()
+        print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) 
+        print('')
     
 
-    # Optimize Parameters for Y
-    print('Y Parameters')
-    params, covar = curve_fit(bias_model, y_true, y_mean, sigma=y_std)
-    b_y1 = params.item()
-    #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
+        # Optimize Parameters for Y
+        print('Y Parameters')
+        params, covar = curve_fit(bias_model, y_true, y_mean, sigma=y_std)
+        b_y1 = params.item()
+        #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
 
-    params, covar = curve_fit(scale_factor_model, y_true, y_mean, p0=(b_y1, 1), sigma=y_std)
-    b_y2, Syy2 = params[0].item(), params[1].item()
-    #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
+        params, covar = curve_fit(scale_factor_model, y_true, y_mean, p0=(b_y1, 1), sigma=y_std)
+        b_y2, Syy2 = params[0].item(), params[1].item()
+        #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
 
-    params, covar = curve_fit(misalignment_model, true, y_mean, p0=(b_y2, -0.0039, Syy2, 0.0083), sigma=y_std)
-    b_y3, Syx3, Syy3, Syz3 = params[0].item(), params[1].item(), params[2].item(), params[3].item()
-    print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) 
-    print('')
+        params, covar = curve_fit(misalignment_model, true, y_mean, p0=(b_y2, -0.0039, Syy2, 0.0083), sigma=y_std)
+        b_y3, Syx3, Syy3, Syz3 = params[0].item(), params[1].item(), params[2].item(), params[3].item()
+        print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) 
+        print('')
 
 
-    # Optimize Parameters for Z
-    print('Z Parameters')
-    params, covar = curve_fit(bias_model, z_true, z_mean, sigma=z_std)
-    b_z1 = params.item()
-    #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
+        # Optimize Parameters for Z
+        print('Z Parameters')
+        params, covar = curve_fit(bias_model, z_true, z_mean, sigma=z_std)
+        b_z1 = params.item()
+        #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
 
-    params, covar = curve_fit(scale_factor_model, z_true, z_mean, p0=(b_z1, 1), sigma=z_std)
-    b_z2, Szz2 = params[0].item(), params[1].item()
-    #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) 
+        params, covar = curve_fit(scale_factor_model, z_true, z_mean, p0=(b_z1, 1), sigma=z_std)
+        b_z2, Szz2 = params[0].item(), params[1].item()
+        #print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) 
 
-    params, covar = curve_fit(misalignment_model, true, z_mean, p0=(b_z2, -0.0089, -0.0048, Szz2), sigma=z_std)
-    b_z3, Szx3, Szy3, Szz3 = params[0].item(), params[1].item(), params[2].item(), params[3].item()
-    print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
+        params, covar = curve_fit(misalignment_model, true, z_mean, p0=(b_z2, -0.0089, -0.0048, Szz2), sigma=z_std)
+        b_z3, Szx3, Szy3, Szz3 = params[0].item(), params[1].item(), params[2].item(), params[3].item()
+        print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100)
 
     
 
@@ -177,33 +189,34 @@ if __name__ == '__main__':
     # Calibrate the test data using Model 3
     ###############################################
     
-    # Read acceleration data from CSV file
-    file = open("data/final_trial/six_position_test_data.csv")    # containts raw acceleration data collected 179 Hz over one minute
-    accel_data = np.loadtxt(file, skiprows = 2, delimiter=",", dtype=float) 
-    time_array = accel_data[:, 0]    # time stamps for integrating
-    accels = accel_data[:,1:]    # three columns  of acceleration [g] (x, y, z)
-
-    # Calibrate using Model 3
-    bias = np.array([b_x3, b_y3, b_z3])    # extract optimized biases
-    scale_f = (np.array([[Sxx3, Sxy3, Sxz3],    # extract optimized scale factors, including misalignments
-                           [Syx3, Syy3, Syz3],
-                           [Szx3, Szy3, Szz3]])).T
-    accel_calib = misalignment_model_2(accels, bias, scale_f)    # calibrate using Model 3
+    with timer.stage('load test data'):
+        # Read acceleration data from CSV file
+        file = open("data/final_trial/six_position_test_data.csv")    # containts raw acceleration data collected 179 Hz over one minute
+        accel_data = np.loadtxt(file, skiprows = 2, delimiter=",", dtype=float) 
+        time_array = accel_data[:, 0]    # time stamps for integrating
+        accels = accel_data[:,1:]    # three columns  of acceleration [g] (x, y, z)
+
+    with timer.stage('calibrate test data', samples=len(accels)):
+        # Calibrate using Model 3
+        bias = np.array([b_x3, b_y3, b_z3])    # extract optimized biases
+        scale_f = (np.array([[Sxx3, Sxy3, Sxz3],    # extract optimized scale factors, including misalignments
+                               [Syx3, Syy3, Syz3],
+                               [Szx3, Szy3, Szz3]])).T
+        accel_calib = apply_accel_model(accels, bias, scale_f)    # calibrate using Model 3
 
 
     ###############################################
     # Calculate the Displacement over Time from Acc.
     ###############################################
 
-    # Convert from units of g to m/s/s 
-    accel_calib = accel_calib * 9.797 
-
-    # Remove gravity from the z data (facing up)
-    accel_calib[:,2] = accel_calib[:,2] - 9.797 
+    with timer.stage('integrate test data', samples=len(time_array)):
+        # Convert from units of g to m/s/s and remove gravity
+        gravity_samples = None if gravity_seconds is None else int(np.searchsorted(time_array, time_array[0] + gravity_seconds))
+        accel_calib = to_m_s_s(accel_calib, gravity_samples=gravity_samples)
 
-    # Integrate raw and calibrated data over time
-    cal_dis_x, cal_dis_y, cal_dis_z = integrate_data(time_array, accel_calib)
-    print(f"Model 3 Displacement: {cal_dis_x[-1]:0.0f}, {cal_dis_y[-1]:0.0f}, {cal_dis_z[-1]:0.0f}")
+        # Integrate raw and calibrated data over time
+        cal_dis_x, cal_dis_y, cal_dis_z = integrate_data(time_array, accel_calib)
+        print(f"Model 3 Displacement: {cal_dis_x[-1]:0.0f}, {cal_dis_y[-1]:0.0f}, {cal_dis_z[-1]:0.0f}")
 
     # Graph the displacement over time of each axis after calibrating with misalignments (model 3)
     y_axis_label = "Displacement (m)"
@@ -216,23 +229,24 @@ if __name__ == '__main__':
     # Optimzie the Displacement Error Model
     ###############################################
 
-    # Optimize Parameters for X
-    print('X Parameters')
-    params, covar = curve_fit(disp_model, time_array, cal_dis_x)
-    q0_x, q1_x, q2_x = params[0].item(), params[1].item(), params[2].item()
-    print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) # extract diagonal components (variances) and square them to get std dev
-
-    # Optimize Parameters for Y
-    print('Y Parameters')
-    params, covar = curve_fit(disp_model, time_array, cal_dis_y)
-    q0_y, q1_y, q2_y = params[0].item(), params[1].item(), params[2].item()
-    print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) # extract diagonal components (variances) and square them to get std dev
-
-    # Optimize Parameters for Z
-    print('Z Parameters')
-    params, covar = curve_fit(disp_model, time_array, cal_dis_z)
-    q0_z, q1_z, q2_z = params[0].item(), params[1].item(), params[2].item()
-    print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) # extract diagonal components (variances) and square them to get std dev
+    with timer.stage('fit drift model', samples=len(time_array)):
+        # Optimize Parameters for X
+        print('X Parameters')
+        params, covar = curve_fit(disp_model, time_array, cal_dis_x)
+        q0_x, q1_x, q2_x = params[0].item(), params[1].item(), params[2].item()
+        print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) # extract diagonal components (variances) and square them to get std dev
+
+        # Optimize Parameters for Y
+        print('Y Parameters')
+        params, covar = curve_fit(disp_model, time_array, cal_dis_y)
+        q0_y, q1_y, q2_y = params[0].item(), params[1].item(), params[2].item()
+        print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) # extract diagonal components (variances) and square them to get std dev
+
+        # Optimize Parameters for Z
+        print('Z Parameters')
+        params, covar = curve_fit(disp_model, time_array, cal_dis_z)
+        q0_z, q1_z, q2_z = params[0].item(), params[1].item(), params[2].item()
+        print("Parameters: ", params, " Uncertainties (%): ", np.sqrt(np.diag(covar))/params * 100) # extract diagonal components (variances) and square them to get std dev
 
     """
     ########################################
@@ -262,28 +276,29 @@ if __name__ == '__main__':
     # Calibrate NEW Static Data with Disp. Model
     ###############################################
 
-    # Read acceleration data from CSV file
-    file = open("data/final_trial/six_position_final_test_data.csv")    # containts raw acceleration data collected 179 Hz over five minutes
-    accel_data = np.loadtxt(file, skiprows = 2, delimiter=",", dtype=float) 
-    time_array = accel_data[:60*180, 0]    # time stamps for integrating
-    accels = accel_data[:60*180,1:]    # three columns  of acceleration [g] (x, y, z)
+    with timer.stage('load final test data'):
+        # Read acceleration data from CSV file
+        file = open("data/final_trial/six_position_final_test_data.csv")    # containts raw acceleration data collected 179 Hz over five minutes
+        accel_data = np.loadtxt(file, skiprows = 2, delimiter=",", dtype=float) 
+        time_array = accel_data[:60*180, 0]    # time stamps for integrating
+        accels = accel_data[:60*180,1:]    # three columns  of acceleration [g] (x, y, z)
     
-    # Calibrate using Model 3
-    bias = np.array([b_x3, b_y3, b_z3])    # extract optimized biases
-    scale_f = (np.array([[Sxx3, Sxy3, Sxz3],    # extract optimized scale factors, including misalignments
-                           [Syx3, Syy3, Syz3],
-                           [Szx3, Szy3, Szz3]])).T
-    accel_calib = misalignment_model_2(accels, bias, scale_f)    # calibrate using Model 3
-
-    # Convert from units of g to m/s/s 
-    accel_calib = accel_calib * 9.797 
-
-    # Remove gravity from the z data (facing up)
-    accel_calib[:,2] = accel_calib[:,2] - 9.797 
-
-    # Integrate raw and calibrated data over time
-    cal_dis_x, cal_dis_y, cal_dis_z = integrate_data(time_array, accel_calib)
-    print(f"Model 3 Displacement: {cal_dis_x[-1]:0.0f}, {cal_dis_y[-1]:0.0f}, {cal_dis_z[-1]:0.0f}")
+    with timer.stage('calibrate final test data', samples=len(accels)):
+        # Calibrate using Model 3
+        bias = np.array([b_x3, b_y3, b_z3])    # extract optimized biases
+        scale_f = (np.array([[Sxx3, Sxy3, Sxz3],    # extract optimized scale factors, including misalignments
+                               [Syx3, Syy3, Syz3],
+                               [Szx3, Szy3, Szz3]])).T
+        accel_calib = apply_accel_model(accels, bias, scale_f)    # calibrate using Model 3
+
+    with timer.stage('integrate final test data', samples=len(time_array)):
+        # Convert from units of g to m/s/s and remove gravity
+        gravity_samples = None if gravity_seconds is None else int(np.searchsorted(time_array, time_array[0] + gravity_seconds))
+        accel_calib = to_m_s_s(accel_calib, gravity_samples=gravity_samples)
+
+        # Integrate raw and calibrated data over time
+        cal_dis_x, cal_dis_y, cal_dis_z = integrate_data(time_array, accel_calib)
+        print(f"Model 3 Displacement: {cal_dis_x[-1]:0.0f}, {cal_dis_y[-1]:0.0f}, {cal_dis_z[-1]:0.0f}")
 
     """
     # Graph new data with trend curves from previous block
@@ -304,19 +319,22 @@ if __name__ == '__main__':
     
     
 
-    # Calibrate using Disp. Model
-    disp_calib_x = cal_dis_x - disp_model(time_array, q0_x, q1_x, q2_x)
-    disp_calib_y = cal_dis_y - disp_model(time_array, q0_y, q1_y, q2_y)
-    disp_calib_z = cal_dis_z - disp_model(time_array, q0_z, q1_z, q2_z)
-    print(f"Final Displacement: {disp_calib_x[-1]:0.0f}, {disp_calib_y[-1]:0.0f}, {disp_calib_z[-1]:0.0f}")
+    with timer.stage('correct drift', samples=len(time_array)):
+        # Calibrate using Disp. Model
+        disp_calib_x = cal_dis_x - disp_model(time_array, q0_x, q1_x, q2_x)
+        disp_calib_y = cal_dis_y - disp_model(time_array, q0_y, q1_y, q2_y)
+        disp_calib_z = cal_dis_z - disp_model(time_array, q0_z, q1_z, q2_z)
+        print(f"Final Displacement: {disp_calib_x[-1]:0.0f}, {disp_calib_y[-1]:0.0f}, {disp_calib_z[-1]:0.0f}")
 
 
-    # Graph the displacement over time of each axis after calibrating with misalignments (model 3)
-    y_axis_label = "Displacement (m)"
-    title = "Final Calibrated Displacement"
-    image_file_name = "displacement_misalignment_plus_new.png"
-    graph_data(time_array, disp_calib_x, disp_calib_y, disp_calib_z, Y_AXIS=y_axis_label, TITLE=title, FILENAME=image_file_name)
+    with timer.stage('plot final displacement'):
+        # Graph the displacement over time of each axis after calibrating with misalignments (model 3)
+        y_axis_label = "Displacement (m)"
+        title = "Final Calibrated Displacement"
+        image_file_name = "displacement_misalignment_plus_new.png"
+        graph_data(time_array, disp_calib_x, disp_calib_y, disp_calib_z, Y_AXIS=y_axis_label, TITLE=title, FILENAME=image_file_name)
     
+    timer.report('two_levels_calib_timing.json')    # stage times (and profile, with --profile)
 
     exit()
     #############################
@@ -340,6 +358,8 @@ if __name__ == '__main__':
     # Graph x, y, and z data with trend fit.
     ########################################
 
+    import matplotlib.pyplot as plt
+
     fig = plt.figure()
     axs = fig.add_subplot(1,1,1)
 
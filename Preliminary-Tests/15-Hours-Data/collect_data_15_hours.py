@@ -16,16 +16,17 @@ while time.time()-t0<5:
     except:
         continue
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+import decimate
 import math
 
+if start_bool:
+    set_profile('accel_temp') # accelerometer and temperature, gyro in standby
 time.sleep(2) # wait for MPU to load and settle
 
 
 def get_accel():
-    ax,ay,az,_,_,_ = mpu6050_conv() # read and convert accel data
-    return ax,ay,az
+    ax,ay,az,temp = read_profile() # read and convert accel and temperature data
+    return ax,ay,az,temp
 
     
 def accel_cal(total_time):
@@ -37,7 +38,7 @@ def accel_cal(total_time):
     start_time = time.time()
 
     file = open('accel_over_time.csv', 'a') # name csv after calibration trial and axis
-    file.write('time' + ',' + 'x (g)' + ',' + 'y (g)' + ',' + 'z (g)' + '\n') # label each column
+    file.write('time' + ',' + 'x (g)' + ',' + 'y (g)' + ',' + 'z (g)' + ',' + 'temp (C)' + '\n') # label each column
     file.close()
 
     while (time.time() - start_time) < total_time:
@@ -46,7 +47,7 @@ def accel_cal(total_time):
         # Collect accelerometer readings over time
         ##############################################
 
-        x_accel, y_accel, z_accel = get_accel()
+        x_accel, y_accel, z_accel, temp = get_accel()
         elapsed_time = time.time() - start_time
         
         ###########################
@@ -54,7 +55,7 @@ def accel_cal(total_time):
         ###########################
 
         file = open('accel_over_time.csv', 'a') # name csv after calibration trial and axis
-        file.write(str(elapsed_time / 60 / 60) + ',' + str(x_accel) + ',' + str(y_accel) + ',' + str(z_accel) + '\n')
+        file.write(str(elapsed_time / 60 / 60) + ',' + str(x_accel) + ',' + str(y_accel) + ',' + str(z_accel) + ',' + str(temp) + '\n')
         file.close()
 
     return
@@ -62,11 +63,13 @@ def accel_cal(total_time):
 
 def graph_data(times, x_accels, y_accels, z_accels, TITLE, FILENAME):
 
+    import matplotlib.pyplot as plt    # loaded only when plotting, so sampling starts quickly
+
     fig,axs = plt.subplots(3,1)
 
-    axs[0].scatter(times, x_accels, s=1, color='r')
-    axs[1].scatter(times, y_accels, s=1, color='b')
-    axs[2].scatter(times, z_accels, s=1, color='g')
+    decimate.scatter_minmax(axs[0], times, x_accels, color='r')    # one min/max line per pixel
+    decimate.scatter_minmax(axs[1], times, y_accels, color='b')    # one min/max line per pixel
+    decimate.scatter_minmax(axs[2], times, z_accels, color='g')    # one min/max line per pixel
     axs[0].set_ylabel('X Accel. [g]')
     axs[1].set_ylabel('Y Accel. [g]')
     axs[2].set_ylabel('Z Accel. [g]')
@@ -74,6 +77,7 @@ def graph_data(times, x_accels, y_accels, z_accels, TITLE, FILENAME):
     #axs.set_ylim([-2,2])
     axs[0].set_title(TITLE)
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
@@ -99,8 +103,7 @@ if __name__ == '__main__':
 
         accel_cal(total_time=60*60*15) # collect over 15 hours
 
-        file = open("accel_over_time.csv")
-        read_data = np.loadtxt(file, skiprows = 1, delimiter=",", dtype=float)
+        read_data = decimate.load_memmap("accel_over_time.csv", skiprows = 1)    # memory mapped, not loaded
         time_array = read_data[:, 0]
         x_accels = read_data[:, 1]
         y_accels = read_data[:, 2]
@@ -8,6 +8,7 @@ import time,sys
 sys.path.append('../')
 import numpy as np
 import matplotlib.pyplot as plt
+import decimate
 from scipy.optimize import curve_fit
 import math
 from scipy.stats import norm
@@ -23,12 +24,13 @@ def graph_data(times, accels, TITLE, FILENAME, c):
     fig = plt.figure()
     axs = fig.add_subplot(1,1,1)
 
-    plt.scatter(times, accels, s=1, color=c)
+    decimate.scatter_minmax(axs, times, accels, color=c)    # one min/max line per pixel
     axs.set_ylabel('Acceleration [g]')
     axs.set_xlabel('Time (hours)')
     #axs.set_ylim([-2,2])
     axs.set_title(TITLE)
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
@@ -43,6 +45,7 @@ def graph_hist(accels, c, TITLE, FILENAME):
     #axs.set_ylabel('')
     axs.set_xlabel('Acceleration [g]')
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
@@ -53,8 +56,7 @@ def graph_hist(accels, c, TITLE, FILENAME):
 
 if __name__ == '__main__':
     
-    file = open("accel_over_time.csv")
-    read_data = np.loadtxt(file, skiprows = 1, delimiter=",", dtype=float)
+    read_data = decimate.load_memmap("accel_over_time.csv", skiprows = 1)    # memory mapped, not loaded
     time_array = read_data[:, 0]
     x_accels = read_data[:, 1]
     y_accels = read_data[:, 2]
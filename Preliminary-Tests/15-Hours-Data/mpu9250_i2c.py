@@ -14,7 +14,7 @@
 #
 #########################################
 #
-import smbus,time
+import smbus,time,struct
 
 def MPU6050_start():
     # reset all sensors
@@ -65,16 +65,15 @@ def read_raw_bits(register):
         value -= 65536
     return value
 
+def read_burst(register,count):
+    # read count consecutive 16-bit registers (high byte first) in one
+    # I2C transaction, as +- values
+    data = bus.read_i2c_block_data(MPU6050_ADDR, register, 2*count)
+    return struct.unpack('>%dh' % count, bytes(data))
+
 def mpu6050_conv():
-    # raw acceleration bits
-    acc_x = read_raw_bits(ACCEL_XOUT_H)
-    acc_y = read_raw_bits(ACCEL_YOUT_H)
-    acc_z = read_raw_bits(ACCEL_ZOUT_H)
-    
-    # raw gyroscope bits
-    gyro_x = read_raw_bits(GYRO_XOUT_H)
-    gyro_y = read_raw_bits(GYRO_YOUT_H)
-    gyro_z = read_raw_bits(GYRO_ZOUT_H)
+    # raw acceleration, temperature and gyroscope bits in one burst
+    acc_x,acc_y,acc_z,_,gyro_x,gyro_y,gyro_z = read_burst(ACCEL_XOUT_H,7)
 
     #convert to acceleration in g and gyro dps
     a_x = (acc_x/(2.0**15.0))*accel_sens
@@ -87,6 +86,43 @@ def mpu6050_conv():
     
     return a_x,a_y,a_z,w_x,w_y,w_z
 
+def set_profile(name,temp=None):
+    # select an acquisition profile: power down the blocks it does not
+    # read (PWR_MGMT_2 for accel and gyro axes, PWR_MGMT_1 for the
+    # temperature sensor) and use its burst layout in read_profile.
+    # temp=True keeps the temperature sensor on for read_temp
+    global profile
+    words,standby,temp_on,mag_on = PROFILES[name]
+    if temp is None:
+        temp = temp_on
+    bus.write_byte_data(MPU6050_ADDR, PWR_MGMT_2, standby)
+    bus.write_byte_data(MPU6050_ADDR, PWR_MGMT_1, 0x01 if temp else 0x01|TEMP_DIS)
+    time.sleep(0.1) # let the powered blocks settle (gyro start-up ~35 ms)
+    profile = name
+    return
+
+def read_profile():
+    # read the channels of the current profile, accel (g) [, temperature
+    # (C)] [, gyro (dps)] [, magnetic field (uT)], in one burst from
+    # ACCEL_XOUT_H (plus one from the AK8963 for 9dof)
+    words,_,temp_on,mag_on = PROFILES[profile]
+    raw = read_burst(ACCEL_XOUT_H,words)
+    a = accel_sens/(2.0**15.0)
+    values = (raw[0]*a,raw[1]*a,raw[2]*a)
+    if temp_on:
+        values += (raw[3]/temp_sens + temp_offset,)
+    if words == 7:
+        w = gyro_sens/(2.0**15.0)
+        values += (raw[4]*w,raw[5]*w,raw[6]*w)
+    if mag_on:
+        values += AK8963_conv()
+    return values
+
+def read_temp():
+    # read the temperature (C) on its own, for polling it at a lower rate
+    # than the profile (needs the sensor on, see set_profile)
+    return read_burst(TEMP_OUT_H,1)[0]/temp_sens + temp_offset
+
 def AK8963_start():
     bus.write_byte_data(AK8963_ADDR,AK8963_CNTL,0x00)
     time.sleep(0.1)
@@ -123,26 +159,25 @@ def AK8963_conv():
     while 1:
 ##        if ((bus.read_byte_data(AK8963_ADDR,AK8963_ST1) & 0x01))!=1:
 ##            return 0,0,0
-        mag_x = AK8963_reader(HXH)
-        mag_y = AK8963_reader(HYH)
-        mag_z = AK8963_reader(HZH)
-
-        # the next line is needed for AK8963
-        if (bus.read_byte_data(AK8963_ADDR,AK8963_ST2)) & 0x08!=0x08:
+        # HXL to HZH (low byte first) and ST2 in one burst; reading ST2
+        # is needed for AK8963 to end the measurement
+        data = bus.read_i2c_block_data(AK8963_ADDR,HXL,7)
+        mag_x,mag_y,mag_z,st2 = struct.unpack('<3hB', bytes(data))
+        if st2 & 0x08!=0x08: # no magnetic sensor overflow (HOFL)
             break
         
-    #convert to acceleration in g and gyro dps
-##    m_x = AK8963_coeffs[0]*(mag_x/(2.0**15.0))*mag_sens
-##    m_y = AK8963_coeffs[1]*(mag_y/(2.0**15.0))*mag_sens
-##    m_z = AK8963_coeffs[2]*(mag_z/(2.0**15.0))*mag_sens
-    m_x = (mag_x/(2.0**15.0))*mag_sens
-    m_y = (mag_y/(2.0**15.0))*mag_sens
-    m_z = (mag_z/(2.0**15.0))*mag_sens
+    #convert to magnetic field in uT, with the factory sensitivity
+    #adjustment (ASAX, ASAY, ASAZ) read by AK8963_start
+    m_x = AK8963_coeffs[0]*(mag_x/(2.0**15.0))*mag_sens
+    m_y = AK8963_coeffs[1]*(mag_y/(2.0**15.0))*mag_sens
+    m_z = AK8963_coeffs[2]*(mag_z/(2.0**15.0))*mag_sens
     return m_x,m_y,m_z
     
 # MPU6050 Registers
 MPU6050_ADDR = 0x68
 PWR_MGMT_1   = 0x6B
+PWR_MGMT_2   = 0x6C
+TEMP_DIS     = 0x08
 SMPLRT_DIV   = 0x19
 CONFIG       = 0x1A
 GYRO_CONFIG  = 0x1B
@@ -159,6 +194,7 @@ GYRO_ZOUT_H  = 0x47
 #AK8963 registers
 AK8963_ADDR   = 0x0C
 AK8963_ST1    = 0x02
+HXL          = 0x03
 HXH          = 0x04
 HYH          = 0x06
 HZH          = 0x08
@@ -168,12 +204,26 @@ AK8963_CNTL  = 0x0A
 AK8963_ASAX = 0x10
 
 mag_sens = 4800.0 # magnetometer sensitivity: 4800 uT
+temp_sens = 333.87 # temperature sensitivity: LSB/C
+temp_offset = 21.0 # temperature at 0 LSB: C
+
+# Acquisition profiles
+#   name: (16-bit words read from ACCEL_XOUT_H, PWR_MGMT_2, temperature on, magnetometer)
+# each reads the shortest contiguous run of registers holding its
+# channels (ACCEL_XOUT_H, TEMP_OUT_H, GYRO_XOUT_H follow each other) and
+# PWR_MGMT_2 = 0b000111 puts the three gyro axes in standby
+PROFILES = {'accel':           (3,0b000111,False,False),
+            'accel_temp':      (4,0b000111,True,False),
+            'accel_gyro':      (7,0b000000,False,False),
+            'accel_gyro_temp': (7,0b000000,True,False),
+            '9dof':            (7,0b000000,False,True)}
 
 # start I2C driver
 bus = smbus.SMBus(1) # start comm with i2c bus
 time.sleep(0.1)
 gyro_sens,accel_sens = MPU6050_start() # instantiate gyro/accel
 time.sleep(0.1)
+profile = 'accel_gyro' # everything on after MPU6050_start
 AK8963_coeffs = AK8963_start() # instantiate magnetometer
 time.sleep(0.1)
 
@@ -6,6 +6,7 @@ import sys
 sys.path.append('../')
 import numpy as np
 import matplotlib.pyplot as plt
+import decimate
 
 
 
@@ -14,12 +15,13 @@ def graph_data(times, accels, TITLE, FILENAME, c):
     fig = plt.figure()
     axs = fig.add_subplot(1,1,1)
 
-    plt.scatter(times, accels, s=1, color=c)
+    decimate.scatter_minmax(axs, times, accels, color=c)    # one min/max line per pixel
     axs.set_ylabel('Acceleration [g]')
     axs.set_xlabel('Time (hours)')
     #axs.set_ylim([-2,2])
     axs.set_title(TITLE)
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
@@ -35,6 +37,7 @@ def graph_hist(accels, c, TITLE, FILENAME, binsize):
     axs.set_xlabel('Acceleration [m/s/s]')
     axs.set_xlim([-0.2, 0.2])
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
@@ -1,9 +1,9 @@
 
 import sys
 sys.path.append('../')
+sys.path.append('../../Best-Calibration-Method')
 import numpy as np  
-import matplotlib.pyplot as plt 
-from scipy.integrate import cumtrapz    
+from scipy_compat import cumtrapz
 
 
 def integrate_data(times, acceleration):
@@ -18,7 +18,7 @@ def integrate_data(times, acceleration):
     
     print("Finished Integrating")   # status update
     
-    return time_array, velocity, displacement
+    return times, velocity, displacement
 
 
 
@@ -26,6 +26,8 @@ def graph_data(x_times, y_times, z_times, x, y, z, Y_AXIS, TITLE, FILENAME):
     
     # Graph x, y, and z data on one plot. Each axis gets its own time value, in case data was filtered
 
+    import matplotlib.pyplot as plt    # loaded on first use, not at import
+
     fig = plt.figure()
     axs = fig.add_subplot(1,1,1)
 
@@ -38,6 +40,7 @@ def graph_data(x_times, y_times, z_times, x, y, z, Y_AXIS, TITLE, FILENAME):
     axs.set_title(TITLE)
     axs.legend()
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
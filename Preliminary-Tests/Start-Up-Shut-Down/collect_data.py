@@ -4,6 +4,8 @@
 # Written by: Will Ward 
 #  
 # Collect acceleration data from the MPU-9250 IMU 
+# The gyro is recorded too (wx, wy, wz columns, deg/s), for the
+# start-up behaviour of the gyro bias.
 # 
 ###################################################################
 
@@ -12,7 +14,7 @@
 import time,sys
 sys.path.append('../')
 import numpy as np
-import matplotlib.pyplot as plt
+import decimate
 
 # Wait for IMU to connect
 t0 = time.time()
@@ -24,33 +26,37 @@ while time.time()-t0<5:
         break
     except:
         continue
+if start_bool:
+    mpu9250_i2c.set_profile('accel_gyro') # accel and gyro in one burst read
 time.sleep(2) # wait for MPU to load and settle
 
 
 
 def get_accel():
-    # Read acceleration data from the IMU
-    ax,ay,az,_,_,_ = mpu9250_i2c.mpu6050_conv() # read and convert accel data
-    return ax,ay,az
+    # Read acceleration and angular rate data from the IMU
+    ax,ay,az,wx,wy,wz = mpu9250_i2c.read_profile() # read and convert accel and gyro data
+    return ax,ay,az,wx,wy,wz
 
 
 def accel_cal(total_time, FILENAME):
 
     # Open a CSV file for saving data. Label each column
     file = open(FILENAME, 'a') # name csv after calibration trial and axis
-    file.write('time' + ',' + 'x (g)' + ',' + 'y (g)' + ',' + 'z (g)' + '\n') # label each column
+    file.write('time' + ',' + 'x (g)' + ',' + 'y (g)' + ',' + 'z (g)' + ',' +
+               'wx (dps)' + ',' + 'wy (dps)' + ',' + 'wz (dps)' + '\n') # label each column
     file.close()
     
     start_time = time.time() # initialize start time
 
     while (time.time() - start_time) < total_time: # collect data for total_time seconds
 
-        x_accel, y_accel, z_accel = get_accel() # retrieve acceleration data points
+        x_accel, y_accel, z_accel, w_x, w_y, w_z = get_accel() # retrieve acceleration and angular rate data points
         elapsed_time = time.time() - start_time # record a time stamp
         
         # Save analyzed data to CSV
         file = open(FILENAME, 'a')
-        file.write(str(elapsed_time) + ',' + str(x_accel) + ',' + str(y_accel) + ',' + str(z_accel) + '\n')
+        file.write(str(elapsed_time) + ',' + str(x_accel) + ',' + str(y_accel) + ',' + str(z_accel) + ',' +
+                   str(w_x) + ',' + str(w_y) + ',' + str(w_z) + '\n')
         file.close()
 
     return
@@ -60,11 +66,13 @@ def graph_data(times, x_accels, y_accels, z_accels, TITLE, FILENAME):
 
     # Graph x, y, and z data on seperate plots.
 
+    import matplotlib.pyplot as plt    # loaded only when plotting, so sampling starts quickly
+
     fig,axs = plt.subplots(3,1)
 
-    axs[0].scatter(times, x_accels, s=1, color='r')
-    axs[1].scatter(times, y_accels, s=1, color='b')
-    axs[2].scatter(times, z_accels, s=1, color='g')
+    decimate.scatter_minmax(axs[0], times, x_accels, color='r')
+    decimate.scatter_minmax(axs[1], times, y_accels, color='b')
+    decimate.scatter_minmax(axs[2], times, z_accels, color='g')
     axs[0].set_ylabel('X Accel. [g]')
     axs[1].set_ylabel('Y Accel. [g]')
     axs[2].set_ylabel('Z Accel. [g]')
@@ -72,6 +80,7 @@ def graph_data(times, x_accels, y_accels, z_accels, TITLE, FILENAME):
     #axs.set_ylim([-2,2])
     axs[0].set_title(TITLE)
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
@@ -106,6 +115,7 @@ if __name__ == '__main__':
         
         print("Means: ", np.mean(x_accels), " ", np.mean(y_accels), " ", np.mean(z_accels))
         print("Std D: ", np.std(x_accels),  " ", np.std(y_accels),  " ", np.std(z_accels))
+        print("Gyro bias (dps): ", np.mean(read_data[:, 4]), " ", np.mean(read_data[:, 5]), " ", np.mean(read_data[:, 6]))
 
         #graph_data(time_array, x_accels, y_accels, z_accels, TITLE="Acceleration over Time", FILENAME="accel_over_time.png")
 
@@ -1,19 +1,29 @@
 ##################################################################
 # Program Name: process_data.py
-# Written by: Will Ward 
-#  
+# Written by: Will Ward
+#
 # Function:
 #     1. Extract all of the start-up collect data
 #     2. Calcualte the mean and standard deviation of each trial
-#     3. Graph the means and standard deviations  
+#     3. Graph the means and standard deviations
+#
+# Trials are read from Data/ in parallel (threads read the files,
+# worker processes parse them) and each parsed trial is cached as
+# a .npy file in Data/.cache. Re-running after adding new trials
+# only reads and parses the new (or modified) CSV files.
 ###################################################################
 
 
 
-import time,sys
+import os,re,sys
 sys.path.append('../')
 import numpy as np
 import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+DATA_DIR = 'Data'    # folder containing start_up_data_<n>.csv
+CACHE_DIR = os.path.join(DATA_DIR, '.cache')    # parsed trials are cached here
 
 
 
@@ -23,7 +33,7 @@ def graph_data(x, y, z, x_std, y_std, z_std, TITLE, FILENAME):
 
     fig,axs = plt.subplots(3,1)
 
-    trials = range(60)
+    trials = range(len(x))
 
     axs[0].errorbar(trials, x, yerr=x_std, color='r')
     axs[1].errorbar(trials, y, yerr=y_std, color='b')
@@ -35,42 +45,120 @@ def graph_data(x, y, z, x_std, y_std, z_std, TITLE, FILENAME):
     #axs.set_ylim([-2,2])
     axs[0].set_title(TITLE)
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
 
+def find_trials(data_dir):
+
+    # Return the CSV files of every start-up trial in data_dir,
+    # sorted by trial number (start_up_data_<n>.csv).
+
+    trials = []
+    for name in os.listdir(data_dir):
+        match = re.fullmatch(r'start_up_data_(\d+)\.csv', name)
+        if match:
+            trials.append((int(match.group(1)), os.path.join(data_dir, name)))
+
+    return [path for _, path in sorted(trials)]
+
+
+def cache_path(csv_file, cache_dir):
+
+    # Location of the cached (parsed) copy of a trial's CSV file.
+
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_file))[0] + '.npy')
+
+
+def read_file(csv_file):
+
+    # Read the raw text of a CSV file (runs in the I/O thread pool).
+
+    with open(csv_file) as file:
+        return file.read()
+
+
+def parse_csv(text):
+
+    # Parse the text of one trial into an (N, 4) array of
+    # time, x, y, z, or (N, 7) with the gyro's wx, wy, wz
+    # (runs in the parsing process pool).
+
+    return np.loadtxt(text.splitlines(), skiprows = 1, delimiter=",", dtype=float)
+
+
+def load_trials(csv_files, cache_dir=CACHE_DIR, workers=None):
+
+    # Load every trial in csv_files, returning a list of (N, 4) arrays.
+    # Trials with an up-to-date cache file are loaded from the cache.
+    # All other trials are read concurrently by a thread pool, parsed
+    # by a process pool, and then written to the cache.
+
+    os.makedirs(cache_dir, exist_ok=True)
+    trials = [None] * len(csv_files)
+    stale = []    # indices of trials that must be parsed from CSV
+
+    for ii, csv_file in enumerate(csv_files):
+        npy_file = cache_path(csv_file, cache_dir)
+        if os.path.exists(npy_file) and os.path.getmtime(npy_file) >= os.path.getmtime(csv_file):
+            trials[ii] = np.load(npy_file)
+        else:
+            stale.append(ii)
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=workers) as io_pool:
+            texts = list(io_pool.map(read_file, [csv_files[ii] for ii in stale]))
+
+        with ProcessPoolExecutor(max_workers=workers) as cpu_pool:
+            parsed = list(cpu_pool.map(parse_csv, texts))
+
+        for ii, read_data in zip(stale, parsed):
+            np.save(cache_path(csv_files[ii], cache_dir), read_data)
+            trials[ii] = read_data
+
+    return trials
+
+
+def trial_stats(trials, columns=slice(1, 4)):
+
+    # Mean, standard deviation and sample count of every trial
+    # (of the acceleration, or of other columns, e.g. slice(4, 7)
+    # for the gyro).
+    # All trials are concatenated and reduced in one pass with
+    # np.add.reduceat, so trials may have different lengths.
+    # Returns means (T, 3), std_devs (T, 3) and counts (T,).
+
+    counts = np.array([len(read_data) for read_data in trials])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    accels = np.concatenate([read_data[:, columns] for read_data in trials])
+
+    means = np.add.reduceat(accels, starts, axis=0) / counts[:, None]
+    residuals = accels - np.repeat(means, counts, axis=0)
+    std_devs = np.sqrt(np.add.reduceat(residuals**2, starts, axis=0) / counts[:, None])
+
+    return means, std_devs, counts
+
 
 
 
 
 if __name__ == '__main__':
-    
+
     # Look at each minute individually
 
-    x_means = []
-    y_means = []
-    z_means = []
-    x_std_devs = []
-    y_std_devs = []
-    z_std_devs = []
-
-    for ii in range (1, 61):
-        # Open the CSV file again and graph the data
-        file = open('Data/start_up_data_'+str(ii)+'.csv')
-        read_data = np.loadtxt(file, skiprows = 1, delimiter=",", dtype=float)
-        time_array = read_data[:, 0] # seperate data into arays
-        x_accels = read_data[:, 1] * 9.797
-        y_accels = read_data[:, 2] * 9.797
-        z_accels = read_data[:, 3] * 9.797
-        
-        x_means.append(np.mean(x_accels))
-        y_means.append(np.mean(y_accels))
-        z_means.append(np.mean(z_accels))
-        x_std_devs.append(np.std(x_accels)) # standard deviation of each minute (uncertaitny in one measurement in the array)
-        y_std_devs.append(np.std(y_accels)) # CAN'T USE THIS FOR SDOM BECAUSE IT DOES NOT ACCOUNT FOR SYSTEMATIC UNCERTAINTY
-        z_std_devs.append(np.std(z_accels)) # AMONG ALL THE MEANS
-    
-    #for ii in range (0,3):
+    csv_files = find_trials(DATA_DIR)
+    trials = load_trials(csv_files)
+    means, std_devs, counts = trial_stats(trials)
+
+    means = means * 9.797    # convert from g to m/s/s
+    std_devs = std_devs * 9.797 # standard deviation of each minute (uncertaitny in one measurement in the array)
+                                # CAN'T USE THIS FOR SDOM BECAUSE IT DOES NOT ACCOUNT FOR SYSTEMATIC UNCERTAINTY
+                                # AMONG ALL THE MEANS
+    x_means, y_means, z_means = means.T
+    x_std_devs, y_std_devs, z_std_devs = std_devs.T
+
+    print("Trials: ", len(trials), " Samples per trial (min, max): ", counts.min(), " ", counts.max())
     print("X mean mean   : ", np.mean(x_means)) # mean of the array of means
     print("X mean std_dev: ", np.std(x_means)) # standard deviation of the array of means (uncertainty in one mean measurement)
     print("Y mean mean   : ", np.mean(y_means))
@@ -78,11 +166,20 @@ if __name__ == '__main__':
     print("Z mean mean   : ", np.mean(z_means))
     print("Z mean std_dev: ", np.std(z_means))
 
-    print("max x_SDOM: ", np.mean(x_std_devs)/np.sqrt(10820))
-    print("max y_SDOM: ", np.mean(y_std_devs)/np.sqrt(10820))
-    print("max z_SDOM: ", np.mean(z_std_devs)/np.sqrt(10820))
+    sdoms = std_devs / np.sqrt(counts[:, None])    # SDOM of each trial, using its own sample count
+    print("max x_SDOM: ", np.max(sdoms[:, 0]))
+    print("max y_SDOM: ", np.max(sdoms[:, 1]))
+    print("max z_SDOM: ", np.max(sdoms[:, 2]))
+
+    # Gyro bias of each trial, for the trials that recorded the gyro
+    gyro_trials = [read_data for read_data in trials if read_data.shape[1] >= 7]
+    if gyro_trials:
+        gyro_means, _, _ = trial_stats(gyro_trials, columns=slice(4, 7))
+        print("Gyro trials: ", len(gyro_trials))
+        print("Gyro bias mean    (dps): ", np.mean(gyro_means, axis=0))
+        print("Gyro bias std_dev (dps): ", np.std(gyro_means, axis=0))
 
     #graph_data(x_means, y_means, z_means, 0, 0, 0, TITLE="Mean (m/s/s) of Each One Minute Trial", FILENAME="means_over_trials_m_s_s.png")
     #graph_data(x_std_devs, y_std_devs, z_std_devs, TITLE="Standard Deviations (g) of Each One Minute Trial", FILENAME="std_over_trials.png")
     #graph_data(x_means, y_means, z_means, np.std(x_means), np.std(y_means), np.std(z_means),
-    #                    TITLE="Mean (g) of Each One Minute Trial with Uncertainty", FILENAME="means_over_trials_w_uncertainty.png")
\ No newline at end of file
+    #                    TITLE="Mean (g) of Each One Minute Trial with Uncertainty", FILENAME="means_over_trials_w_uncertainty.png")
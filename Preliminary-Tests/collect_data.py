@@ -7,7 +7,7 @@
 import time,sys
 sys.path.append('../')
 import numpy as np
-import matplotlib.pyplot as plt
+import decimate
 
 # Wait for IMU to connect
 t0 = time.time()    # start time
@@ -26,6 +26,7 @@ if not start_bool:
     exit()
 else:
     print("IMU Started")
+    mpu9250_i2c.set_profile('accel')    # read only the accelerometer, gyro in standby
     time.sleep(2)    # wait for MPU to load and settle
 
 
@@ -40,7 +41,7 @@ def accel_cal(total_time, FILENAME):
     start_time = time.time()    # initialize start time
     while (time.time() - start_time) < total_time:    # collect data for total_time seconds
 
-        x_accel, y_accel, z_accel ,_,_,_ = mpu9250_i2c.mpu6050_conv()    # retrieve acceleration measurement
+        x_accel, y_accel, z_accel = mpu9250_i2c.read_profile()    # retrieve acceleration measurement
         elapsed_time = time.time() - start_time    # record a time stamp
         
         # Save analyzed data to CSV
@@ -55,17 +56,20 @@ def graph_data(times, x_accels, y_accels, z_accels, TITLE, FILENAME):
 
     # Graph x, y, and z data on seperate plots.
 
+    import matplotlib.pyplot as plt    # loaded only when plotting, so sampling starts quickly
+
     fig,axs = plt.subplots(3,1)
 
-    axs[0].scatter(times, x_accels, s=1, color='r')
-    axs[1].scatter(times, y_accels, s=1, color='b')
-    axs[2].scatter(times, z_accels, s=1, color='g')
+    decimate.scatter_minmax(axs[0], times, x_accels, color='r')
+    decimate.scatter_minmax(axs[1], times, y_accels, color='b')
+    decimate.scatter_minmax(axs[2], times, z_accels, color='g')
     axs[0].set_ylabel('X Accel. [g]')
     axs[1].set_ylabel('Y Accel. [g]')
     axs[2].set_ylabel('Z Accel. [g]')
     axs[2].set_xlabel('Time (hours)')
     axs[0].set_title(TITLE)
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
@@ -0,0 +1,144 @@
+#############################################################################
+# Script Name: decimate.py
+
+# Data reduction for plotting long accelerometer recordings.
+
+# A 15 hour capture at ~180 Hz has almost ten million samples per axis, far
+# more than a plot has pixels. Each series is split into one bucket per
+# horizontal pixel and only the minimum and maximum of every bucket is kept,
+# so the plotted envelope (including single-sample spikes) is unchanged while
+# matplotlib only receives a few thousand points.
+
+# Large CSV files are converted once to a .npy file and then read through a
+# memory map, a fixed number of samples (rounded down to whole buckets) at a
+# time, so memory use does not grow with the length of the recording.
+#############################################################################
+
+import os
+import itertools
+import numpy as np
+
+
+def csv_to_npy(csv_file, npy_file, skiprows=1, chunk_rows=1000000):
+
+    # Convert a numeric CSV file to a .npy file without loading it all at once.
+    # Rows are counted first so the output can be allocated as a memory map,
+    # then the CSV is parsed and written chunk_rows lines at a time. Blank
+    # lines and rows with missing columns (a partial last line left by an
+    # interrupted collector) are skipped in both passes.
+
+    with open(csv_file) as file:
+        lines = itertools.islice(file, skiprows, None)
+        n_cols = None
+        n_rows = 0
+        for line in lines:
+            if n_cols is None and line.strip():
+                n_cols = line.count(',') + 1    # first data row sets the width
+            if _complete(line, n_cols):
+                n_rows += 1
+
+    out = np.lib.format.open_memmap(npy_file, mode='w+', dtype=float, shape=(n_rows, n_cols or 0))
+    with open(csv_file) as file:
+        lines = (line for line in itertools.islice(file, skiprows, None) if _complete(line, n_cols))
+        row = 0
+        while row < n_rows:
+            chunk = list(itertools.islice(lines, chunk_rows))
+            out[row:row+len(chunk)] = np.loadtxt(chunk, delimiter=",", dtype=float, ndmin=2)
+            row += len(chunk)
+    out.flush()
+    del out
+
+    return
+
+
+def _complete(line, n_cols):
+
+    # Whether a CSV line is a full data row of n_cols columns.
+
+    return n_cols is not None and line.count(',') == n_cols - 1 and bool(line.strip()) and not line.rstrip().endswith(',')
+
+
+def load_memmap(csv_file, skiprows=1):
+
+    # Return a read-only memory map of csv_file's data. The .npy copy is
+    # stored next to the CSV and rebuilt only when the CSV is newer.
+
+    npy_file = os.path.splitext(csv_file)[0] + '.npy'
+    if not os.path.exists(npy_file) or os.path.getmtime(npy_file) < os.path.getmtime(csv_file):
+        csv_to_npy(csv_file, npy_file, skiprows=skiprows)
+
+    return np.load(npy_file, mmap_mode='r')
+
+
+def minmax_buckets(times, values, n_buckets=2000, chunk_rows=2000000):
+
+    # Split a (N,) or (N,k) series into n_buckets consecutive buckets and
+    # return the time, minimum and maximum of each bucket. The bucket time
+    # is the midpoint of its first and last time stamp. times and values
+    # may be memory maps; they are read about chunk_rows samples at a time
+    # (whole buckets, at least one).
+
+    n_samples = len(values)
+    one_dim = np.ndim(values) == 1
+    size = max(1, -(-n_samples // n_buckets))    # samples per bucket (ceiling division)
+    n_full = n_samples // size    # number of completely filled buckets
+    chunk_buckets = max(1, chunk_rows // size)
+
+    bucket_t, mins, maxs = [], [], []
+    for start in range(0, n_full, chunk_buckets):
+        stop = min(start + chunk_buckets, n_full)
+        rows = slice(start*size, stop*size)
+        block = np.asarray(values[rows], dtype=float).reshape(stop - start, size, -1)
+        t = np.asarray(times[rows], dtype=float).reshape(stop - start, size)
+        bucket_t.append(0.5*(t[:, 0] + t[:, -1]))
+        mins.append(block.min(axis=1))
+        maxs.append(block.max(axis=1))
+
+    if n_full*size < n_samples:    # last, partially filled bucket
+        block = np.asarray(values[n_full*size:], dtype=float).reshape(1, n_samples - n_full*size, -1)
+        t = np.asarray(times[n_full*size:], dtype=float)
+        bucket_t.append(np.array([0.5*(t[0] + t[-1])]))
+        mins.append(block.min(axis=1))
+        maxs.append(block.max(axis=1))
+
+    bucket_t = np.concatenate(bucket_t)
+    mins = np.concatenate(mins)
+    maxs = np.concatenate(maxs)
+    if one_dim:
+        mins, maxs = mins[:, 0], maxs[:, 0]
+
+    return bucket_t, mins, maxs
+
+
+def minmax_decimate(times, values, n_buckets=2000):
+
+    # Reduce a (N,) or (N,k) series to at most 2*n_buckets points that can be
+    # passed straight to plt.plot. Each bucket contributes its minimum then
+    # its maximum at the bucket time, which draws the same envelope as the
+    # full series. Series that are already small are returned unchanged.
+
+    if len(values) <= 2*n_buckets:
+        return np.asarray(times), np.asarray(values)
+
+    bucket_t, mins, maxs = minmax_buckets(times, values, n_buckets)
+    out_t = np.repeat(bucket_t, 2)
+    out_v = np.empty((2*len(bucket_t),) + mins.shape[1:])
+    out_v[0::2] = mins
+    out_v[1::2] = maxs
+
+    return out_t, out_v
+
+
+def scatter_minmax(axs, times, values, color, s=1):
+
+    # Drop-in replacement for axs.scatter(times, values, s=1, color=c) on long
+    # series. One bucket is used per horizontal pixel of axs and each bucket
+    # is drawn as a vertical line from its minimum to its maximum, so dense
+    # regions fill in exactly like the full scatter plot.
+
+    n_buckets = max(1, int(axs.bbox.width))    # one bucket per pixel column
+    if len(values) <= 2*n_buckets:
+        return axs.scatter(times, values, s=s, color=color)
+
+    bucket_t, mins, maxs = minmax_buckets(times, values, n_buckets)
+    return axs.vlines(bucket_t, mins, maxs, color=color, linewidth=1)
@@ -0,0 +1,179 @@
+#############################################################################
+# Script Name: regenerate_plots.py
+
+# Re-create the repo's plots from the checked-in data, in parallel.
+
+# Each PNG is one plot job (see render.py). The jobs call the graph_data and
+# graph_hist helpers of the scripts that originally produced the plots and
+# run on a process pool with the Agg backend. Datasets that are not checked
+# in (the one hour and 15 hour recordings) are skipped when their CSV file
+# is missing.
+
+# Usage: python regenerate_plots.py [number of worker processes]
+#############################################################################
+
+import os,sys
+import render    # selects the Agg backend, so import it before pyplot
+import decimate
+import numpy as np
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))    # Preliminary-Tests
+ROOT = os.path.dirname(HERE)    # top of the repo
+
+
+
+def one_minute_hist(axis, c, FILENAME):
+
+    # Centered histogram (m/s/s) of one axis of the one minute recording.
+
+    script = render.load_script(os.path.join(HERE, 'One-Minute-Data', 'graph_histogram.py'))
+    read_data = np.loadtxt(os.path.join(HERE, 'One-Minute-Data', 'one_min_raw_data.csv'), skiprows = 2, delimiter=",", dtype=float)
+    accels = (read_data[:, axis+1] - np.mean(read_data[:, axis+1])) * 9.80665
+    label = 'XYZ'[axis]
+    binsize = [200, 300, 300][axis]
+    script.graph_hist(accels, c, "Acceleration Over One Minute %s-Axis (Standard Dev. = %.3f m/s/s)" % (label, np.std(accels)), FILENAME, binsize=binsize)
+
+    return FILENAME
+
+
+def one_hour_hist(csv_file, axis, c, FILENAME):
+
+    # Centered histogram (m/s/s) of one axis of the one hour recording.
+
+    script = render.load_script(os.path.join(HERE, 'One-Hour-Data', 'graph_histogram.py'))
+    read_data = np.loadtxt(csv_file, skiprows = 2, delimiter=",", dtype=float)
+    accels = (read_data[:, axis+1] - np.mean(read_data[:, axis+1])) * 9.797
+    label = 'XYZ'[axis]
+    binsize = [200, 300, 300][axis]
+    script.graph_hist(accels, c, "Acceleration Over One Hour %s-Axis (Standard Dev. = %.3f m/s/s)" % (label, np.std(accels)), FILENAME, binsize=binsize)
+
+    return FILENAME
+
+
+def one_minute_displacement(remove_bias, TITLE, FILENAME):
+
+    # Displacement over time of the one minute recording, integrated from
+    # the raw or the bias (mean) corrected acceleration.
+
+    script = render.load_script(os.path.join(HERE, 'One-Minute-Data', 'integrate.py'))
+    read_data = np.loadtxt(os.path.join(HERE, 'One-Minute-Data', 'one_min_raw_data.csv'), skiprows = 2, delimiter=",", dtype=float)
+    time_array = read_data[:, 0]
+    accels = read_data[:, 1:] * 9.797
+    accels[:, 2] -= 9.797
+    if remove_bias:
+        accels -= np.mean(accels, axis=0)
+
+    x_time, _, x_dis = script.integrate_data(time_array, accels[:, 0])
+    y_time, _, y_dis = script.integrate_data(time_array, accels[:, 1])
+    z_time, _, z_dis = script.integrate_data(time_array, accels[:, 2])
+    script.graph_data(x_time, y_time, z_time, x_dis, y_dis, z_dis, Y_AXIS="Displacement (m)", TITLE=TITLE, FILENAME=FILENAME)
+
+    return FILENAME
+
+
+def fifteen_hour_plots(csv_file, axis, c, plot_file, hist_file):
+
+    # Acceleration over time and histogram of one axis of the 15 hour recording.
+
+    script = render.load_script(os.path.join(HERE, '15-Hours-Data', 'graph_data_and_histogram.py'))
+    read_data = decimate.load_memmap(csv_file, skiprows = 1)
+    accels = read_data[:, axis+1]
+    label = 'XYZ'[axis]
+    script.graph_data(read_data[:, 0], accels, "Acceleration over 15 Hours (%s-axis)" % label.lower(), plot_file, c)
+    script.graph_hist(accels, c, "Acceleration Histogram %s-Axis: mean = %.4f, std = %.4f" % (label, np.mean(accels), np.std(accels)), hist_file)
+
+    return plot_file
+
+
+def start_up_plot(x, y, z, x_std, y_std, z_std, TITLE, FILENAME):
+
+    # Per-trial statistics of the start-up/shut-down test.
+
+    script = render.load_script(os.path.join(HERE, 'Start-Up-Shut-Down', 'process_data.py'))
+    script.graph_data(x, y, z, x_std, y_std, z_std, TITLE=TITLE, FILENAME=FILENAME)
+
+    return FILENAME
+
+
+def six_position_displacement(trial, FILENAME):
+
+    # Displacement of a six-position trial's test data after calibrating
+    # with that trial's misalignment model (Six-Position-Test/integrate.py).
+
+    script = render.load_script(os.path.join(ROOT, 'Six-Position-Test', 'integrate.py'))
+    trial_dir = os.path.join(ROOT, 'Six-Position-Test', 'data', 'trial_%d' % trial)
+    accel_data = np.loadtxt(os.path.join(trial_dir, 'six_position_test_data_%d.csv' % trial), skiprows = 2, delimiter=",", dtype=float)
+    param_data = np.loadtxt(os.path.join(trial_dir, 'optim_params_%d.csv' % trial), skiprows = 2, delimiter=",", dtype=float)
+    time_array = accel_data[:, 0]
+
+    bias_3 = np.array(param_data[2, 0:3])
+    scale_f_3 = (np.array([param_data[2, 3:6], param_data[2, 6:9], param_data[2, 9:]])).T
+    accel_calib_3 = script.misalignment_model(accel_data[:, 1:], bias_3, scale_f_3) * 9.797
+    accel_calib_3[:, 2] -= 9.797
+
+    dis_x, dis_y, dis_z = script.integrate_data(time_array, accel_calib_3)
+    script.graph_data(time_array, dis_x, dis_y, dis_z, Y_AXIS="Displacement (m)",
+                      TITLE="Displacement (m) - After Calibrating with Misalignment Model", FILENAME=FILENAME)
+
+    return FILENAME
+
+
+def plot_jobs():
+
+    # Build the list of plot jobs for every dataset that is present.
+
+    jobs = []
+    colors = ['r', 'b', 'g']
+
+    plots = os.path.join(HERE, 'One-Minute-Data', 'Plots')
+    for axis, c in enumerate(colors):
+        jobs.append((one_minute_hist, (axis, c, os.path.join(plots, '%s_hist_1_min_m_s_s.png' % 'xyz'[axis])), {}))
+    jobs.append((one_minute_displacement, (False, "Displacement (m) - Raw Accel Data", os.path.join(plots, 'one_min_raw_dis.png')), {}))
+    jobs.append((one_minute_displacement, (True, "Displacement (m) - Bias Corrected Accel Data", os.path.join(plots, 'one_min_no_bias_dis.png')), {}))
+
+    csv_file = os.path.join(HERE, 'One-Hour-Data', 'one_hour_raw_data.csv')
+    if os.path.exists(csv_file):
+        plots = os.path.join(HERE, 'One-Hour-Data', 'Centered Histogram Plots')
+        for axis, c in enumerate(colors):
+            jobs.append((one_hour_hist, (csv_file, axis, c, os.path.join(plots, '%s_hist_1_hrs_m_s_s.png' % 'xyz'[axis])), {}))
+
+    csv_file = os.path.join(HERE, '15-Hours-Data', 'accel_over_time.csv')
+    if os.path.exists(csv_file):
+        plots = os.path.join(HERE, '15-Hours-Data', 'Plots')
+        for axis, c in enumerate(colors):
+            label = 'xyz'[axis]
+            jobs.append((fifteen_hour_plots, (csv_file, axis, c, os.path.join(plots, 'accel_%s.png' % label),
+                                              os.path.join(plots, 'accel_%s_histogram.png' % label)), {}))
+
+    # Start-up trials are loaded (and cached) once here; the jobs only draw
+    start_up = render.load_script(os.path.join(HERE, 'Start-Up-Shut-Down', 'process_data.py'))
+    data_dir = os.path.join(HERE, 'Start-Up-Shut-Down', 'Data')
+    trials = start_up.load_trials(start_up.find_trials(data_dir), cache_dir=os.path.join(data_dir, '.cache'))
+    means, std_devs, _ = start_up.trial_stats(trials)
+    plots = os.path.join(HERE, 'Start-Up-Shut-Down', 'Plots')
+    m_s_s = means * 9.797
+    jobs.append((start_up_plot, (*m_s_s.T, 0, 0, 0, "Mean (m/s/s) of Each One Minute Trial", os.path.join(plots, 'means_over_trials_m_s_s.png')), {}))
+    jobs.append((start_up_plot, (*means.T, 0, 0, 0, "Mean (g) of Each One Minute Trial", os.path.join(plots, 'means_over_trials.png')), {}))
+    jobs.append((start_up_plot, (*std_devs.T, 0, 0, 0, "Standard Deviations (g) of Each One Minute Trial", os.path.join(plots, 'std_over_trials.png')), {}))
+    jobs.append((start_up_plot, (*means.T, *np.std(means, axis=0), "Mean (g) of Each One Minute Trial with Uncertainty",
+                                 os.path.join(plots, 'means_over_trials_w_uncertainty.png')), {}))
+
+    for trial in (1, 2, 3):
+        trial_dir = os.path.join(ROOT, 'Six-Position-Test', 'data', 'trial_%d' % trial)
+        jobs.append((six_position_displacement, (trial, os.path.join(trial_dir, 'displacement_misalignment_%d.png' % trial)), {}))
+
+    return jobs
+
+
+
+
+
+if __name__ == '__main__':
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None    # default: one per core
+
+    jobs = plot_jobs()
+    print("Rendering", len(jobs), "plots")
+    for FILENAME in render.render_jobs(jobs, workers=workers):
+        print("\t", os.path.relpath(FILENAME, ROOT))
@@ -0,0 +1,73 @@
+#############################################################################
+# Script Name: render.py
+
+# Headless, parallel rendering of plot jobs.
+
+# Importing this module selects matplotlib's non-interactive Agg backend, so
+# it must be imported before anything imports matplotlib.pyplot. A plot job
+# is a tuple (function, args, kwargs) where function draws and saves one
+# figure (for example graph_hist or graph_data from the analysis scripts).
+# render_jobs() fans the jobs out to a process pool. Every figure a job
+# leaves open is closed when it finishes, so memory stays flat no matter
+# how many jobs each worker runs.
+#############################################################################
+
+import os,re,sys
+import importlib.util
+import matplotlib
+matplotlib.use('Agg')    # no display needed, and much faster than GUI backends
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+
+
+_scripts = {}    # scripts already loaded by load_script, by absolute path
+
+
+def load_script(path):
+
+    # Import one of the repo's analysis scripts by file path and return it
+    # as a module. Many scripts share a file name (e.g. graph_histogram.py),
+    # so each one is registered under a name derived from its full path.
+    # The script's __main__ block is not run.
+
+    path = os.path.abspath(path)
+    if path not in _scripts:
+        name = 'script_' + re.sub(r'\W', '_', path)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module    # lets job functions from the script be pickled
+        spec.loader.exec_module(module)
+        _scripts[path] = module
+
+    return _scripts[path]
+
+
+def run_job(job):
+
+    # Run one plot job in the current process and close any figures it
+    # left open. Returns the job's return value.
+
+    function, args, kwargs = job
+    try:
+        return function(*args, **kwargs)
+    finally:
+        plt.close('all')
+
+
+def _init_worker():
+
+    # Worker process start-up: make sure rendering is headless.
+
+    matplotlib.use('Agg')
+
+
+def render_jobs(jobs, workers=None):
+
+    # Render a list of plot jobs on a pool of worker processes and return
+    # their results in order. With workers=1 the jobs run in this process.
+
+    if workers == 1:
+        return [run_job(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        return list(pool.map(run_job, jobs))
@@ -16,7 +16,6 @@
 import time,sys
 sys.path.append('../')
 import numpy as np
-import matplotlib.pyplot as plt
 
 # Wait for IMU to connect
 t0 = time.time()    # start time
@@ -35,6 +34,7 @@ if not start_bool:
     exit()
 else:
     print("IMU Started")
+    mpu9250_i2c.set_profile('accel')    # read only the accelerometer, gyro in standby
     time.sleep(2)    # wait for MPU to load and settle
 
 
@@ -49,7 +49,7 @@ def accel_cal(
     start_time = time.time()    # initialize start time
     while (time.time() - start_time) < total_time:    # collect data for total_time seconds
 
-        x_accel, y_accel, z_accel ,_,_,_ = mpu9250_i2c.mpu6050_conv()    # retrieve acceleration measurement
+        x_accel, y_accel, z_accel = mpu9250_i2c.read_profile()    # retrieve acceleration measurement
         elapsed_time = time.time() - start_time     # record a time stamp
         
         # Save data and time stamp to CSV
@@ -73,7 +73,7 @@ def accel_mean_std(
 
     while (time.time() - start_time) < total_time:    # collect data for total_time seconds
 
-        x_accel, y_accel, z_accel ,_,_,_ = mpu9250_i2c.mpu6050_conv()    # retrieve acceleration measurements
+        x_accel, y_accel, z_accel = mpu9250_i2c.read_profile()    # retrieve acceleration measurements
         x_data.append(x_accel)    # append measurement to array
         y_data.append(y_accel)    # append measurement to array
         z_data.append(z_accel)    # append measurement to array
@@ -16,9 +16,9 @@
 
 import sys
 sys.path.append('../')
+sys.path.append('../Best-Calibration-Method')
 import numpy as np  
-import matplotlib.pyplot as plt 
-from scipy.integrate import cumtrapz    
+from scipy_compat import cumtrapz
 
 
 # Model 1
@@ -73,6 +73,8 @@ def graph_data(times, x, y, z, Y_AXIS, TITLE, FILENAME):
     
     # Graph x, y, and z data on one plot. Each axis gets its own time value, in case data was filtered
 
+    import matplotlib.pyplot as plt    # loaded on first use, not at import
+
     fig = plt.figure()
     axs = fig.add_subplot(1,1,1)
 
@@ -84,6 +86,7 @@ def graph_data(times, x, y, z, Y_AXIS, TITLE, FILENAME):
     axs.set_title(TITLE)
     axs.legend()
     fig.savefig(FILENAME)
+    plt.close(fig)    # release the figure's memory
 
     return
 
@@ -93,6 +96,8 @@ def graph_data(times, x, y, z, Y_AXIS, TITLE, FILENAME):
 
 if __name__ == '__main__':
 
+    import model_compare
+
     # Read acceleration data from CSV file
     file = open("data/trial_3/six_position_test_data_3.csv")    # containts raw acceleration data collected 179 Hz over one minute
     accel_data = np.loadtxt(file, skiprows = 2, delimiter=",", dtype=float) 
@@ -103,69 +108,18 @@ if __name__ == '__main__':
     param_data = open("data/trial_3/optim_params_3.csv")    # contains parameters for three acceleromter error models
     param_data = np.loadtxt(param_data, skiprows = 2, delimiter=",", dtype=float)
     
-    # Calibrate data using a pre-optimized error models
-    bias_1 = np.array(param_data[0, 0:3])    # extract optimized biases 
-    accel_calib_1 = bias_model(accels, bias_1)    # calibrate data using Model 1
-    
-    bias_2 = np.array(param_data[1, 0:3])    # extract optimzied biases 
-    scale_f_2 = np.array(param_data[1, 3:6])    # extract optimzied scale factors
-    accel_calib_2 = scale_factor_model(accels, bias_2, scale_f_2)    # calibrate data using Model 2
-
-    bias_3 = np.array(param_data[2, 0:3])    # extract optimized biases
-    scale_f_3 = (np.array([param_data[2, 3:6],    # extract optimized scale factors, including misalignments
-                           param_data[2, 6:9],
-                           param_data[2, 9:]])).T
-    accel_calib_3 = misalignment_model(accels, bias_3, scale_f_3)    # calibrat eusing Model 3
-    
+    # Compare the data with no model and with Models 1, 2 and 3 in one pass:
+    # each is calibrated, converted from units of g to m/s/s, has gravity
+    # removed from the z data (facing up) and is integrated over time.
+    # result['displacement'][k] is the displacement of variant k, in the order of names.
+    names, biases, matrices = model_compare.variants_from_params(param_data)
+    result = model_compare.compare_variants(time_array, accels, biases, matrices, full=True)
+    model_compare.print_comparison(names, result['means'], result['stds'], result['final_displacement'])
 
-    # Convert from units of g to m/s/s
-    accels = accels * 9.797
-    accel_calib_1 = accel_calib_1 * 9.797 
-    accel_calib_2 = accel_calib_2 * 9.797 
-    accel_calib_3 = accel_calib_3 * 9.797 
-
-    # Remove gravity from the z data (facing up)
-    accels[:,2] = accels[:,2] - 9.797 
-    accel_calib_1[:,2] = accel_calib_1[:,2] - 9.797 
-    accel_calib_2[:,2] = accel_calib_2[:,2] - 9.797 
-    accel_calib_3[:,2] = accel_calib_3[:,2] - 9.797 
-
-    
-    # Statistical analysis
-    print("Statistical Analysis")
-    print(f"Uncalibrated Data (mean, std): x({np.mean(accels[:,0]):.4f}, {np.std(accels[:,0]):.4f}),",
-                                         f"y({np.mean(accels[:,1]):.4f}, {np.std(accels[:,1]):.4f}),",
-                                         f"z({np.mean(accels[:,2]):.4f}, {np.std(accels[:,2]):.4f})")
-    print(f"Bias Calibrated   (mean, std): x({np.mean(accel_calib_1[:,0]):.4f}, {np.std(accel_calib_1[:,0]):.4f}),",
-                                         f"y({np.mean(accel_calib_1[:,1]):.4f}, {np.std(accel_calib_1[:,1]):.4f}),",
-                                         f"z({np.mean(accel_calib_1[:,2]):.4f}, {np.std(accel_calib_1[:,2]):.4f})")
-    print(f"Add Scale Factors (mean, std): x({np.mean(accel_calib_2[:,0]):.4f}, {np.std(accel_calib_2[:,0]):.4f}),",
-                                         f"y({np.mean(accel_calib_2[:,1]):.4f}, {np.std(accel_calib_2[:,1]):.4f}),",
-                                         f"z({np.mean(accel_calib_2[:,2]):.4f}, {np.std(accel_calib_2[:,2]):.4f})")
-    print(f"Calibrated Data 3 (mean, std): x({np.mean(accel_calib_3[:,0]):.4f}, {np.std(accel_calib_3[:,0]):.4f}),",
-                                         f"y({np.mean(accel_calib_3[:,1]):.4f}, {np.std(accel_calib_3[:,1]):.4f}),",
-                                         f"z({np.mean(accel_calib_3[:,2]):.4f}, {np.std(accel_calib_3[:,2]):.4f})")
-    
-    
-    # Integrate raw and calibrated data over time
-    uncal_dis_x, uncal_dis_y, uncal_dis_z = integrate_data(time_array, accels)
-    cal_dis_x_1, cal_dis_y_1, cal_dis_z_1 = integrate_data(time_array, accel_calib_1)
-    cal_dis_x_2, cal_dis_y_2, cal_dis_z_2 = integrate_data(time_array, accel_calib_2)
-    cal_dis_x_3, cal_dis_y_3, cal_dis_z_3 = integrate_data(time_array, accel_calib_3)
-    print(f"Uncalibrated Data: {uncal_dis_x[-1]:0.0f}, {uncal_dis_y[-1]:0.0f}, {uncal_dis_z[-1]:0.0f}")
-    print(f"Bias Calibrated:   {cal_dis_x_1[-1]:0.0f}, {cal_dis_y_1[-1]:0.0f}, {cal_dis_z_1[-1]:0.0f}")
-    print(f"Add Scale Factors: {cal_dis_x_2[-1]:0.0f}, {cal_dis_y_2[-1]:0.0f}, {cal_dis_z_2[-1]:0.0f}")
-    print(f"Add Misalignments: {cal_dis_x_3[-1]:0.0f}, {cal_dis_y_3[-1]:0.0f}, {cal_dis_z_3[-1]:0.0f}")
-
-    
-    
 
     # Graph the displacement over time of each axis after calibrating with misalignments (model 3)
     y_axis_label = "Displacement (m)"
     title = "Displacement (m) - After Calibrating with Misalignment Model"
     image_file_name = "displacement_misalignment.png"
-    graph_data(time_array, cal_dis_x_3, cal_dis_y_3, cal_dis_z_3, Y_AXIS=y_axis_label, TITLE=title, FILENAME=image_file_name)
-    
-    
-
-    
\ No newline at end of file
+    cal_dis_3 = result['displacement'][names.index('Add Misalignments')]
+    graph_data(time_array, cal_dis_3[:,0], cal_dis_3[:,1], cal_dis_3[:,2], Y_AXIS=y_axis_label, TITLE=title, FILENAME=image_file_name)
@@ -22,8 +22,6 @@
 import sys
 sys.path.append('../')
 import numpy as np   
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
 
 
 def bias_model(true_accel, bias):
@@ -46,6 +44,8 @@ def misalignment_model(true_accel, bias, s1, s2, s3):
 
 if __name__ == '__main__':
 
+    from scipy.optimize import curve_fit    # loaded when fitting, not at import
+
     # Read data from CSV file
     file = open("data/trial_1/six_position_data_1.csv") 
     read_data = np.loadtxt(file, skiprows = 1, delimiter=",", dtype=float) 
@@ -138,6 +138,8 @@ if __name__ == '__main__':
     # Graph x, y, and z data with trend fit.
     ########################################
 
+    import matplotlib.pyplot as plt    # loaded on first use, not at import
+
     fig = plt.figure()
     axs = fig.add_subplot(1,1,1)
 
@@ -0,0 +1,162 @@
+##################################################################
+# Script Name: run_trials.py
+
+# Fits and evaluates every six-position trial in parallel.
+
+# Every directory under data/ that holds a six-position CSV file
+# (six_position_data*.csv) is a trial. For each trial, on its own
+# worker process:
+#     1. Fit accelerometer models 1-3 to the six-position data
+#     2. Calibrate each of the trial's test recordings
+#        (six_position_*test_data*.csv, except the *_calibrated.csv
+#        outputs of two_levels_calib.py) with no model and models 1-3
+#     3. Integrate them for the final displacement
+# The results of all trials are collected into one table (printed, and
+# saved to trial_results.csv) with the model 3 parameters, their percent
+# uncertainties, and the mean acceleration and final displacement of
+# every model. Parsed recordings are kept in a shared stage cache
+# (Best-Calibration-Method/stage_cache.py), so later runs skip the CSV
+# parsing.
+
+# Usage:
+#     python run_trials.py                       # all trials in data/
+#     python run_trials.py DIR --workers 4 --output results.csv
+###################################################################
+
+
+import os,sys,glob,argparse
+from concurrent.futures import ProcessPoolExecutor
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..', 'Best-Calibration-Method'))
+import numpy as np
+import calib_pipeline
+import model_compare
+from stage_cache import StageCache
+
+
+PARAM_NAMES = ['b_x', 'b_y', 'b_z', 'Sxx', 'Sxy', 'Sxz', 'Syx', 'Syy', 'Syz', 'Szx', 'Szy', 'Szz']
+MODELS = ['raw', 'model_1', 'model_2', 'model_3']
+
+
+def find_trials(data_dir):
+
+    # Trial directories under data_dir, in name order.
+
+    return sorted(os.path.dirname(path) for path in glob.glob(os.path.join(data_dir, '*', 'six_position_data*.csv')))
+
+
+def find_recordings(trial_dir):
+
+    # Test recordings of a trial, in name order. Calibrated copies
+    # (*_calibrated.csv) match the pattern too but are outputs, not
+    # recordings.
+
+    return sorted(path for path in glob.glob(os.path.join(trial_dir, 'six_position_*test_data*.csv'))
+                  if not path.endswith('_calibrated.csv'))
+
+
+def cached_recording(csv_file, cache):
+
+    # Time stamps and accelerations of a recording, through the cache
+    # (the same entries as calib_pipeline's load stage).
+
+    if cache is None:
+        return calib_pipeline.load_recording(csv_file)
+    _, arrays = cache.cached('load', lambda: dict(zip(('times', 'accels'), calib_pipeline.load_recording(csv_file))),
+                             inputs=[csv_file], params={'seconds': None})
+
+    return arrays['times'], arrays['accels']
+
+
+def run_trial(trial_dir, cache_dir=None):
+
+    # Fit and evaluate one trial. Returns one result row (a dict) per test
+    # recording.
+
+    cache = StageCache(cache_dir) if cache_dir else None
+    six_position_csv = sorted(glob.glob(os.path.join(trial_dir, 'six_position_data*.csv')))[0]
+    read_data = calib_pipeline.load_six_position(six_position_csv)
+    params, covariance = calib_pipeline.fit_accel_models(read_data)
+
+    # Percent uncertainty of the model 3 parameters, in the order of PARAM_NAMES
+    sigma = np.sqrt(np.diagonal(covariance, axis1=1, axis2=2))    # (axis, [bias, three scale factors])
+    uncertainty = np.concatenate((sigma[:, 0], sigma[:, 1:].ravel())) / params[2] * 100
+
+    names, biases, matrices = model_compare.variants_from_params(params)
+    rows = []
+    for test_csv in find_recordings(trial_dir):
+        times, accels = cached_recording(test_csv, cache)
+        result = model_compare.compare_variants(times, accels, biases, matrices)
+
+        row = {'trial': os.path.basename(trial_dir), 'recording': os.path.basename(test_csv),
+               'samples': len(times), 'seconds': times[-1] - times[0]}
+        row.update(zip(PARAM_NAMES, params[2]))
+        row.update(('u_' + name + ' (%)', value) for name, value in zip(PARAM_NAMES, uncertainty))
+        for model, mean, final in zip(MODELS, result['means'], result['final_displacement']):
+            row.update((f'{model}_mean_{axis}', value) for axis, value in zip('xyz', mean))
+            row.update((f'{model}_disp_{axis}', value) for axis, value in zip('xyz', final))
+        rows.append(row)
+
+    return rows
+
+
+def run_trials(trial_dirs, workers=None, cache_dir=None):
+
+    # Run every trial on a pool of worker processes (in this process with
+    # workers=1). Returns all result rows, in trial order.
+
+    if workers == 1:
+        results = [run_trial(trial_dir, cache_dir) for trial_dir in trial_dirs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_trial, trial_dirs, [cache_dir]*len(trial_dirs)))
+
+    return [row for rows in results for row in rows]
+
+
+def save_results(rows, FILENAME):
+
+    # Save the result rows as a CSV file with one column per field.
+
+    columns = list(rows[0])
+    file = open(FILENAME, 'w')
+    file.write(','.join(columns) + '\n')
+    for row in rows:
+        file.write(','.join(str(row[column]) for column in columns) + '\n')
+    file.close()
+
+    return
+
+
+def print_results(rows):
+
+    # Short table: model 3 bias, largest scale factor uncertainty, and the
+    # final displacement without calibration and with model 3.
+
+    print(f"{'trial':<12} {'recording':<34} {'model 3 bias (g)':>26} {'max u S (%)':>12} {'raw disp (m)':>20} {'model 3 disp (m)':>20}")
+    for row in rows:
+        bias = ' '.join(f"{row[name]:8.4f}" for name in ('b_x', 'b_y', 'b_z'))
+        max_u = max(abs(row['u_' + name + ' (%)']) for name in ('Sxx', 'Syy', 'Szz'))    # percent of a near-zero bias or cross term means little
+        raw = ' '.join(f"{row['raw_disp_' + axis]:6.0f}" for axis in 'xyz')
+        cal = ' '.join(f"{row['model_3_disp_' + axis]:6.0f}" for axis in 'xyz')
+        print(f"{row['trial']:<12} {row['recording']:<34} {bias:>26} {max_u:12.4f} {raw:>20} {cal:>20}")
+
+    return
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Fit and evaluate every six-position trial in parallel.")
+    parser.add_argument('data_dir', nargs='?', default=os.path.join(HERE, 'data'), help="directory holding the trial directories")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--output', default='trial_results.csv', help="CSV file for the full table")
+    parser.add_argument('--cache', default=os.path.join(HERE, 'data', '.cache'), help="stage cache directory ('' to disable)")
+    args = parser.parse_args()
+
+    trial_dirs = find_trials(args.data_dir)
+    print("Running", len(trial_dirs), "trials")
+    rows = run_trials(trial_dirs, workers=args.workers, cache_dir=args.cache or None)
+    print_results(rows)
+    save_results(rows, args.output)
+    print("Saved", args.output)